@@ -0,0 +1,26 @@
+"""In-process benchmarks. Run one with ``python -m benchmarks.<name> --help``."""
+import os
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'meet_clone.settings')
+    import django
+    django.setup()
+
+
+def percentiles(samples):
+    """p50/p95/p99/max of a list of latencies, in milliseconds."""
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+
+    def pick(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 3)
+
+    return {
+        'count': len(ordered),
+        'p50_ms': pick(0.50),
+        'p95_ms': pick(0.95),
+        'p99_ms': pick(0.99),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
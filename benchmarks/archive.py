@@ -0,0 +1,157 @@
+"""Ingest rate, history paging and search latency of the chat archive.
+
+Builds a throwaway SQLite database (migrated, with the production
+pragmas), fills it through ChatArchive.flush() in batches the size of
+CHAT_ARCHIVE_BATCH_SIZE, then times history pages at random depths and
+searches for words of varying frequency in random rooms.
+
+    python -m benchmarks.archive --messages 1000000 --rooms 2000
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+import uuid
+
+from . import percentiles, setup_django
+
+# Zipf-ish vocabulary: a few words in most messages, most words rare
+VOCABULARY = [f'w{i}' for i in range(5000)]
+CUMULATIVE_WEIGHTS = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(VOCABULARY))))
+
+
+def messages(count, rooms, rng):
+    seqs = [0] * rooms
+    for _ in range(count):
+        room = rng.randrange(rooms)
+        seqs[room] += 1
+        yield f'R{room:05d}', {
+            'id': str(uuid.uuid4()),
+            'seq': seqs[room],
+            'user_id': f'u{rng.randrange(10)}',
+            'user_name': 'Bench',
+            'message': ' '.join(rng.choices(VOCABULARY, cum_weights=CUMULATIVE_WEIGHTS, k=rng.randint(3, 15))),
+            'timestamp': '12:00:00',
+            'is_system': False,
+        }
+
+
+def ingest(args, rng):
+    from video_app.archive import ChatArchive
+
+    archive = ChatArchive()
+    generated = list(messages(args.messages, args.rooms, rng))
+    batches = []
+    for start in range(0, len(generated), args.batch_size):
+        for room_id, message in generated[start:start + args.batch_size]:
+            archive._pending.append((room_id, 0, message))
+        started = time.perf_counter()
+        archive.flush()
+        batches.append(time.perf_counter() - started)
+    elapsed = sum(batches)
+    return {
+        'messages': args.messages,
+        'batch_size': args.batch_size,
+        'elapsed_s': round(elapsed, 3),
+        'messages_per_s': round(args.messages / elapsed),
+        'batch_commit': percentiles(batches),
+    }
+
+
+def time_queries(args, rng):
+    from django.db.models import Max
+    from video_app import archive
+
+    last_seqs = dict(
+        archive.ArchivedMessage.objects.values('room_id').annotate(last=Max('seq')).values_list('room_id', 'last')
+    )
+    room_ids = list(last_seqs)
+
+    def timed(function):
+        samples = []
+        for _ in range(args.queries):
+            started = time.perf_counter()
+            function()
+            samples.append(time.perf_counter() - started)
+        return percentiles(samples)
+
+    def latest_page():
+        archive.history(rng.choice(room_ids), 0, None, 50)
+
+    def deep_page():
+        room_id = rng.choice(room_ids)
+        archive.history(room_id, 0, rng.randint(1, last_seqs[room_id]), 50)
+
+    def search(words):
+        return lambda: archive.search(rng.choice(room_ids), 0, rng.choice(words), None, 20)
+
+    return {
+        'history_latest_page': timed(latest_page),
+        'history_random_page': timed(deep_page),
+        'search_common_word': timed(search(VOCABULARY[:10])),
+        'search_rare_word': timed(search(VOCABULARY[-1000:])),
+        'search_prefix': timed(search([f'w{i}' for i in range(1, 100)])),
+        'search_two_words': timed(search([f'w{i} w{i + 1}' for i in range(0, 200, 2)])),
+    }
+
+
+def run(args):
+    from django.db import connection
+    from django.test.utils import override_settings, setup_databases, teardown_databases
+
+    rng = random.Random(args.seed)
+    directory = tempfile.mkdtemp(prefix='bench-archive-')
+    connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'archive.sqlite3')
+    databases = setup_databases(verbosity=0, interactive=False)
+    # As deployed; the throwaway database can be switched to WAL
+    wal = override_settings(SQLITE_WAL=True)
+    wal.enable()
+    try:
+        # setup_databases connected before the pragmas' receiver could matter
+        connection.close()
+        ingested = ingest(args, rng)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+        queries = time_queries(args, rng)
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+    finally:
+        wal.disable()
+        teardown_databases(databases, verbosity=0)
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+    return {
+        'benchmark': 'archive',
+        'rooms': args.rooms,
+        'journal_mode': journal_mode,
+        'database_bytes': size,
+        'ingest': ingested,
+        'queries': queries,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--rooms', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=1000, help='messages per flush')
+    parser.add_argument('--queries', type=int, default=500, help='samples per query kind')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    report = json.dumps(run(args), indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(report + '\n')
+
+
+if __name__ == '__main__':
+    main()
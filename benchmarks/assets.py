@@ -0,0 +1,172 @@
+"""Byte sizes and load times of the room page and its static assets.
+
+Runs collectstatic into a temporary STATIC_ROOT, then for each asset the
+room page links reports its raw, gzip and brotli sizes and fetches it
+through the ASGI app the way a browser would (Accept-Encoding: br, gzip),
+recording the served encoding, cache headers and response time. Estimated
+load times for a few network profiles assume the assets are fetched in
+parallel after the HTML; repeat visits only fetch the HTML, since the
+fingerprinted assets are cached as immutable.
+
+    python -m benchmarks.assets --output bench-assets.json
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from . import percentiles, setup_django
+
+ROOM_ASSETS = ('css/room.css', 'js/room.js')
+
+# (downlink bits per second, round-trip seconds)
+NETWORK_PROFILES = {
+    'slow_3g': (400_000, 0.4),
+    'fast_3g': (1_600_000, 0.15),
+    '4g': (9_000_000, 0.06),
+}
+
+
+def file_size(path):
+    return os.path.getsize(path) if os.path.exists(path) else None
+
+
+def render_room_page():
+    from django.template.loader import render_to_string
+
+    participants = [
+        {'user_id': f'u{i}', 'name': f'Participant {i}', 'is_admin': i == 0,
+         'audio_enabled': True, 'video_enabled': True}
+        for i in range(8)
+    ]
+    chat_messages = [
+        {'user_id': f'u{i % 8}', 'user_name': f'Participant {i % 8}', 'message': f'Message {i}',
+         'timestamp': '10:00:00', 'is_system': False}
+        for i in range(50)
+    ]
+    return render_to_string('room.html', {
+        'room_id': 'ABC123', 'room_name': 'Standup', 'room_creator_id': 'u0', 'user_name': 'Participant 0',
+        'user_id': 'u0', 'is_admin': True, 'participants': participants, 'chat_messages': chat_messages,
+    }).encode()
+
+
+async def get(app, path):
+    # channels' HttpCommunicator expects a body in every message, which
+    # streamed file responses do not send on the last one
+    scope = {
+        'type': 'http', 'http_version': '1.1', 'method': 'GET', 'scheme': 'http', 'path': path,
+        'raw_path': path.encode(), 'query_string': b'', 'root_path': '', 'server': ('localhost', 80),
+        'headers': [(b'host', b'localhost'), (b'accept-encoding', b'br, gzip')],
+    }
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    start = sent[0]
+    return {
+        'status': start['status'],
+        'headers': {name.decode().lower(): value.decode() for name, value in start['headers']},
+        'body': b''.join(message.get('body', b'') for message in sent[1:]),
+    }
+
+
+async def fetch(app, url, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = await get(app, url)
+        samples.append(time.perf_counter() - started)
+    return {
+        'status': response['status'],
+        'content_encoding': response['headers'].get('content-encoding', 'identity'),
+        'cache_control': response['headers'].get('cache-control'),
+        'transferred_bytes': len(response['body']),
+        'latency': percentiles(samples),
+    }
+
+
+def load_time_ms(html_bytes, asset_bytes, bandwidth, rtt):
+    def transfer(size):
+        return rtt + size * 8 / bandwidth
+
+    assets = max((transfer(size) for size in asset_bytes), default=0)
+    return round((transfer(html_bytes) + assets) * 1000, 1)
+
+
+def run(repeat):
+    from django.contrib.staticfiles.storage import staticfiles_storage
+    from django.core.management import call_command
+    from django.test.utils import override_settings
+
+    static_root = tempfile.mkdtemp(prefix='bench-static-')
+    try:
+        with override_settings(
+            STATIC_ROOT=static_root, DEBUG=False, ROOM_PERSISTENCE_ENABLED=False, ROOM_CHECKPOINT_ENABLED=False,
+        ):
+            started = time.perf_counter()
+            call_command('collectstatic', interactive=False, verbosity=0)
+            collect_elapsed = time.perf_counter() - started
+
+            # Built after collectstatic so the middleware sees the files
+            from django.core.asgi import get_asgi_application
+            app = get_asgi_application()
+
+            assets = {}
+            for name in ROOM_ASSETS:
+                hashed = staticfiles_storage.stored_name(name)
+                path = os.path.join(static_root, hashed)
+                assets[name] = {
+                    'url': staticfiles_storage.url(name),
+                    'raw_bytes': file_size(path),
+                    'gzip_bytes': file_size(path + '.gz'),
+                    'brotli_bytes': file_size(path + '.br'),
+                    'served': asyncio.run(fetch(app, staticfiles_storage.url(name), repeat)),
+                }
+            html = render_room_page()
+    finally:
+        shutil.rmtree(static_root, ignore_errors=True)
+
+    html_gzip = len(gzip.compress(html))
+    asset_bytes = [asset['served']['transferred_bytes'] for asset in assets.values()]
+    return {
+        'benchmark': 'assets',
+        'collectstatic_s': round(collect_elapsed, 3),
+        'room_page': {'html_bytes': len(html), 'html_gzip_bytes': html_gzip},
+        'assets': assets,
+        'first_visit_bytes': html_gzip + sum(asset_bytes),
+        'repeat_visit_bytes': html_gzip,
+        'load_time_ms': {
+            profile: {
+                'first_visit': load_time_ms(html_gzip, asset_bytes, bandwidth, rtt),
+                'repeat_visit': load_time_ms(html_gzip, [], bandwidth, rtt),
+            }
+            for profile, (bandwidth, rtt) in NETWORK_PROFILES.items()
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=50, help='fetches per asset for the latency figures')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    report = json.dumps(run(args.repeat), indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(report + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""Cost of room state checkpoints and restore time versus room count.
+
+For each room count the in-memory backend is filled directly (--participants
+per room, --history chat messages each) and then timed:
+
+* ``full_write``: the first checkpoint, every room encoded;
+* ``incremental_write``: after chat in a --dirty fraction of the rooms;
+* ``unchanged_write``: nothing changed, the file is only touched;
+* ``restore``: loading the checkpoint into an empty backend, as on restart;
+* ``chat_during_write``: latency of chat messages sent from another thread
+  while a full checkpoint is written, against ``chat_idle``.
+
+    python -m benchmarks.checkpoint --rooms 100 1000 10000 --participants 6 --history 50
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from . import percentiles, setup_django
+
+
+def fill(backend, rooms, participants, history):
+    room_ids = []
+    for index in range(rooms):
+        room_id = f'R{index:07d}'
+        backend.create_room(room_id, f'Bench {index}', f'host{index}', f'Host {index}')
+        for guest in range(participants - 1):
+            backend.join(room_id, f'guest{index}-{guest}', f'Guest {guest}')
+        for i in range(history):
+            backend.add_message(room_id, f'host{index}', f'Host {index}', f'history message {i}')
+        room_ids.append(room_id)
+    return room_ids
+
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return round(statistics.median(samples) * 1000, 3)
+
+
+def chat_latency(backend, room_ids, stop):
+    samples = []
+    index = 0
+    while not stop.is_set():
+        room_id = room_ids[index % len(room_ids)]
+        started = time.perf_counter()
+        backend.add_message(room_id, 'bench', 'Bench', 'during checkpoint')
+        samples.append(time.perf_counter() - started)
+        index += 1
+        time.sleep(0.0005)
+    return samples
+
+
+def measure(rooms, args, directory):
+    from video_app.backends.memory import InMemoryRoomState
+    from video_app.checkpoint import Checkpointer
+
+    backend = InMemoryRoomState()
+    room_ids = fill(backend, rooms, args.participants, args.history)
+    checkpointer = Checkpointer()
+
+    def full_write():
+        checkpointer.clear()
+        checkpointer.write(backend)
+
+    full = timed(full_write, args.repeat)
+    size = os.path.getsize(checkpointer.path())
+
+    dirty = room_ids[:max(1, int(rooms * args.dirty))]
+
+    def incremental_write():
+        for room_id in dirty:
+            backend.add_message(room_id, 'bench', 'Bench', 'new message')
+        checkpointer.write(backend)
+
+    incremental = timed(incremental_write, args.repeat)
+    unchanged = timed(lambda: checkpointer.write(backend), args.repeat)
+    restored = timed(lambda: checkpointer.restore(InMemoryRoomState()), args.repeat)
+
+    # Chat keeps flowing while a full checkpoint is written
+    results = {}
+    for phase, work in (('chat_idle', lambda: time.sleep(full / 1000)), ('chat_during_write', full_write)):
+        stop = threading.Event()
+        thread = threading.Thread(target=lambda: results.__setitem__(phase, chat_latency(backend, room_ids, stop)))
+        thread.start()
+        time.sleep(0.01)
+        work()
+        stop.set()
+        thread.join()
+
+    return {
+        'rooms': rooms,
+        'bytes': size,
+        'bytes_per_room': round(size / rooms),
+        'full_write_ms': full,
+        'incremental_write_ms': incremental,
+        'dirty_rooms': len(dirty),
+        'unchanged_write_ms': unchanged,
+        'restore_ms': restored,
+        'restore_us_per_room': round(restored * 1000 / rooms, 2),
+        'chat_idle': percentiles(results['chat_idle']),
+        'chat_during_write': percentiles(results['chat_during_write']),
+    }
+
+
+def run(args):
+    from django.test.utils import override_settings
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Keep the benchmark off the database and out of the project's checkpoint
+        with override_settings(
+            ROOM_PERSISTENCE_ENABLED=False, CHAT_ARCHIVE_ENABLED=False,
+            ROOM_CHECKPOINT_PATH=os.path.join(directory, 'rooms.checkpoint'),
+        ):
+            runs = [measure(rooms, args, directory) for rooms in args.rooms]
+    return {
+        'benchmark': 'checkpoint',
+        'participants_per_room': args.participants,
+        'history': args.history,
+        'dirty_fraction': args.dirty,
+        'repeat': args.repeat,
+        'runs': runs,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rooms', type=int, nargs='+', default=[100, 1000, 10000], help='room counts to compare')
+    parser.add_argument('--participants', type=int, default=6, help='per room, including the host')
+    parser.add_argument('--history', type=int, default=50, help='chat messages per room')
+    parser.add_argument('--dirty', type=float, default=0.01, help='fraction of rooms changed between checkpoints')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per measurement; the median is reported')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    report = json.dumps(run(args), indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(report + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Cost of the admin room directory versus room count.
+
+For each room count the in-memory backend and the room directory are
+filled directly (--participants per room, a --active fraction of rooms
+still active) and then timed:
+
+* ``update``: one join, leave or chat activity, as the signal receivers
+  apply them to the indexes;
+* ``first_page`` and ``deep_page``: a --limit page by activity and by
+  participant count, from the start and 100 pages in through cursors;
+* ``search``: a room name prefix;
+* ``scan``: the same first page without the directory, by going through
+  every room in the backend and sorting the active ones.
+
+    python -m benchmarks.directory --rooms 1000 10000 100000
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from . import percentiles, setup_django
+
+
+def fill(backend, directory, rooms, participants, active):
+    room_ids = []
+    for index in range(rooms):
+        room_id = f'R{index:07d}'
+        backend.create_room(room_id, f'Bench {index}', f'host{index}', f'Host {index}')
+        members = [f'host{index}']
+        for guest in range(random.randint(0, participants - 1)):
+            backend.join(room_id, f'guest{index}-{guest}', f'Guest {guest}')
+            members.append(f'guest{index}-{guest}')
+        if random.random() < active:
+            directory.add(room_id, f'Bench {index}', f'Host {index}', members, now=time.time() - random.random() * 3600)
+            room_ids.append(room_id)
+        else:
+            backend.deactivate_room(room_id)
+    return room_ids
+
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return round(statistics.median(samples) * 1000, 3)
+
+
+def scan(backend, limit):
+    # What listing cost without the directory: every room ever created
+    active = []
+    for room_id in list(backend.rooms):
+        room = backend.get_room(room_id)
+        if room['is_active']:
+            active.append((-len(backend.list_participants(room_id)), room_id))
+    return sorted(active)[:limit]
+
+
+def deep_page(directory, order, limit, pages):
+    cursor = None
+    for _ in range(pages):
+        _, cursor = directory.page(order, limit, cursor)
+    return directory.page(order, limit, cursor)
+
+
+def measure(rooms, args):
+    from video_app.backends.memory import InMemoryRoomState
+    from video_app.directory import RoomDirectory
+
+    backend, directory = InMemoryRoomState(), RoomDirectory()
+    room_ids = fill(backend, directory, rooms, args.participants, args.active)
+
+    updates = []
+    for index in range(args.updates):
+        room_id = random.choice(room_ids)
+        started = time.perf_counter()
+        if index % 3 == 0:
+            directory.joined(room_id, f'bench{index}')
+        elif index % 3 == 1:
+            directory.left(room_id, f'bench{index - 1}')
+        else:
+            directory.touch(room_id)
+        updates.append(time.perf_counter() - started)
+
+    prefix = f'bench {random.randrange(rooms)}'[:8]
+    return {
+        'rooms': rooms,
+        'active_rooms': len(directory),
+        'update': percentiles(updates),
+        'first_page_ms': {
+            order: timed(lambda: directory.page(order, args.limit), args.repeat) for order in directory.ORDERS
+        },
+        'deep_page_ms': {
+            order: round(timed(lambda: deep_page(directory, order, args.limit, 100), args.repeat) / 101, 3)
+            for order in directory.ORDERS
+        },
+        'search_ms': timed(lambda: directory.search(prefix, args.limit), args.repeat),
+        'scan_ms': timed(lambda: scan(backend, args.limit), args.repeat),
+    }
+
+
+def run(args):
+    random.seed(args.seed)
+    return {
+        'benchmark': 'directory',
+        'participants_per_room': args.participants,
+        'active_fraction': args.active,
+        'limit': args.limit,
+        'repeat': args.repeat,
+        'runs': [measure(rooms, args) for rooms in args.rooms],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rooms', type=int, nargs='+', default=[1000, 10000, 100000], help='room counts to compare')
+    parser.add_argument('--participants', type=int, default=8, help='at most, per room')
+    parser.add_argument('--active', type=float, default=0.5, help='fraction of rooms still active')
+    parser.add_argument('--limit', type=int, default=50, help='rooms per page')
+    parser.add_argument('--updates', type=int, default=20000, help='joins, leaves and chat activity to time')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per measurement; the median is reported')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    report = json.dumps(run(args), indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(report + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+"""Request latency and throughput of the room endpoints under a simulated fleet.
+
+Drives the ASGI application in process (no sockets, no server): every
+room gets a host who creates it and guests who join, the host preloads
+chat history, and then every participant follows the polling cadence of
+the room page's fallback mode (participants every 5s, a chat long-poll
+held up to 25s, plus a chat message every --chat-interval seconds).
+--speedup compresses those intervals so a short run covers many cycles.
+With --flooders, each room also gets that many clients posting chat as
+fast as they are answered, to show the chat rate limits keeping the other
+endpoints' latency in check (their refusals are the 429 errors of
+send_message_flood).
+
+    python -m benchmarks.load --rooms 20 --participants 8 --history 100 --duration 20
+
+Prints per-endpoint request counts, throughput and p50/p95/p99 latency as
+JSON. With --fail-over-p95 the exit status is 1 when any endpoint except
+the long-poll (whose latency is mostly waiting) is slower than that.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import sys
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+from . import percentiles, setup_django
+
+# Cadence of the room page's polling fallback (templates/room.html)
+PARTICIPANT_POLL_INTERVAL = 5
+LONG_POLL_WAIT = 25
+
+# Endpoints left out of --fail-over-p95
+WAITING_ENDPOINTS = ('get_messages_wait',)
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = collections.defaultdict(list)
+        self.errors = collections.Counter()
+
+    def record(self, endpoint, seconds, status):
+        self.samples[endpoint].append(seconds)
+        if status >= 400:
+            self.errors[endpoint] += 1
+
+    def report(self, elapsed):
+        return {
+            endpoint: {
+                'requests': len(samples),
+                'errors': self.errors[endpoint],
+                'throughput_rps': round(len(samples) / elapsed, 1),
+                'latency': percentiles(samples),
+            }
+            for endpoint, samples in sorted(self.samples.items())
+        }
+
+
+class BenchClient:
+    """Cookie-keeping browser stand-in that calls the ASGI app directly."""
+
+    def __init__(self, app, recorder):
+        self.app = app
+        self.recorder = recorder
+        self.cookies = {}
+
+    async def request(self, endpoint, method, path, data=None, timeout=10):
+        from channels.testing import HttpCommunicator
+
+        headers = [(b'host', b'localhost')]
+        if self.cookies:
+            cookie = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+            headers.append((b'cookie', cookie.encode()))
+        body = b''
+        if method == 'POST':
+            body = urlencode(data or {}).encode()
+            headers.append((b'content-type', b'application/x-www-form-urlencoded'))
+            headers.append((b'x-csrftoken', self.cookies.get('csrftoken', '').encode()))
+
+        started = time.perf_counter()
+        response = await HttpCommunicator(self.app, method, path, body, headers).get_response(timeout)
+        if endpoint:
+            self.recorder.record(endpoint, time.perf_counter() - started, response['status'])
+
+        for name, value in response['headers']:
+            if name.lower() == b'set-cookie':
+                for morsel in SimpleCookie(value.decode()).values():
+                    self.cookies[morsel.key] = morsel.value
+        return response
+
+    async def enter(self, name):
+        await self.request(None, 'GET', '/')
+        await self.request(None, 'POST', '/', {'name': name, 'email': f'{name}@example.com'})
+
+    @staticmethod
+    def location(response):
+        return dict(response['headers']).get(b'Location', b'').decode()
+
+
+async def simulate_participant(client, room_id, args, deadline):
+    speedup = args.speedup
+    since = 0
+
+    async def poll_participants():
+        version = None
+        while time.monotonic() < deadline:
+            query = f'?version={version}' if version is not None else ''
+            response = await client.request('get_participants', 'GET', f'/api/room/{room_id}/participants/{query}')
+            if response['status'] == 200:
+                version = json.loads(response['body']).get('version', version)
+            await asyncio.sleep(PARTICIPANT_POLL_INTERVAL / speedup)
+
+    async def poll_messages():
+        nonlocal since
+        while True:
+            remaining = int(deadline - time.monotonic())
+            if remaining <= 0:
+                return
+            wait = min(LONG_POLL_WAIT, remaining)
+            response = await client.request(
+                'get_messages_wait', 'GET', f'/api/room/{room_id}/chat/messages/?since={since}&wait={wait}',
+                timeout=wait + 10,
+            )
+            if response['status'] == 200:
+                since = json.loads(response['body'])['last_seq']
+
+    async def chat():
+        count = 0
+        while True:
+            await asyncio.sleep(args.chat_interval / speedup)
+            if time.monotonic() >= deadline:
+                return
+            count += 1
+            await client.request('send_message', 'POST', f'/api/room/{room_id}/chat/send/', {'message': f'msg {count}'})
+
+    # Catch up on history like the page does on load
+    response = await client.request('get_messages', 'GET', f'/api/room/{room_id}/chat/messages/?since=0')
+    if response['status'] == 200:
+        since = json.loads(response['body'])['last_seq']
+    await asyncio.gather(poll_participants(), poll_messages(), chat())
+
+
+async def flood(client, room_id, deadline):
+    # Ignores Retry-After on purpose
+    count = 0
+    while time.monotonic() < deadline:
+        count += 1
+        await client.request('send_message_flood', 'POST', f'/api/room/{room_id}/chat/send/', {'message': f'spam {count}'})
+
+
+async def setup_room(app, recorder, index, args):
+    host = BenchClient(app, recorder)
+    await host.enter(f'host{index}')
+    response = await host.request('create_room', 'POST', '/create-room/', {'room_name': f'Bench {index}'})
+    room_id = host.location(response).strip('/').split('/')[-1]
+
+    guests = []
+    for guest_index in range(args.participants - 1):
+        guest = BenchClient(app, recorder)
+        await guest.enter(f'guest{index}-{guest_index}')
+        await guest.request('join_room', 'POST', '/join-room/', {'room_id': room_id})
+        guests.append(guest)
+
+    flooders = []
+    for flooder_index in range(args.flooders):
+        flooder = BenchClient(app, recorder)
+        await flooder.enter(f'flooder{index}-{flooder_index}')
+        await flooder.request('join_room', 'POST', '/join-room/', {'room_id': room_id})
+        flooders.append(flooder)
+
+    for i in range(args.history):
+        await host.request('send_message', 'POST', f'/api/room/{room_id}/chat/send/', {'message': f'history {i}'})
+    return room_id, [host] + guests, flooders
+
+
+async def run(args):
+    from django.test.utils import override_settings
+    from meet_clone.asgi import application
+    from video_app.admission import load_shedder
+    from video_app.fanout import fanout
+    from video_app.lifecycle import room_gauges
+
+    # Keep the benchmark off the database and the checkpoint, and seat everyone
+    override_settings(
+        ROOM_PERSISTENCE_ENABLED=False, CHAT_ARCHIVE_ENABLED=False, ROOM_CHECKPOINT_ENABLED=False,
+        ROOM_MAX_PARTICIPANTS=None,
+    ).enable()
+
+    recorder = Recorder()
+    started = time.perf_counter()
+    # Preloading history is not what the chat rate limits are for
+    with override_settings(CHAT_USER_RATE=None, CHAT_ROOM_RATE=None):
+        rooms = await asyncio.gather(*(setup_room(application, recorder, i, args) for i in range(args.rooms)))
+    setup_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    deadline = time.monotonic() + args.duration
+    await asyncio.gather(
+        *(
+            simulate_participant(client, room_id, args, deadline)
+            for room_id, clients, _ in rooms
+            for client in clients
+        ),
+        *(flood(flooder, room_id, deadline) for room_id, _, flooders in rooms for flooder in flooders),
+    )
+    elapsed = time.perf_counter() - started
+
+    return {
+        'benchmark': 'load',
+        'rooms': args.rooms,
+        'participants_per_room': args.participants,
+        'history': args.history,
+        'duration_s': args.duration,
+        'speedup': args.speedup,
+        'chat_interval_s': args.chat_interval,
+        'flooders_per_room': args.flooders,
+        'setup_s': round(setup_elapsed, 3),
+        'elapsed_s': round(elapsed, 3),
+        'endpoints': recorder.report(setup_elapsed + elapsed),
+        'gauges': room_gauges(),
+        'fanout': fanout.stats(),
+        'admission': load_shedder.stats(),
+    }
+
+
+def over_budget(result, budget_ms):
+    return sorted(
+        endpoint for endpoint, stats in result['endpoints'].items()
+        if endpoint not in WAITING_ENDPOINTS and stats['latency'].get('p95_ms', 0) > budget_ms
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rooms', type=int, default=10)
+    parser.add_argument('--participants', type=int, default=5, help='per room, including the host')
+    parser.add_argument('--history', type=int, default=50, help='chat messages preloaded per room')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of steady-state traffic')
+    parser.add_argument('--speedup', type=float, default=10, help='divides the client polling intervals')
+    parser.add_argument('--chat-interval', type=float, default=30, help='seconds between messages per participant')
+    parser.add_argument('--flooders', type=int, default=0, help='clients per room posting chat nonstop')
+    parser.add_argument('--fail-over-p95', type=float, metavar='MS', help='exit 1 if an endpoint p95 exceeds this')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    result = asyncio.run(run(args))
+    if args.fail_over_p95 is not None:
+        result['over_budget'] = over_budget(result, args.fail_over_p95)
+
+    report = json.dumps(result, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(report + '\n')
+    if result.get('over_budget'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
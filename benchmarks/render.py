@@ -0,0 +1,117 @@
+"""Server-side render time of the room, create-room and join-room pages.
+
+Every page is requested through Django's test client (in process, no
+sockets) in two modes: ``uncached`` re-parses templates and re-renders
+the room page's participant list and chat history on every request, as
+before fragment caching; ``cached`` uses the project settings (cached
+template loader, fragments keyed by room version). Rooms are filled
+through the backend, so only the page requests are timed.
+
+    python -m benchmarks.render --rooms 20 --participants 8 --history 50 --repeat 20
+"""
+import argparse
+import json
+import time
+
+from . import percentiles, setup_django
+
+UNCACHED_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
+
+def uncached_settings():
+    from django.conf import settings
+    from django.test.utils import override_settings
+
+    templates = [
+        {**engine, 'OPTIONS': {**engine['OPTIONS'], 'loaders': UNCACHED_LOADERS}}
+        for engine in settings.TEMPLATES
+    ]
+    caches = {
+        **settings.CACHES,
+        'template_fragments': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+    }
+    return override_settings(TEMPLATES=templates, CACHES=caches)
+
+
+def setup_rooms(args):
+    from django.test import Client
+    from video_app.backends import get_backend
+
+    backend = get_backend()
+    rooms = []
+    for index in range(args.rooms):
+        client = Client(HTTP_HOST='localhost')
+        client.post('/', {'name': f'host{index}', 'email': f'host{index}@example.com'})
+        response = client.post('/create-room/', {'room_name': f'Bench {index}'})
+        room_id = response['Location'].strip('/').split('/')[-1]
+        for guest in range(args.participants - 1):
+            backend.join(room_id, f'guest{index}-{guest}', f'Guest {guest}')
+        for i in range(args.history):
+            backend.add_message(room_id, 'host', f'host{index}', f'history {i}')
+        rooms.append((client, room_id))
+    return rooms
+
+
+def measure(rooms, repeat):
+    samples = {'room': [], 'create_room': [], 'join_room': []}
+    for _ in range(repeat):
+        for client, room_id in rooms:
+            for page, path in (('room', f'/room/{room_id}/'), ('create_room', '/create-room/'),
+                               ('join_room', '/join-room/')):
+                started = time.perf_counter()
+                response = client.get(path)
+                samples[page].append(time.perf_counter() - started)
+                assert response.status_code == 200, (path, response.status_code)
+    return {page: percentiles(values) for page, values in samples.items()}
+
+
+def run(args):
+    from django.test.utils import override_settings
+
+    # Keep the benchmark off the database and the checkpoint
+    override_settings(ROOM_PERSISTENCE_ENABLED=False, CHAT_ARCHIVE_ENABLED=False, ROOM_CHECKPOINT_ENABLED=False).enable()
+    rooms = setup_rooms(args)
+
+    results = {}
+    with uncached_settings():
+        measure(rooms, 1)
+        results['uncached'] = measure(rooms, args.repeat)
+    measure(rooms, 1)
+    results['cached'] = measure(rooms, args.repeat)
+
+    return {
+        'benchmark': 'render',
+        'rooms': args.rooms,
+        'participants_per_room': args.participants,
+        'history': args.history,
+        'repeat': args.repeat,
+        'pages': results,
+        'speedup_p50': {
+            page: round(results['uncached'][page]['p50_ms'] / results['cached'][page]['p50_ms'], 2)
+            for page in results['cached']
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rooms', type=int, default=10)
+    parser.add_argument('--participants', type=int, default=8, help='per room, including the host')
+    parser.add_argument('--history', type=int, default=50, help='chat messages per room')
+    parser.add_argument('--repeat', type=int, default=20, help='requests per page and room in each mode')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    report = json.dumps(run(args), indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(report + '\n')
+
+
+if __name__ == '__main__':
+    main()
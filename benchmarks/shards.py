@@ -0,0 +1,260 @@
+"""Throughput of room API requests as rooms are sharded over more workers.
+
+For each worker count K in --workers, starts K daphne processes on this
+machine sharing one ROOM_SHARDS ring (in-memory state, no database
+writes, no rate limits), creates --rooms rooms through them with
+--participants members each, then has --load-processes processes of
+--concurrency clients each poll participants and post chat for
+--duration seconds. Clients send each request to the room's owner, as a
+room-aware proxy would (--route owner), or to a random worker that
+forwards it (--route any).
+
+    python -m benchmarks.shards --workers 1 2 4 --rooms 64 --duration 10
+
+Prints requests/s and latency per worker count, and the scaling over one
+worker (``efficiency`` 1.0 is linear). Workers never share state, so
+throughput scales with cores: K workers need K free cores besides the
+load generators for the near-linear figures.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+from . import percentiles, setup_django
+
+CHAT_EVERY = 4  # one chat message per this many requests; the rest poll participants
+
+
+def serve(name, port, shards):
+    setup_django()
+    from django.test.utils import override_settings
+
+    override_settings(
+        DEBUG=False, ALLOWED_HOSTS=['127.0.0.1', 'localhost'],
+        ROOM_SHARDS=shards, ROOM_SHARD_NAME=name,
+        ROOM_PERSISTENCE_ENABLED=False, CHAT_ARCHIVE_ENABLED=False, ROOM_CHECKPOINT_ENABLED=False,
+        ROOM_MAX_PARTICIPANTS=None,
+        CHAT_USER_RATE=None, CHAT_ROOM_RATE=None, MODERATION_USER_RATE=None, MODERATION_ROOM_RATE=None,
+        OVERLOAD_MAX_IN_FLIGHT=None, OVERLOAD_MAX_LATENCY=None,
+    ).enable()
+
+    from daphne.server import Server
+    from meet_clone.asgi import application
+
+    Server(application, endpoints=[f'tcp:port={port}:interface=127.0.0.1'], verbosity=0).run()
+
+
+def start_workers(count, base_port):
+    shards = {f'w{index}': f'http://127.0.0.1:{base_port + index}' for index in range(count)}
+    processes = [
+        subprocess.Popen([
+            sys.executable, '-m', 'benchmarks.shards', '--serve', name, '--port', url.rsplit(':', 1)[1],
+            '--shards', json.dumps(shards),
+        ])
+        for name, url in shards.items()
+    ]
+    deadline = time.monotonic() + 30
+    for url in shards.values():
+        port = int(url.rsplit(':', 1)[1])
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f'Worker on port {port} did not start')
+                time.sleep(0.1)
+    return shards, processes
+
+
+class Visitor:
+    """One browser: its cookies and the worker it talks to."""
+
+    def __init__(self, url):
+        self.url = url
+        self.cookies = {}
+
+    def headers(self):
+        headers = [('Host', '127.0.0.1')]
+        if self.cookies:
+            headers.append(('Cookie', '; '.join(f'{k}={v}' for k, v in self.cookies.items())))
+        if 'csrftoken' in self.cookies:
+            headers.append(('X-CSRFToken', self.cookies['csrftoken']))
+        return headers
+
+    async def request(self, method, path, form=None, url=None):
+        from video_app.sharding import http_request
+
+        body = urlencode(form or {}).encode()
+        headers = self.headers()
+        if form is not None:
+            headers.append(('Content-Type', 'application/x-www-form-urlencoded'))
+        status, response_headers, content = await http_request(url or self.url, method, path, headers, body)
+        for name, value in response_headers:
+            if name.lower() == 'set-cookie':
+                for morsel in SimpleCookie(value).values():
+                    self.cookies[morsel.key] = morsel.value
+        return status, dict(response_headers), content
+
+    async def enter(self, name):
+        _, _, page = await self.request('GET', '/')
+        # The form's token, in case the page set no csrftoken cookie
+        token = re.search(rb'name="csrfmiddlewaretoken" value="([^"]+)"', page).group(1).decode()
+        await self.request('POST', '/', {'name': name, 'email': f'{name}@example.com', 'csrfmiddlewaretoken': token})
+
+
+async def setup_rooms(shards, args):
+    urls = list(shards.values())
+    rooms = []
+    for index in range(args.rooms):
+        # A room is created on the worker asked, which is its owner
+        host = Visitor(urls[index % len(urls)])
+        await host.enter(f'host{index}')
+        status, headers, _ = await host.request('POST', '/create-room/', {'room_name': f'Bench {index}'})
+        assert status == 302, status
+        room_id = headers['Location'].strip('/').split('/')[-1]
+        members = [host]
+        for guest in range(args.participants - 1):
+            visitor = Visitor(random.choice(urls))
+            await visitor.enter(f'guest{index}-{guest}')
+            status, _, _ = await visitor.request('POST', '/join-room/', {'room_id': room_id})
+            assert status == 302, status
+            visitor.url = host.url
+            members.append(visitor)
+        rooms.append((room_id, host.url, [visitor.cookies for visitor in members]))
+    return rooms
+
+
+async def drive(rooms, urls, args, deadline):
+    samples, errors = [], 0
+    visitors = [
+        (room_id, owner_url, cookies) for room_id, owner_url, room_cookies in rooms for cookies in room_cookies
+    ]
+
+    async def client():
+        nonlocal errors
+        count = 0
+        while time.monotonic() < deadline:
+            room_id, owner_url, cookies = random.choice(visitors)
+            visitor = Visitor(owner_url if args.route == 'owner' else random.choice(urls))
+            visitor.cookies = dict(cookies)
+            count += 1
+            started = time.perf_counter()
+            try:
+                if count % CHAT_EVERY:
+                    status, _, _ = await visitor.request('GET', f'/api/room/{room_id}/participants/')
+                else:
+                    status, _, _ = await visitor.request(
+                        'POST', f'/api/room/{room_id}/chat/send/', {'message': f'message {count}'},
+                    )
+            except OSError:
+                status = None
+            if status == 200:
+                samples.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    await asyncio.gather(*(client() for _ in range(args.concurrency)))
+    return samples, errors
+
+
+def load_process(rooms, urls, args, deadline, results):
+    results.put(asyncio.run(drive(rooms, urls, args, deadline)))
+
+
+def measure(workers, args):
+    shards, processes = start_workers(workers, args.base_port)
+    try:
+        rooms = asyncio.run(setup_rooms(shards, args))
+        results = multiprocessing.Queue()
+        started = time.monotonic()
+        deadline = started + args.duration
+        loaders = [
+            multiprocessing.Process(target=load_process, args=(rooms, list(shards.values()), args, deadline, results))
+            for _ in range(args.load_processes)
+        ]
+        for loader in loaders:
+            loader.start()
+        samples, errors = [], 0
+        for _ in loaders:
+            loader_samples, loader_errors = results.get()
+            samples.extend(loader_samples)
+            errors += loader_errors
+        elapsed = time.monotonic() - started
+        for loader in loaders:
+            loader.join()
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    return {
+        'workers': workers,
+        'requests_per_s': round(len(samples) / elapsed, 1),
+        'errors': errors,
+        'latency': percentiles(samples),
+    }
+
+
+def run(args):
+    results = [measure(workers, args) for workers in args.workers]
+    baseline = results[0]['requests_per_s'] / results[0]['workers']
+    for result in results:
+        result['speedup'] = round(result['requests_per_s'] / results[0]['requests_per_s'], 2)
+        result['efficiency'] = round(result['requests_per_s'] / (baseline * result['workers']), 2)
+    return {
+        'benchmark': 'shards',
+        'cpus': os.cpu_count(),
+        'route': args.route,
+        'rooms': args.rooms,
+        'participants_per_room': args.participants,
+        'load_processes': args.load_processes,
+        'concurrency': args.concurrency,
+        'duration_s': args.duration,
+        'runs': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='worker counts to compare')
+    parser.add_argument('--rooms', type=int, default=64)
+    parser.add_argument('--participants', type=int, default=4, help='per room, including the host')
+    parser.add_argument('--load-processes', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=32, help='clients per load process')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per worker count')
+    parser.add_argument('--route', choices=('owner', 'any'), default='owner',
+                        help='send requests to the room owner, or to any worker to be forwarded')
+    parser.add_argument('--base-port', type=int, default=8100)
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    # Internal: run one worker
+    parser.add_argument('--serve', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--shards', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args.serve, args.port, json.loads(args.shards))
+        return
+
+    setup_django()
+    report = json.dumps(run(args), indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(report + '\n')
+
+
+if __name__ == '__main__':
+    main()
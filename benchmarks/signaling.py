@@ -0,0 +1,98 @@
+"""Call-setup latency through the PeerJS signaling consumer.
+
+Each pair of peers in a room connects, then measures the signaling part of
+a call: OFFER relayed to the callee, ANSWER back to the caller, and one
+CANDIDATE each way. Everything runs in process over the channel layer.
+
+    python -m benchmarks.signaling --pairs 200 --candidates 4
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from . import percentiles, setup_django
+
+
+async def run_pair(consumer_app, room_id, caller_id, callee_id, candidates):
+    from channels.testing import WebsocketCommunicator
+
+    def peer(peer_id):
+        communicator = WebsocketCommunicator(
+            consumer_app, f'/peerjs/peerjs?key={room_id}&id={peer_id}&token=t-{peer_id}'
+        )
+        communicator.scope['session'] = {'user_id': peer_id}
+        return communicator
+
+    started = time.perf_counter()
+    caller, callee = peer(caller_id), peer(callee_id)
+    await caller.connect()
+    await callee.connect()
+    await caller.receive_json_from()
+    await callee.receive_json_from()
+    connected = time.perf_counter()
+
+    await caller.send_json_to({'type': 'OFFER', 'dst': callee_id, 'payload': {'sdp': 'offer'}})
+    await callee.receive_json_from()
+    await callee.send_json_to({'type': 'ANSWER', 'dst': caller_id, 'payload': {'sdp': 'answer'}})
+    await caller.receive_json_from()
+    answered = time.perf_counter()
+
+    for i in range(candidates):
+        await caller.send_json_to({'type': 'CANDIDATE', 'dst': callee_id, 'payload': {'candidate': i}})
+        await callee.send_json_to({'type': 'CANDIDATE', 'dst': caller_id, 'payload': {'candidate': i}})
+        await callee.receive_json_from()
+        await caller.receive_json_from()
+    finished = time.perf_counter()
+
+    await caller.disconnect()
+    await callee.disconnect()
+    return connected - started, answered - connected, finished - connected
+
+
+async def run(pairs, candidates, concurrency):
+    from video_app.backends import get_backend
+    from video_app.consumers import PeerSignalingConsumer
+
+    backend = get_backend()
+    consumer_app = PeerSignalingConsumer.as_asgi()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        room_id = f'BENCH{i}'
+        caller_id, callee_id = f'caller-{i}', f'callee-{i}'
+        backend.create_room(room_id, 'bench', caller_id, 'Caller')
+        backend.join(room_id, callee_id, 'Callee')
+        async with semaphore:
+            return await run_pair(consumer_app, room_id, caller_id, callee_id, candidates)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(pairs)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'benchmark': 'signaling',
+        'pairs': pairs,
+        'candidates_per_side': candidates,
+        'concurrency': concurrency,
+        'elapsed_s': round(elapsed, 3),
+        'calls_per_s': round(pairs / elapsed, 1),
+        'connect': percentiles([r[0] for r in results]),
+        'offer_answer': percentiles([r[1] for r in results]),
+        'call_setup': percentiles([r[2] for r in results]),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pairs', type=int, default=100)
+    parser.add_argument('--candidates', type=int, default=4, help='ICE candidates sent by each side')
+    parser.add_argument('--concurrency', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    print(json.dumps(asyncio.run(run(args.pairs, args.candidates, args.concurrency)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
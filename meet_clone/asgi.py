@@ -13,15 +13,18 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'meet_clone.settings')
 
-application = get_asgi_application()
+# Initialize Django before importing anything that touches the app registry
+django_asgi_app = get_asgi_application()
 
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.security.websocket import AllowedHostsOriginValidator  # noqa: E402
+from channels.sessions import SessionMiddlewareStack  # noqa: E402
 
-import os
-from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter
-
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'meet_clone.settings')
+from video_app.routing import websocket_urlpatterns  # noqa: E402
 
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
-})
\ No newline at end of file
+    "http": django_asgi_app,
+    "websocket": AllowedHostsOriginValidator(
+        SessionMiddlewareStack(URLRouter(websocket_urlpatterns))
+    ),
+})
@@ -43,9 +43,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'video_app.middleware.MetricsMiddleware',
+    'video_app.middleware.ProfilingMiddleware',
+    'video_app.middleware.LoadSheddingMiddleware',
+    'video_app.middleware.ShardRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    # 'whitenoise.middleware.WhiteNoiseMiddleware',  # Remove or comment this line
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'video_app.middleware.AssetMiddleware',
+    'video_app.middleware.TimedSessionMiddleware',
+    'video_app.middleware.SlidingSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -53,8 +58,6 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-# Also remove or comment these whitenoise settings if present:
-# STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 ROOT_URLCONF = 'meet_clone.urls'
 
@@ -62,18 +65,25 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR/'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Templates are parsed once per process, not once per request
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'meet_clone.wsgi.application'
+ASGI_APPLICATION = 'meet_clone.asgi.application'
 
 
 # Database
@@ -126,6 +136,14 @@ STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# collectstatic writes content-hashed, gzip- and brotli-compressed copies;
+# AssetMiddleware serves them with immutable cache headers. Run
+# `python -m benchmarks.assets` for their sizes and load times.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'video_app.assets.AssetStorage'},
+}
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
@@ -141,7 +159,180 @@ CHANNEL_LAYERS = {
     },
 }
 
-# Add this to settings.py
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+# Request, session and room-state metrics on /metrics (Prometheus text
+# format). Turning this off also removes the timing middleware.
+METRICS_ENABLED = True
+
+# Sampling profiler: stacks of profiled requests are sampled every
+# PROFILER_INTERVAL seconds. Profiles 1 in PROFILER_SAMPLE_RATE requests
+# (0 = none) plus every request to PROFILER_ROUTES (URL patterns) or
+# PROFILER_ROOMS; staff can change these at runtime on api/admin/profile/.
+PROFILER_SAMPLE_RATE = 0
+PROFILER_ROUTES = []
+PROFILER_ROOMS = []
+PROFILER_INTERVAL = 0.005
+PROFILER_MAX_STACKS = 5000
+
+# Room events published within this many seconds are sent to the room's
+# sockets as one batch, with superseded participant updates dropped
+FANOUT_TICK = 0.05
+
+# Where live room state is kept. The in-memory backend only works with a
+# single worker process; to run several, shard rooms across them (see
+# ROOM_SHARDS below) or share state through Redis:
+#   ROOM_STATE_BACKEND = 'video_app.backends.redis.RedisRoomState'
+#   ROOM_STATE_OPTIONS = {'url': 'redis://127.0.0.1:6379/0'}
+ROOM_STATE_BACKEND = 'video_app.backends.memory.InMemoryRoomState'
+ROOM_STATE_OPTIONS = {}
+
+# Room events reach sockets on other workers only through a shared channel
+# layer, so with Redis state the layer is in Redis too (needs
+# channels_redis). PeerJS signaling still pairs a room's peers within one
+# process: with several workers, also set ROOM_SHARDS so that every
+# socket of a room is served by the same worker.
+if ROOM_STATE_BACKEND == 'video_app.backends.redis.RedisRoomState':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [ROOM_STATE_OPTIONS.get('url', 'redis://127.0.0.1:6379/0')]},
+        },
+    }
+
+# Chat messages kept per room; older ones are evicted
+CHAT_HISTORY_LIMIT = 100
+
+# Write-behind persistence of rooms and participants to the database.
+# Changes are batched in memory and flushed every ROOM_PERSISTENCE_INTERVAL
+# seconds; active rooms are loaded back on the first request after a restart.
+ROOM_PERSISTENCE_ENABLED = True
+ROOM_PERSISTENCE_INTERVAL = 5
+
+# Snapshots of the in-memory room state (chat included) for fast restarts.
+# Every ROOM_CHECKPOINT_INTERVAL seconds the rooms that changed are encoded
+# again and the checkpoint at ROOM_CHECKPOINT_PATH is replaced; it is
+# loaded back before the first request unless older than
+# ROOM_CHECKPOINT_MAX_AGE seconds. Rooms missing from it still come from
+# ROOM_PERSISTENCE. With ROOM_SHARDS, each worker appends its shard name to
+# the path. Run `python -m benchmarks.checkpoint` for its costs.
+ROOM_CHECKPOINT_ENABLED = True
+ROOM_CHECKPOINT_PATH = BASE_DIR / 'room_state.checkpoint'
+ROOM_CHECKPOINT_INTERVAL = 2
+ROOM_CHECKPOINT_MAX_AGE = 600
+
+# Every chat message is also archived in the database (with full-text
+# search on SQLite), written in batches every CHAT_ARCHIVE_INTERVAL seconds
+# or once CHAT_ARCHIVE_BATCH_SIZE messages are waiting. If the database is
+# unavailable at most CHAT_ARCHIVE_MAX_PENDING messages are held for retry.
+CHAT_ARCHIVE_ENABLED = True
+CHAT_ARCHIVE_INTERVAL = 1
+CHAT_ARCHIVE_BATCH_SIZE = 1000
+CHAT_ARCHIVE_MAX_PENDING = 100000
+
+# Put SQLite databases in WAL mode, so chat history and search read while
+# the archive writes. Turn this on in deployments. The mode is stored in
+# the database file itself (with -wal/-shm files beside it), so it stays
+# off here and running the app leaves the checked-in db.sqlite3 as it is.
+SQLITE_WAL = False
+
+# The room page's participant list and chat history are cached as rendered
+# HTML for ROOM_FRAGMENT_TTL seconds, keyed by room version and chat seq, so
+# they are only re-rendered after the room changes.
+ROOM_FRAGMENT_TTL = 600
+
+# Participant and chat API responses are encoded once per room version and
+# shared by every poller (with orjson when installed). The participant
+# lists of the last SNAPSHOT_VERSIONS versions are kept to answer
+# ?version= deltas from, for at most SNAPSHOT_MAX_ROOMS rooms.
+SNAPSHOT_VERSIONS = 16
+SNAPSHOT_MAX_ROOMS = 10000
+
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    # Used by {% cache %}
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'template-fragments',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Room lifecycle (seconds). Rooms are freed ROOM_IDLE_TTL after their last
+# activity, or ROOM_INACTIVE_TTL after the last participant left; the reaper
+# checks every ROOM_REAPER_INTERVAL. Only applies to the in-memory backend.
+ROOM_IDLE_TTL = 4 * 3600
+ROOM_INACTIVE_TTL = 10 * 60
+ROOM_REAPER_INTERVAL = 5
+
+# Participant presence (seconds). Anyone not heard from for PRESENCE_TIMEOUT
+# (page requests, room socket pings, PeerJS heartbeats) is removed from the
+# room; checked every PRESENCE_SWEEP_INTERVAL. In-memory backend only.
+PRESENCE_TIMEOUT = 45
+PRESENCE_SWEEP_INTERVAL = 5
+
+# Admission control. Rooms seat ROOM_MAX_PARTICIPANTS, host included (the
+# default of Room.max_participants; None for no limit); up to
+# ROOM_WAITING_LIMIT more wait in line for a seat (0 for no queue).
+ROOM_MAX_PARTICIPANTS = 10
+ROOM_WAITING_LIMIT = 50
+
+# Token buckets as (tokens per second, burst), or None for no limit.
+# Requests past them are answered 429 with Retry-After.
+CHAT_USER_RATE = (1, 5)
+CHAT_ROOM_RATE = (20, 40)
+MODERATION_USER_RATE = (2, 10)
+MODERATION_ROOM_RATE = (5, 20)
+
+# Room API requests are answered 503 (Retry-After: OVERLOAD_RETRY_AFTER
+# seconds) while OVERLOAD_MAX_IN_FLIGHT requests are being handled or their
+# recent latency is past OVERLOAD_MAX_LATENCY seconds. None disables either.
+OVERLOAD_MAX_IN_FLIGHT = 200
+OVERLOAD_MAX_LATENCY = 2.0
+OVERLOAD_RETRY_AFTER = 1
+
+# Active speakers and video budgets (seconds, dB). Clients report their
+# audio levels; up to SPEAKER_ACTIVE_COUNT participants louder than
+# -SPEAKER_THRESHOLD dBov are the active speakers, replaced only by someone
+# SPEAKER_SWITCH_MARGIN dB louder after SPEAKER_MIN_HOLD, and kept through
+# SPEAKER_RELEASE of silence. Each participant receives VIDEO_FULL_STREAMS
+# videos at full quality and VIDEO_MAX_STREAMS in all, speakers first.
+# Rooms with new reports are re-elected once every SPEAKER_TICK.
+SPEAKER_TICK = 0.25
+SPEAKER_ACTIVE_COUNT = 2
+SPEAKER_THRESHOLD = 50
+SPEAKER_SWITCH_MARGIN = 6
+SPEAKER_MIN_HOLD = 2.0
+SPEAKER_RELEASE = 3.0
+VIDEO_FULL_STREAMS = 2
+VIDEO_MAX_STREAMS = 6
+
+# Sharding across worker processes, each with its own in-memory state.
+# ROOM_SHARDS names every worker and the base URL the others reach it on;
+# each room belongs to one of them by consistent hashing of its ID (with
+# ROOM_SHARD_VNODES points per worker), and ROOM_SHARD_NAME says which one
+# this process is. Room requests reaching another worker are forwarded to
+# the owner. Room and PeerJS sockets are only accepted by the owner, so a
+# proxy in front should route /ws/room/<id>/ and /peerjs?key=<id> by the
+# same ring (the room page falls back to polling otherwise). Adding or
+# removing a worker moves about 1/N of the rooms, which are picked up from
+# ROOM_PERSISTENCE by their new owner on restart.
+#   ROOM_SHARDS = {'w1': 'http://127.0.0.1:8001', 'w2': 'http://127.0.0.1:8002'}
+#   ROOM_SHARD_NAME = 'w1'
+ROOM_SHARDS = {}
+ROOM_SHARD_NAME = ''
+ROOM_SHARD_VNODES = 128
+
+# Built-in PeerJS signaling server (seconds)
+PEERJS_EXPIRE_TIMEOUT = 5  # hold signals for a peer that is still connecting
+PEERJS_ALIVE_TIMEOUT = 60  # drop peers that stop sending heartbeats
+
+# Sessions only hold user_name, user_email and user_id, so keep them in a
+# signed cookie instead of writing django_session on every poll. For
+# server-side sessions without the database use
+# 'django.contrib.sessions.backends.cache' instead.
+SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
 SESSION_COOKIE_AGE = 3600  # 1 hour
-SESSION_SAVE_EVERY_REQUEST = True
\ No newline at end of file
+SESSION_COOKIE_HTTPONLY = True
+# Expiry slides via SlidingSessionMiddleware, which re-saves the session
+# only once less than SESSION_REFRESH_THRESHOLD seconds are left
+SESSION_SAVE_EVERY_REQUEST = False
+SESSION_REFRESH_THRESHOLD = 15 * 60
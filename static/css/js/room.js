@@ -4,11 +4,13 @@ const peers = {};
 const userStreams = {};
 
 // Initialize PeerJS
+// Signal through our own server; the PeerJS key carries the room
 peer = new Peer(userId, {
-    host: '0.peerjs.com',
-    port: 443,
-    path: '/',
-    secure: true
+    host: window.location.hostname,
+    port: window.location.port || (window.location.protocol === 'https:' ? 443 : 80),
+    path: '/peerjs',
+    key: roomId,
+    secure: window.location.protocol === 'https:'
 });
 
 peer.on('open', (id) => {
@@ -76,11 +78,47 @@ function addVideoStream(userId, stream, name) {
 }
 
 function notifyJoined() {
-    // In a real application, you'd use WebSockets here
-    // For simplicity, we'll use polling to update participant list
     updateParticipantList();
 }
 
+// Room event bus: the server pushes join/leave/mute/remove events, polling
+// only runs while the socket is down
+let roomSocket = null;
+let participantPollTimer = null;
+let socketPingTimer = null;
+
+function connectRoomSocket() {
+    const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+    roomSocket = new WebSocket(`${scheme}://${window.location.host}/ws/room/${roomId}/`);
+
+    roomSocket.onopen = () => {
+        clearInterval(participantPollTimer);
+        participantPollTimer = null;
+        // Doubles as the presence heartbeat
+        socketPingTimer = setInterval(() => roomSocket && roomSocket.send('ping'), 20000);
+        updateParticipantList();
+    };
+
+    roomSocket.onmessage = (e) => {
+        if (e.data === 'pong') return;
+        // Events come in batches; one participant refresh covers them all
+        const events = JSON.parse(e.data).events;
+        if (events.some(data => data.event !== 'chat.message')) {
+            updateParticipantList();
+        }
+    };
+
+    roomSocket.onclose = () => {
+        roomSocket = null;
+        clearInterval(socketPingTimer);
+        socketPingTimer = null;
+        if (!participantPollTimer) {
+            participantPollTimer = setInterval(updateParticipantList, 5000);
+        }
+        setTimeout(connectRoomSocket, 5000);
+    };
+}
+
 function callUser(userId, userName) {
     if (userId === peer.id) return;
     
@@ -250,7 +288,8 @@ function removeAll() {
 // Initialize room
 function joinRoom() {
     initMedia();
-    setInterval(updateParticipantList, 5000); // Update every 5 seconds
+    participantPollTimer = setInterval(updateParticipantList, 5000); // Fallback until the socket is up
+    connectRoomSocket();
 }
 
 // Clean up on page unload
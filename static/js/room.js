@@ -0,0 +1,892 @@
+// Room page: media, PeerJS calls, chat and the room event socket. Expects
+// roomId, userId, userName, isAdmin and roomCreatorId from the page.
+
+// PeerJS for real-time communication
+let peer;
+let peers = {};
+let localStream;
+let screenStream;
+
+// Active speakers and video budgets. Audio levels are sampled as RFC 6464
+// levels (-dBov: 0 loudest, 127 silence) and reported about once a second;
+// the server answers with who receives whose video at which tier
+const LEVEL_SAMPLE_INTERVAL = 100;
+const LEVEL_REPORT_INTERVAL = 1000;
+let levelSamples = [];
+let subscriptions = {};
+
+// Modal state
+let currentRemoveUserId = null;
+let currentRemoveUserName = null;
+
+// Initialize PeerJS
+async function initializePeer() {
+    // Signal through our own server; the PeerJS key carries the room
+    const secure = window.location.protocol === 'https:';
+    peer = new Peer(userId, {
+        host: window.location.hostname,
+        port: window.location.port || (secure ? 443 : 80),
+        path: '/peerjs',
+        key: roomId,
+        secure: secure
+    });
+
+    peer.on('open', (id) => {
+        console.log('My peer ID is: ' + id);
+        initializeMedia();
+    });
+
+    peer.on('call', (call) => {
+        // Answer the call with our local stream
+        call.answer(localStream);
+        peers[call.peer] = call;
+        
+        call.on('stream', (remoteStream) => {
+            // Display the remote stream
+            addVideoStream(call.peer, remoteStream, call.metadata.userName);
+            applySubscriptions(subscriptions);
+        });
+    });
+
+    peer.on('error', (err) => {
+        console.error('PeerJS error:', err);
+    });
+}
+
+// Initialize media devices
+async function initializeMedia() {
+    try {
+        localStream = await navigator.mediaDevices.getUserMedia({
+            video: true,
+            audio: true
+        });
+        
+        const localVideo = document.getElementById('local-video');
+        localVideo.srcObject = localStream;
+        
+        // Update audio indicator
+        updateAudioIndicator(true);
+        
+        // Call existing participants
+        callExistingParticipants();
+        startAudioLevels();
+        
+    } catch (error) {
+        console.error('Error accessing media devices:', error);
+        showNoVideoPlaceholder('local-video-container', userName);
+    }
+}
+
+// Call existing participants
+function callExistingParticipants() {
+    // This would typically call other participants in the room
+    // For now, we'll simulate this with the current implementation
+    console.log('Calling existing participants...');
+}
+
+// Add video stream to grid
+function addVideoStream(userId, stream, userName) {
+    // Remove existing video if present
+    const existingVideo = document.querySelector(`[data-user-id="${userId}"]`);
+    if (existingVideo) {
+        existingVideo.remove();
+    }
+    
+    const videoGrid = document.getElementById('video-grid');
+    const videoContainer = document.createElement('div');
+    videoContainer.className = 'video-container';
+    videoContainer.setAttribute('data-user-id', userId);
+    
+    const videoElement = document.createElement('video');
+    videoElement.className = 'video-element';
+    videoElement.srcObject = stream;
+    videoElement.playsInline = true;
+    videoElement.autoplay = true;
+    videoElement.muted = userId === peer.id;
+    
+    const nameLabel = document.createElement('div');
+    nameLabel.className = 'participant-name';
+    nameLabel.textContent = userName;
+    
+    const statusLabel = document.createElement('div');
+    statusLabel.className = 'participant-status';
+    statusLabel.textContent = userId === roomCreatorId ? '👑 Host' : 'Member';
+    
+    const audioIndicator = document.createElement('div');
+    audioIndicator.className = 'audio-indicator';
+    audioIndicator.innerHTML = '<i class="fas fa-microphone"></i>';
+    
+    videoContainer.appendChild(videoElement);
+    videoContainer.appendChild(nameLabel);
+    videoContainer.appendChild(statusLabel);
+    videoContainer.appendChild(audioIndicator);
+    videoGrid.appendChild(videoContainer);
+}
+
+function startAudioLevels() {
+    const AudioContext = window.AudioContext || window.webkitAudioContext;
+    if (!AudioContext || !localStream.getAudioTracks().length) return;
+
+    const context = new AudioContext();
+    const analyser = context.createAnalyser();
+    analyser.fftSize = 512;
+    context.createMediaStreamSource(localStream).connect(analyser);
+    const samples = new Float32Array(analyser.fftSize);
+
+    setInterval(() => {
+        const audioTrack = localStream.getAudioTracks()[0];
+        let level = 127;
+        if (audioTrack && audioTrack.enabled) {
+            analyser.getFloatTimeDomainData(samples);
+            let sum = 0;
+            for (const sample of samples) sum += sample * sample;
+            const rms = Math.sqrt(sum / samples.length);
+            if (rms > 0) level = Math.min(127, Math.round(-20 * Math.log10(rms)));
+        }
+        levelSamples.push(level);
+    }, LEVEL_SAMPLE_INTERVAL);
+    setInterval(reportAudioLevels, LEVEL_REPORT_INTERVAL);
+}
+
+async function reportAudioLevels() {
+    if (!levelSamples.length) return;
+    const levels = levelSamples;
+    levelSamples = [];
+
+    if (roomSocket && roomSocket.readyState === WebSocket.OPEN) {
+        // The room's order comes back as a speakers.updated event
+        roomSocket.send(JSON.stringify({levels: levels}));
+        return;
+    }
+    try {
+        const formData = new FormData();
+        formData.append('levels', levels.join(','));
+        const response = await fetch(`/api/room/${roomId}/audio-levels/`, {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': getCookie('csrftoken'),
+            },
+            body: formData
+        });
+        const data = await response.json();
+        if (data.success) applySubscriptions(data.subscriptions);
+    } catch (error) {
+        console.error('Error reporting audio levels:', error);
+    }
+}
+
+function budgetTier(budget, targetUserId) {
+    if (budget.full.includes(targetUserId)) return 'full';
+    if (budget.reduced.includes(targetUserId)) return 'reduced';
+    return 'off';
+}
+
+// A viewer's budget under a speakers.updated event, as the server derives
+// it: the viewer's pin, then the room's order
+function speakerBudget(data, viewerId) {
+    const pinned = data.pins[viewerId];
+    const ranked = data.order.filter(peerId => peerId !== viewerId && peerId !== pinned);
+    if (pinned && pinned !== viewerId && data.order.includes(pinned)) ranked.unshift(pinned);
+    const streams = ranked.slice(0, data.max_streams);
+    return {full: streams.slice(0, data.full_streams), reduced: streams.slice(data.full_streams)};
+}
+
+function applySpeakers(data) {
+    document.querySelectorAll('.video-container[data-user-id]').forEach(container => {
+        container.classList.toggle('speaking', data.active.includes(container.dataset.userId));
+    });
+
+    // What we receive of everyone else
+    const budget = speakerBudget(data, userId);
+    const received = {};
+    new Set([...data.order, ...Object.keys(peers)]).forEach(peerId => {
+        if (peerId !== userId) received[peerId] = {video: budgetTier(budget, peerId)};
+    });
+    applySubscriptions(received);
+
+    // What everyone else receives of us: stop or scale down the video we
+    // upload to each of them
+    Object.entries(peers).forEach(([viewerId, call]) => {
+        setSendTier(call, budgetTier(speakerBudget(data, viewerId), userId));
+    });
+}
+
+function applySubscriptions(received) {
+    subscriptions = received;
+    Object.entries(received).forEach(([peerId, subscription]) => {
+        const container = document.querySelector(`.video-container[data-user-id="${peerId}"]`);
+        if (container) container.classList.toggle('video-off', subscription.video === 'off');
+    });
+}
+
+function setSendTier(call, tier) {
+    const connection = call.peerConnection;
+    if (!connection) return;
+    connection.getSenders().forEach(sender => {
+        if (!sender.track || sender.track.kind !== 'video') return;
+        const parameters = sender.getParameters();
+        if (!parameters.encodings || !parameters.encodings.length) return;
+        const encoding = parameters.encodings[0];
+        encoding.active = tier !== 'off';
+        encoding.scaleResolutionDownBy = tier === 'reduced' ? 4 : 1;
+        if (tier === 'reduced') {
+            encoding.maxBitrate = 150000;
+        } else {
+            delete encoding.maxBitrate;
+        }
+        sender.setParameters(parameters).catch(error => console.error('Error setting video tier:', error));
+    });
+}
+
+// Show no video placeholder
+function showNoVideoPlaceholder(containerId, userName) {
+    const container = document.getElementById(containerId);
+    container.innerHTML = `
+        <div class="no-video">
+            <i class="fas fa-user"></i>
+        </div>
+        <div class="participant-name">${userName} (You)</div>
+        <div class="participant-status">
+            ${is_admin ? '👑 Host' : 'Member'}
+        </div>
+        <div class="audio-indicator" id="local-audio-indicator">
+            <i class="fas fa-microphone"></i>
+        </div>
+    `;
+}
+
+// Update audio indicator
+function updateAudioIndicator(enabled) {
+    const indicator = document.getElementById('local-audio-indicator');
+    if (enabled) {
+        indicator.innerHTML = '<i class="fas fa-microphone"></i>';
+        indicator.classList.remove('muted');
+    } else {
+        indicator.innerHTML = '<i class="fas fa-microphone-slash"></i>';
+        indicator.classList.add('muted');
+    }
+}
+
+// Modal functions
+function showRemoveModal(userId, userName) {
+    currentRemoveUserId = userId;
+    currentRemoveUserName = userName;
+    document.getElementById('modalMessage').textContent = `Are you sure you want to remove ${userName} from the meeting?`;
+    document.getElementById('removeModal').style.display = 'flex';
+}
+
+function showRemoveAllModal() {
+    currentRemoveUserId = 'all';
+    document.getElementById('modalMessage').textContent = 'Are you sure you want to remove all participants from the meeting?';
+    document.getElementById('removeModal').style.display = 'flex';
+}
+
+function closeModal() {
+    document.getElementById('removeModal').style.display = 'none';
+    currentRemoveUserId = null;
+    currentRemoveUserName = null;
+}
+
+// Copy Room ID functionality
+function copyRoomId() {
+    const roomIdText = roomId;
+    
+    navigator.clipboard.writeText(roomIdText).then(function() {
+        const roomIdElement = document.getElementById('room-id');
+        const originalText = roomIdElement.textContent;
+        roomIdElement.textContent = 'Copied!';
+        roomIdElement.style.background = '#4285f4';
+        
+        setTimeout(function() {
+            roomIdElement.textContent = originalText;
+            roomIdElement.style.background = '#404040';
+        }, 2000);
+    }).catch(function(err) {
+        console.error('Failed to copy: ', err);
+        alert('Failed to copy room ID. Please copy manually: ' + roomIdText);
+    });
+}
+
+// Tab switching functionality
+document.querySelectorAll('.sidebar-tab').forEach(tab => {
+    tab.addEventListener('click', function() {
+        const tabName = this.getAttribute('data-tab');
+        
+        document.querySelectorAll('.sidebar-tab').forEach(t => t.classList.remove('active'));
+        this.classList.add('active');
+        
+        document.querySelectorAll('.tab-panel').forEach(panel => panel.classList.remove('active'));
+        document.getElementById(`${tabName}-panel`).classList.add('active');
+    });
+});
+
+// Chat functionality
+const chatForm = document.getElementById('chat-form');
+const chatInput = document.getElementById('chat-input');
+const chatMessages = document.getElementById('chat-messages');
+
+function scrollToBottom() {
+    chatMessages.scrollTop = chatMessages.scrollHeight;
+}
+
+function addMessageToChat(message) {
+    // The sender sees its own message both from the POST and the push
+    if (seenMessageIds.has(message.id)) return;
+    seenMessageIds.add(message.id);
+    lastMessageSeq = Math.max(lastMessageSeq, message.seq || 0);
+
+    const messageDiv = document.createElement('div');
+    messageDiv.className = `chat-message ${message.user_id === userId ? 'own' : message.is_system ? 'system' : 'other'}`;
+    
+    let messageHtml = '';
+    if (!message.is_system) {
+        messageHtml += `<div class="message-sender">${message.user_name}`;
+        if (message.user_id === roomCreatorId) {
+            messageHtml += `<span class="admin-badge">Host</span>`;
+        }
+        messageHtml += `</div>`;
+    }
+    messageHtml += `<div class="message-text">${message.message}</div>`;
+    messageHtml += `<div class="message-time">${message.timestamp}</div>`;
+    
+    messageDiv.innerHTML = messageHtml;
+    chatMessages.appendChild(messageDiv);
+    
+    const noMessages = chatMessages.querySelector('.no-messages');
+    if (noMessages) {
+        noMessages.remove();
+    }
+    
+    scrollToBottom();
+}
+
+async function sendMessage(messageText) {
+    try {
+        const formData = new FormData();
+        formData.append('message', messageText);
+        
+        const response = await fetch(`/api/room/${roomId}/chat/send/`, {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': getCookie('csrftoken'),
+            },
+            body: formData
+        });
+        
+        const data = await response.json();
+        if (data.success) {
+            addMessageToChat(data.message);
+        }
+    } catch (error) {
+        console.error('Error sending message:', error);
+    }
+}
+
+async function loadMessages() {
+    try {
+        const response = await fetch(`/api/room/${roomId}/chat/messages/`);
+        const data = await response.json();
+        
+        chatMessages.innerHTML = '';
+        seenMessageIds.clear();
+        lastMessageSeq = 0;
+        
+        if (data.messages.length === 0) {
+            chatMessages.innerHTML = '<div class="no-messages">No messages yet. Start the conversation!</div>';
+        } else {
+            data.messages.forEach(message => {
+                addMessageToChat(message);
+            });
+        }
+        
+        scrollToBottom();
+    } catch (error) {
+        console.error('Error loading messages:', error);
+    }
+}
+
+const POLL_RETRY_DELAY = 3000;
+
+// How long to wait before asking again after a refused request: as long
+// as the server's Retry-After says, if it says
+function retryDelay(response) {
+    const seconds = parseInt(response.headers.get('Retry-After'), 10);
+    return Number.isNaN(seconds) ? POLL_RETRY_DELAY : seconds * 1000;
+}
+
+// Fetch only messages after the last one we have; with wait > 0 the
+// server holds the request until something new arrives. Returns how many
+// milliseconds to wait before polling again.
+async function fetchNewMessages(wait) {
+    const response = await fetch(`/api/room/${roomId}/chat/messages/?since=${lastMessageSeq}&wait=${wait}`);
+    if (response.status === 304) return 0;
+    if (!response.ok) return retryDelay(response);
+
+    const data = await response.json();
+    if (!data.success) {
+        // The room is gone: nothing more will ever arrive
+        roomGone = true;
+        stopPolling();
+        return 0;
+    }
+    // A new meeting under this room ID (e.g. after a restart without a
+    // checkpoint) numbers its messages from 0 again: start over
+    if (data.last_seq < lastMessageSeq) {
+        await loadMessages();
+        return 0;
+    }
+    data.messages.forEach(addMessageToChat);
+    return 0;
+}
+
+async function pollMessages() {
+    while (chatPolling) {
+        let delay;
+        try {
+            delay = await fetchNewMessages(25);
+        } catch (error) {
+            console.error('Error polling messages:', error);
+            delay = POLL_RETRY_DELAY;
+        }
+        if (delay) await new Promise(resolve => setTimeout(resolve, delay));
+    }
+}
+
+// Chat form submission
+chatForm.addEventListener('submit', async function(e) {
+    e.preventDefault();
+    
+    const messageText = chatInput.value.trim();
+    if (messageText) {
+        chatInput.disabled = true;
+        await sendMessage(messageText);
+        chatInput.value = '';
+        chatInput.disabled = false;
+        chatInput.focus();
+    }
+});
+
+// Room event bus: push updates over a WebSocket, poll only as a fallback
+let roomSocket = null;
+let chatPolling = false;
+let roomGone = false;
+let participantPollTimer = null;
+let socketPingTimer = null;
+let lastMessageSeq = 0;
+const seenMessageIds = new Set();
+
+function startPolling() {
+    if (roomGone) return;
+    if (!chatPolling) {
+        chatPolling = true;
+        pollMessages();
+    }
+    if (!participantPollTimer) {
+        participantPollTimer = setInterval(refreshParticipants, 5000);
+    }
+}
+
+function stopPolling() {
+    chatPolling = false;
+    clearInterval(participantPollTimer);
+    participantPollTimer = null;
+}
+
+function connectRoomSocket() {
+    if (!('WebSocket' in window)) {
+        startPolling();
+        return;
+    }
+
+    const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+    roomSocket = new WebSocket(`${scheme}://${window.location.host}/ws/room/${roomId}/`);
+
+    roomSocket.onopen = function() {
+        stopPolling();
+        // The ping is also our presence heartbeat; the server drops
+        // participants it has not heard from in a while
+        socketPingTimer = setInterval(() => roomSocket && roomSocket.send('ping'), 20000);
+        // Catch up on anything missed while disconnected
+        fetchNewMessages(0).catch(error => console.error('Error loading messages:', error));
+        refreshParticipants();
+    };
+
+    roomSocket.onmessage = function(e) {
+        if (e.data === 'pong') return;
+        // The server batches a room's events per tick
+        JSON.parse(e.data).events.forEach(handleRoomEvent);
+    };
+
+    roomSocket.onclose = function() {
+        roomSocket = null;
+        clearInterval(socketPingTimer);
+        socketPingTimer = null;
+        if (roomGone) return;
+        startPolling();
+        setTimeout(connectRoomSocket, 5000);
+    };
+}
+
+function handleRoomEvent(data) {
+    switch (data.event) {
+        case 'chat.message':
+            addMessageToChat(data.message);
+            break;
+        case 'participant.removed':
+            if (data.user_id === userId) {
+                leaveRoom();
+                return;
+            }
+            removeVideoContainer(data.user_id);
+            refreshParticipants();
+            break;
+        case 'participants.removed':
+            if (data.user_ids.includes(userId)) {
+                leaveRoom();
+                return;
+            }
+            data.user_ids.forEach(removeVideoContainer);
+            refreshParticipants();
+            break;
+        case 'participant.left':
+            if (data.user_id === userId) {
+                // We were timed out while unreachable
+                leaveRoom();
+                return;
+            }
+            removeVideoContainer(data.user_id);
+            refreshParticipants();
+            break;
+        case 'participant.updated':
+            if (data.participant.user_id === userId) {
+                applyRemoteAudioState(data.participant.audio_enabled);
+            }
+            refreshParticipants();
+            break;
+        case 'participants.moderated':
+            if (data.removed_user_ids.includes(userId)) {
+                leaveRoom();
+                return;
+            }
+            data.removed_user_ids.forEach(removeVideoContainer);
+            data.participants.forEach(participant => {
+                if (participant.user_id === userId) {
+                    applyRemoteAudioState(participant.audio_enabled);
+                    if (!participant.video_enabled) applyRemoteVideoOff();
+                }
+            });
+            refreshParticipants();
+            break;
+        case 'speakers.updated':
+            applySpeakers(data);
+            break;
+        case 'participants.muted':
+            if (data.exclude_user_id !== userId) {
+                applyRemoteAudioState(false);
+            }
+            refreshParticipants();
+            break;
+        default:
+            refreshParticipants();
+    }
+}
+
+function applyRemoteAudioState(enabled) {
+    if (!localStream) return;
+    const audioTrack = localStream.getAudioTracks()[0];
+    if (audioTrack && audioTrack.enabled !== enabled) {
+        audioTrack.enabled = enabled;
+        const button = document.getElementById('toggle-audio');
+        button.style.background = enabled ? '#404040' : '#ea4335';
+        button.innerHTML = enabled ? '<i class="fas fa-microphone"></i>' : '<i class="fas fa-microphone-slash"></i>';
+        updateAudioIndicator(enabled);
+    }
+}
+
+function applyRemoteVideoOff() {
+    if (!localStream) return;
+    const videoTrack = localStream.getVideoTracks()[0];
+    if (videoTrack && videoTrack.enabled) {
+        videoTrack.enabled = false;
+        const button = document.getElementById('toggle-video');
+        button.style.background = '#ea4335';
+        button.innerHTML = '<i class="fas fa-video-slash"></i>';
+    }
+}
+
+function removeVideoContainer(targetUserId) {
+    const videoContainer = document.querySelector(`.video-container[data-user-id="${targetUserId}"]`);
+    if (videoContainer) videoContainer.remove();
+    if (peers[targetUserId]) {
+        peers[targetUserId].close();
+        delete peers[targetUserId];
+    }
+}
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
+function renderParticipant(participant) {
+    let status = '';
+    if (!participant.audio_enabled) {
+        status += '<span class="muted-indicator">🔇 Muted</span>';
+    }
+    if (!participant.video_enabled) {
+        status += '<span class="video-off-indicator">📹 Video off</span>';
+    }
+    if (participant.audio_enabled && participant.video_enabled) {
+        status += '<span style="color: #34a853;">● Online</span>';
+    }
+
+    const name = escapeHtml(participant.name);
+    let controls = '';
+    if (isAdmin && participant.user_id !== userId) {
+        controls = `
+            <div class="participant-controls">
+                <button class="control-icon mute" onclick="muteParticipant('${participant.user_id}', '${name}')" title="Mute/Unmute">
+                    <i class="fas fa-volume-mute"></i>
+                </button>
+                <button class="control-icon remove" onclick="showRemoveModal('${participant.user_id}', '${name}')" title="Remove from meeting">
+                    <i class="fas fa-user-times"></i>
+                </button>
+            </div>`;
+    }
+
+    return `
+        <div class="participant-item" data-user-id="${participant.user_id}">
+            <div class="participant-info">
+                <div class="participant-avatar">${escapeHtml(participant.name.charAt(0).toUpperCase())}</div>
+                <div class="participant-details">
+                    <div class="participant-name-text">
+                        <span class="status-indicator"></span>
+                        ${name}
+                        ${participant.user_id === roomCreatorId ? '<span class="admin-badge">Host</span>' : ''}
+                    </div>
+                    <div class="participant-role">${status}</div>
+                </div>
+            </div>
+            ${controls}
+        </div>`;
+}
+
+// Participants as of participantsVersion, in join order; refreshes only
+// ask for what changed since then
+let participantsVersion = null;
+let knownParticipants = new Map();
+
+function applyParticipants(data) {
+    if (data.participants) {
+        knownParticipants = new Map(data.participants.map(p => [p.user_id, p]));
+    } else {
+        data.removed.forEach(id => knownParticipants.delete(id));
+        data.added.concat(data.changed).forEach(p => knownParticipants.set(p.user_id, p));
+    }
+    participantsVersion = data.version;
+}
+
+async function refreshParticipants() {
+    try {
+        const query = participantsVersion === null ? '' : `?version=${participantsVersion}`;
+        const response = await fetch(`/api/room/${roomId}/participants/${query}`);
+        const data = await response.json();
+        if (!data.success) return;
+
+        applyParticipants(data);
+        const participants = Array.from(knownParticipants.values());
+        document.getElementById('participants-list').innerHTML = participants.map(renderParticipant).join('');
+        document.getElementById('participant-count').textContent = participants.length;
+    } catch (error) {
+        console.error('Error loading participants:', error);
+    }
+}
+
+// Control functions
+document.getElementById('toggle-video').addEventListener('click', function() {
+    if (localStream) {
+        const videoTrack = localStream.getVideoTracks()[0];
+        if (videoTrack) {
+            videoTrack.enabled = !videoTrack.enabled;
+            this.style.background = videoTrack.enabled ? '#404040' : '#ea4335';
+            this.innerHTML = videoTrack.enabled ? '<i class="fas fa-video"></i>' : '<i class="fas fa-video-slash"></i>';
+        }
+    }
+});
+
+document.getElementById('toggle-audio').addEventListener('click', function() {
+    if (localStream) {
+        const audioTrack = localStream.getAudioTracks()[0];
+        if (audioTrack) {
+            audioTrack.enabled = !audioTrack.enabled;
+            this.style.background = audioTrack.enabled ? '#404040' : '#ea4335';
+            this.innerHTML = audioTrack.enabled ? '<i class="fas fa-microphone"></i>' : '<i class="fas fa-microphone-slash"></i>';
+            updateAudioIndicator(audioTrack.enabled);
+        }
+    }
+});
+
+// Admin control functions
+async function muteParticipant(targetUserId, targetUserName) {
+    if (!isAdmin) return;
+    
+    try {
+        const response = await fetch(`/api/room/${roomId}/mute/${targetUserId}/`, {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': getCookie('csrftoken'),
+            }
+        });
+        
+        if (response.ok) {
+            // Show animation and reload
+            const participantItem = document.querySelector(`[data-user-id="${targetUserId}"]`);
+            if (participantItem) {
+                participantItem.classList.add('removing');
+                setTimeout(() => {
+                    location.reload();
+                }, 300);
+            } else {
+                location.reload();
+            }
+        }
+    } catch (error) {
+        console.error('Error muting participant:', error);
+    }
+}
+
+async function removeParticipant(targetUserId) {
+    if (!isAdmin) return;
+    
+    try {
+        const response = await fetch(`/api/room/${roomId}/remove/${targetUserId}/`, {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': getCookie('csrftoken'),
+            }
+        });
+        
+        if (response.ok) {
+            // Show removal animation
+            const videoContainer = document.querySelector(`.video-container[data-user-id="${targetUserId}"]`);
+            const participantItem = document.querySelector(`.participant-item[data-user-id="${targetUserId}"]`);
+            
+            if (videoContainer) videoContainer.classList.add('removing');
+            if (participantItem) participantItem.classList.add('removing');
+            
+            setTimeout(() => {
+                location.reload();
+            }, 300);
+        }
+    } catch (error) {
+        console.error('Error removing participant:', error);
+    }
+}
+
+async function muteAllParticipants() {
+    if (!isAdmin) return;
+    
+    try {
+        const response = await fetch(`/api/room/${roomId}/mute-all/`, {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': getCookie('csrftoken'),
+            }
+        });
+        
+        if (response.ok) {
+            location.reload();
+        }
+    } catch (error) {
+        console.error('Error muting all participants:', error);
+    }
+}
+
+async function removeAllParticipants() {
+    if (!isAdmin) return;
+    
+    try {
+        const response = await fetch(`/api/room/${roomId}/remove-all/`, {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': getCookie('csrftoken'),
+            }
+        });
+        
+        if (response.ok) {
+            // Show removal animations for all non-admin participants
+            const allParticipants = document.querySelectorAll('.participant-item:not([data-user-id="' + userId + '"])');
+            const allVideos = document.querySelectorAll('.video-container:not([data-user-id="' + userId + '"])');
+            
+            allParticipants.forEach(item => item.classList.add('removing'));
+            allVideos.forEach(container => container.classList.add('removing'));
+            
+            setTimeout(() => {
+                location.reload();
+            }, 300);
+        }
+    } catch (error) {
+        console.error('Error removing all participants:', error);
+    }
+}
+
+// Handle modal confirmation
+document.getElementById('confirmRemove').addEventListener('click', function() {
+    if (currentRemoveUserId === 'all') {
+        removeAllParticipants();
+    } else if (currentRemoveUserId) {
+        removeParticipant(currentRemoveUserId);
+    }
+    closeModal();
+});
+
+function leaveRoom() {
+    if (localStream) {
+        localStream.getTracks().forEach(track => track.stop());
+    }
+    if (screenStream) {
+        screenStream.getTracks().forEach(track => track.stop());
+    }
+    window.location.href = `/room/${roomId}/leave/`;
+}
+
+// Utility function to get CSRF token
+function getCookie(name) {
+    let cookieValue = null;
+    if (document.cookie && document.cookie !== '') {
+        const cookies = document.cookie.split(';');
+        for (let i = 0; i < cookies.length; i++) {
+            const cookie = cookies[i].trim();
+            if (cookie.substring(0, name.length + 1) === (name + '=')) {
+                cookieValue = decodeURIComponent(cookie.substring(name.length + 1));
+                break;
+            }
+        }
+    }
+    return cookieValue;
+}
+
+// Initialize when page loads
+document.addEventListener('DOMContentLoaded', function() {
+    initializePeer();
+    loadMessages();
+    connectRoomSocket();
+    
+    function updateParticipantCount() {
+        const count = document.querySelectorAll('.participant-item').length;
+        document.getElementById('participant-count').textContent = count;
+    }
+    
+    updateParticipantCount();
+    
+    // Auto-hide messages after 5 seconds
+    setTimeout(function() {
+        const messages = document.querySelector('.messages');
+        if (messages) {
+            messages.style.transition = 'opacity 0.5s';
+            messages.style.opacity = '0';
+            setTimeout(() => messages.remove(), 500);
+        }
+    }, 5000);
+});
@@ -0,0 +1,263 @@
+import collections
+import contextlib
+import math
+import threading
+import time
+
+from django.conf import settings
+
+from .presence import presence
+
+
+def room_capacity():
+    """Seats per room (the host's included), or None for no limit."""
+    return getattr(settings, 'ROOM_MAX_PARTICIPANTS', 10)
+
+
+def retry_after(seconds):
+    # Retry-After takes whole seconds
+    return str(max(1, math.ceil(seconds)))
+
+
+class RateLimiter:
+    """Token buckets, one per key, refilled lazily when checked.
+
+    ``setting`` names a ``(tokens per second, burst)`` pair, or None for
+    no limit; buckets start full. Buckets that have refilled are dropped
+    once more than MAX_KEYS are held, so idle users and rooms cost
+    nothing.
+    """
+
+    MAX_KEYS = 10000
+
+    def __init__(self, setting, default):
+        self.setting = setting
+        self.default = default
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> (tokens, monotonic time of that level)
+
+    def limits(self):
+        return getattr(settings, self.setting, self.default)
+
+    def _level(self, key, now, rate, burst):
+        tokens, updated = self._buckets.get(key, (burst, now))
+        return min(burst, tokens + (now - updated) * rate)
+
+    def _wait(self, key, now, limits):
+        # Callers hold the lock
+        if limits is None:
+            return 0
+        rate, burst = limits
+        tokens = self._level(key, now, rate, burst)
+        return 0 if tokens >= 1 else (1 - tokens) / rate
+
+    def _take(self, key, now, limits):
+        # Callers hold the lock
+        if limits is None:
+            return
+        rate, burst = limits
+        self._buckets[key] = (self._level(key, now, rate, burst) - 1, now)
+        if len(self._buckets) > self.MAX_KEYS:
+            self._buckets = {
+                key: bucket for key, bucket in self._buckets.items()
+                if self._level(key, now, rate, burst) < burst
+            }
+
+    def wait(self, key, now=None):
+        """Seconds until ``key`` has a token; 0 if it has one now."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return self._wait(key, now, self.limits())
+
+    def take(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._take(key, now, self.limits())
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+def acquire(checks, now=None):
+    """Take a token for every ``(limiter, key)`` in ``checks``, or for none.
+
+    Returns 0 when taken, else the seconds until all of them have one.
+    The limiters stay locked from the check to the take, so concurrent
+    requests cannot both get the last token.
+    """
+    now = time.monotonic() if now is None else now
+    limits = {limiter: limiter.limits() for limiter, _ in checks}
+    with contextlib.ExitStack() as stack:
+        # Always locked in the same order, so two acquires cannot deadlock
+        for limiter in sorted(limits, key=id):
+            stack.enter_context(limiter._lock)
+        wait = max(limiter._wait(key, now, limits[limiter]) for limiter, key in checks)
+        if not wait:
+            for limiter, key in checks:
+                limiter._take(key, now, limits[limiter])
+    return wait
+
+
+chat_user_limiter = RateLimiter('CHAT_USER_RATE', (1, 5))
+chat_room_limiter = RateLimiter('CHAT_ROOM_RATE', (20, 40))
+moderation_user_limiter = RateLimiter('MODERATION_USER_RATE', (2, 10))
+moderation_room_limiter = RateLimiter('MODERATION_ROOM_RATE', (5, 20))
+
+
+class WaitingRoom:
+    """FIFO queues of users waiting for a seat in a full room.
+
+    A waiting page polls its position, which also keeps its place; places
+    not polled for a presence timeout are skipped when their turn comes.
+    The queues live in this process, like presence and the reaper.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rooms = {}  # room_id -> OrderedDict user_id -> [name, last seen]
+
+    @staticmethod
+    def limit():
+        return getattr(settings, 'ROOM_WAITING_LIMIT', 50)
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(queue) for queue in self._rooms.values())
+
+    def waiting(self, room_id):
+        with self._lock:
+            return len(self._rooms.get(room_id, ()))
+
+    def enqueue(self, room_id, user_id, name, now=None):
+        """Queue a user (or keep their place); returns their position, or None if the queue is full."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            queue = self._rooms.get(room_id)
+            if queue is None or user_id not in queue:
+                if len(queue or ()) >= self.limit():
+                    return None
+                queue = self._rooms.setdefault(room_id, collections.OrderedDict())
+                queue[user_id] = [name, now]
+            else:
+                queue[user_id][1] = now
+            return list(queue).index(user_id) + 1
+
+    def position(self, room_id, user_id, now=None):
+        """1 for the next in line, None if not queued; also keeps their place."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            queue = self._rooms.get(room_id)
+            if queue is None or user_id not in queue:
+                return None
+            queue[user_id][1] = now
+            return list(queue).index(user_id) + 1
+
+    def pop(self, room_id, now=None):
+        """(user_id, name) of the next user still waiting, or None."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            queue = self._rooms.get(room_id)
+            while queue:
+                user_id, (name, seen) = queue.popitem(last=False)
+                if now - seen <= presence.timeout():
+                    return user_id, name
+            self._rooms.pop(room_id, None)
+            return None
+
+    def push_front(self, room_id, user_id, name, now=None):
+        # For a popped user who could not be seated after all
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            queue = self._rooms.setdefault(room_id, collections.OrderedDict())
+            queue[user_id] = [name, now]
+            queue.move_to_end(user_id, last=False)
+
+    def forget(self, room_id):
+        with self._lock:
+            self._rooms.pop(room_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._rooms.clear()
+
+
+waiting_room = WaitingRoom()
+
+
+class LoadShedder:
+    """Requests in flight and their recent latency, to refuse work early.
+
+    When more than OVERLOAD_MAX_IN_FLIGHT requests are being handled, or
+    their recent latency is past OVERLOAD_MAX_LATENCY seconds, room API
+    requests are answered 503 before any session or view work, so those
+    already admitted finish in time. The latency is a moving average that
+    halves every LATENCY_HALF_LIFE seconds without new samples, so
+    shedding stops once nothing slow is running. Long-polls are parked,
+    not worked on, so they count towards neither.
+    """
+
+    LATENCY_HALF_LIFE = 1.0
+    SMOOTHING = 0.1  # weight of each new sample
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self._latency = 0.0
+        self._updated = time.monotonic()
+        self.shed = 0
+
+    @staticmethod
+    def max_in_flight():
+        return getattr(settings, 'OVERLOAD_MAX_IN_FLIGHT', 200)
+
+    @staticmethod
+    def max_latency():
+        return getattr(settings, 'OVERLOAD_MAX_LATENCY', 2.0)
+
+    @staticmethod
+    def retry_after():
+        return getattr(settings, 'OVERLOAD_RETRY_AFTER', 1)
+
+    def latency(self, now=None):
+        now = time.monotonic() if now is None else now
+        return self._latency * 0.5 ** (max(0.0, now - self._updated) / self.LATENCY_HALF_LIFE)
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finished(self, duration, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.in_flight -= 1
+            self._latency = self.latency(now) * (1 - self.SMOOTHING) + duration * self.SMOOTHING
+            self._updated = now
+
+    def overloaded(self, now=None):
+        max_in_flight, max_latency = self.max_in_flight(), self.max_latency()
+        overloaded = (
+            (max_in_flight is not None and self.in_flight >= max_in_flight)
+            or (max_latency is not None and self.latency(now) > max_latency)
+        )
+        if overloaded:
+            with self._lock:
+                self.shed += 1
+        return overloaded
+
+    def stats(self, now=None):
+        return {'in_flight': self.in_flight, 'latency_s': round(self.latency(now), 4), 'shed': self.shed}
+
+    def reset(self):
+        with self._lock:
+            self.in_flight = 0
+            self._latency = 0.0
+            self._updated = time.monotonic()
+            self.shed = 0
+
+
+load_shedder = LoadShedder()
+
+
+def on_room_deleted(sender, room_id, **kwargs):
+    waiting_room.forget(room_id)
@@ -4,3 +4,45 @@ from django.apps import AppConfig
 class VideoAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'video_app'
+
+    def ready(self):
+        from django.core.signals import request_started
+        from django.db.backends.signals import connection_created
+
+        from . import admission, archive, checkpoint, directory, lifecycle, persistence, presence, signals, snapshots, speakers, views
+
+        # The checkpoint first: it is newer than the database and faster to load
+        request_started.connect(checkpoint.restore_on_first_request)
+
+        signals.room_changed.connect(persistence.on_room_changed)
+        signals.participant_changed.connect(persistence.on_participant_changed)
+        signals.participant_removed.connect(persistence.on_participant_removed)
+        signals.room_deleted.connect(persistence.on_room_deleted)
+        request_started.connect(persistence.restore_on_first_request)
+        # Then the room directory indexes whatever the two restored
+        request_started.connect(directory.index_on_first_request)
+
+        signals.room_changed.connect(lifecycle.on_room_changed)
+        signals.participant_changed.connect(lifecycle.on_room_activity)
+        signals.participant_removed.connect(lifecycle.on_room_activity)
+        signals.message_added.connect(lifecycle.on_room_activity)
+        signals.room_deleted.connect(views.on_room_deleted)
+
+        signals.participant_removed.connect(presence.on_participant_removed)
+        signals.room_deleted.connect(presence.on_room_deleted)
+        signals.room_deleted.connect(snapshots.on_room_deleted)
+        signals.room_deleted.connect(admission.on_room_deleted)
+        signals.participants_expired.connect(views.on_participants_expired)
+
+        signals.participant_changed.connect(speakers.on_participant_changed)
+        signals.participant_removed.connect(speakers.on_participant_removed)
+        signals.room_deleted.connect(speakers.on_room_deleted)
+
+        signals.room_changed.connect(directory.on_room_changed)
+        signals.participant_changed.connect(directory.on_participant_changed)
+        signals.participant_removed.connect(directory.on_participant_removed)
+        signals.message_added.connect(directory.on_room_activity)
+        signals.room_deleted.connect(directory.on_room_deleted)
+
+        connection_created.connect(archive.configure_sqlite)
+        signals.message_added.connect(archive.on_message_added)
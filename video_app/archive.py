@@ -0,0 +1,256 @@
+import logging
+import re
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+from .backends import get_backend
+from .models import ArchivedMessage
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'video_app_archivedmessage_fts'
+
+# Applied to every new SQLite connection. With SQLITE_WAL, WAL lets page
+# loads and searches read while the archive writes; NORMAL only syncs at
+# checkpoints, which WAL makes safe against corruption (a crash can lose
+# the last commits). Unlike the others, journal_mode is stored in the
+# database file, so it is only set when asked for.
+SQLITE_WAL_PRAGMA = ('journal_mode', 'WAL')
+SQLITE_PRAGMAS = (
+    ('synchronous', 'NORMAL'),
+    ('temp_store', 'MEMORY'),
+    ('cache_size', -32000),  # KiB
+    ('mmap_size', 256 * 1024 * 1024),
+    ('busy_timeout', 5000),  # ms
+)
+
+ARCHIVE_COLUMNS = ('room_id', 'epoch', 'seq', 'message_id', 'user_id', 'user_name', 'message', 'timestamp', 'is_system')
+_INSERT_SQL = (
+    f'INSERT OR IGNORE INTO {ArchivedMessage._meta.db_table} ({", ".join(ARCHIVE_COLUMNS)}) '
+    f'VALUES ({", ".join(["%s"] * len(ARCHIVE_COLUMNS))})'
+)
+
+# Words of a search query beyond this are ignored
+MAX_SEARCH_TERMS = 8
+
+
+def archive_enabled():
+    return getattr(settings, 'CHAT_ARCHIVE_ENABLED', False)
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = SQLITE_PRAGMAS
+    if getattr(settings, 'SQLITE_WAL', False):
+        pragmas = (SQLITE_WAL_PRAGMA, *pragmas)
+    with connection.cursor() as cursor:
+        for pragma, value in pragmas:
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+
+
+class ChatArchive:
+    """Appends chat messages to the database in batches, off the request path.
+
+    Receivers only queue the message; a daemon thread writes the queue in
+    one transaction every CHAT_ARCHIVE_INTERVAL seconds, or as soon as
+    CHAT_ARCHIVE_BATCH_SIZE messages are waiting. Messages already archived
+    (same room, epoch and seq) are skipped, so a batch can safely be
+    retried.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []  # (room_id, epoch, message dict), in send order
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def interval():
+        return getattr(settings, 'CHAT_ARCHIVE_INTERVAL', 1)
+
+    @staticmethod
+    def batch_size():
+        return getattr(settings, 'CHAT_ARCHIVE_BATCH_SIZE', 1000)
+
+    @staticmethod
+    def max_pending():
+        return getattr(settings, 'CHAT_ARCHIVE_MAX_PENDING', 100000)
+
+    def add(self, room_id, epoch, message):
+        with self._lock:
+            self._pending.append((room_id, epoch, message))
+            full = len(self._pending) >= self.batch_size()
+        self._ensure_started()
+        if full:
+            self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def clear(self):
+        with self._lock:
+            self._pending = []
+
+    def flush(self):
+        """Write every queued message now; returns the number written."""
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+
+        rows = [
+            (room_id, epoch, message['seq'], message['id'], message['user_id'], message['user_name'],
+             message['message'], message['timestamp'], message['is_system'])
+            for room_id, epoch, message in batch
+        ]
+        try:
+            with transaction.atomic():
+                self._insert(rows)
+        except Exception:
+            # Put the batch back in front of what arrived since, but never
+            # hold on to more than CHAT_ARCHIVE_MAX_PENDING messages
+            with self._lock:
+                self._pending[:0] = batch
+                dropped = len(self._pending) - self.max_pending()
+                if dropped > 0:
+                    del self._pending[:dropped]
+                    logger.warning('Chat archive is behind; dropped %d messages', dropped)
+            raise
+        return len(rows)
+
+    @staticmethod
+    def _insert(rows):
+        if connection.vendor != 'sqlite':
+            ArchivedMessage.objects.bulk_create(
+                [ArchivedMessage(**dict(zip(ARCHIVE_COLUMNS, row))) for row in rows], ignore_conflicts=True,
+            )
+            return
+        # One prepared statement for the whole batch; building it through
+        # bulk_create costs more than SQLite takes to run it
+        with connection.cursor() as cursor:
+            cursor.executemany(_INSERT_SQL, rows)
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='chat-archive', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval())
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Chat archive flush failed')
+            finally:
+                close_old_connections()
+
+
+archive = ChatArchive()
+
+
+def _as_dict(row):
+    # Same shape as the live chat API
+    return {
+        'id': row.message_id,
+        'seq': row.seq,
+        'user_id': row.user_id,
+        'user_name': row.user_name,
+        'message': row.message,
+        'timestamp': row.timestamp,
+        'is_system': row.is_system,
+    }
+
+
+def room_epoch(room_id):
+    """The epoch of the meeting now held under room_id, or None if there is none."""
+    room = get_backend().get_room(room_id)
+    # Rooms checkpointed before epochs existed match the archive's default
+    return room.get('epoch', 0) if room is not None else None
+
+
+def latest_epoch(room_id):
+    """The epoch of the last meeting archived under room_id (0 if none)."""
+    row = ArchivedMessage.objects.filter(room_id=room_id).order_by('-epoch').values_list('epoch', flat=True).first()
+    return row or 0
+
+
+def history(room_id, epoch, before=None, limit=50):
+    """A page of a meeting's archived messages with seq below ``before``.
+
+    Keyset pagination on the (room_id, epoch, seq) index, so every page
+    costs the same however far back it is. Returns (messages oldest first,
+    cursor for the previous page or None at the beginning).
+    """
+    rows = ArchivedMessage.objects.filter(room_id=room_id, epoch=epoch)
+    if before is not None:
+        rows = rows.filter(seq__lt=before)
+    rows = list(rows.order_by('-seq')[:limit + 1])
+    cursor = rows[limit - 1].seq if len(rows) > limit else None
+    return [_as_dict(row) for row in reversed(rows[:limit])], cursor
+
+
+def _fts_string(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def search_query(room_id, text):
+    """FTS5 query for messages of the room containing every word of ``text``.
+
+    The last word also matches as a prefix, for search-as-you-type. None
+    when ``text`` has no words.
+    """
+    words = re.findall(r'\w+', text)[:MAX_SEARCH_TERMS]
+    if not words:
+        return None
+    terms = [_fts_string(word) for word in words]
+    terms[-1] += '*'
+    return f'room_id : {_fts_string(room_id)} AND {" ".join(terms)}'
+
+
+def search(room_id, epoch, text, before=None, limit=20):
+    """Archived messages of a meeting matching ``text``, newest first.
+
+    ``before`` is the cursor returned with the previous page. Returns
+    (messages, cursor for the next page or None).
+    """
+    query = search_query(room_id, text)
+    if query is None or connection.vendor != 'sqlite':
+        return [], None
+
+    # The room's earlier meetings share its postings; their hits are
+    # dropped by the epoch, one primary key lookup each
+    table = ArchivedMessage._meta.db_table
+    sql = (
+        f'SELECT {FTS_TABLE}.rowid FROM {FTS_TABLE} JOIN {table} ON {table}.id = {FTS_TABLE}.rowid '
+        f'WHERE {FTS_TABLE} MATCH %s AND {table}.epoch = %s'
+    )
+    params = [query, epoch]
+    if before is not None:
+        sql += f' AND {FTS_TABLE}.rowid < %s'
+        params.append(before)
+    # The index yields rowids in order, so this stops after limit + 1 hits
+    sql += f' ORDER BY {FTS_TABLE}.rowid DESC LIMIT %s'
+    params.append(limit + 1)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        ids = [row[0] for row in cursor.fetchall()]
+
+    page = ids[:limit]
+    rows = ArchivedMessage.objects.in_bulk(page)
+    cursor = page[-1] if len(ids) > limit else None
+    return [_as_dict(rows[id]) for id in page if id in rows], cursor
+
+
+def on_message_added(sender, room_id, message, **kwargs):
+    if archive_enabled():
+        epoch = room_epoch(room_id)
+        if epoch is not None:
+            archive.add(room_id, epoch, message)
@@ -0,0 +1,21 @@
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+
+class AssetStorage(CompressedManifestStaticFilesStorage):
+    """Fingerprinted, precompressed static files.
+
+    collectstatic writes every file under a content-hashed name next to
+    gzip and (with the brotli package installed) brotli variants, so they
+    can be served with immutable cache headers. Before the first
+    collectstatic (development, tests) templates fall back to the source
+    file names instead of failing.
+    """
+
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Neither in the manifest nor collected yet
+            return name
@@ -0,0 +1,32 @@
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the configured room state backend, creating it on first use."""
+    global _backend
+    if _backend is None:
+        # Concurrent first requests must not each get a backend of their own
+        with _backend_lock:
+            if _backend is None:
+                backend_class = import_string(settings.ROOM_STATE_BACKEND)
+                _backend = backend_class(**getattr(settings, 'ROOM_STATE_OPTIONS', {}))
+    return _backend
+
+
+def reset_backend():
+    global _backend
+    _backend = None
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    if setting in ('ROOM_STATE_BACKEND', 'ROOM_STATE_OPTIONS'):
+        reset_backend()
@@ -0,0 +1,136 @@
+# Actions accepted by RoomStateBackend.moderate()
+MODERATION_ACTIONS = ('mute', 'unmute', 'disable_video', 'remove')
+
+
+def moderated_stream(audio_enabled, video_enabled, actions):
+    """The (audio_enabled, video_enabled) a participant is left with."""
+    if 'mute' in actions:
+        audio_enabled = False
+    elif 'unmute' in actions:
+        audio_enabled = True
+    if 'disable_video' in actions:
+        video_enabled = False
+    return audio_enabled, video_enabled
+
+
+class RoomStateBackend:
+    """Interface for where live room state is kept.
+
+    Rooms are plain dicts (``name``, ``created_by``, ``created_by_id``,
+    ``created_at``, ``is_active``, and ``epoch``, set when the room is
+    created so that meetings reusing an ID can be told apart);
+    participants and chat messages are returned as the same dicts the JSON
+    API sends to clients.
+    """
+
+    # True when state lives in this process and reads never block, so async
+    # views may call the backend directly on the event loop
+    in_process = False
+
+    # Seconds between re-checks while a long-poll waits for a message.
+    # None means writers in this process wake waiters directly.
+    notify_poll_interval = None
+
+    # Rooms
+    def create_room(self, room_id, name, user_id, user_name, epoch=None):
+        """Create a room with its creator as the admin participant.
+
+        ``epoch`` is only given when restoring a saved room; new rooms get
+        a fresh one. Returns the room, or None if a live room already has
+        this ID.
+        """
+        raise NotImplementedError
+
+    def get_room(self, room_id):
+        raise NotImplementedError
+
+    def room_exists(self, room_id):
+        return self.get_room(room_id) is not None
+
+    def deactivate_room(self, room_id):
+        raise NotImplementedError
+
+    def delete_room(self, room_id):
+        """Free everything kept for a room; returns whether it existed."""
+        raise NotImplementedError
+
+    def room_version(self, room_id):
+        """Changes with every change to the room or its participants.
+
+        Versions never repeat for a room ID, not even after the room is
+        deleted and re-created, so they can key caches of anything rendered
+        from that state. Chat has its own sequence numbers. 0 for unknown
+        rooms.
+        """
+        raise NotImplementedError
+
+    def stats(self):
+        """Counts for gauges: rooms, active_rooms, participants, chat_messages."""
+        raise NotImplementedError
+
+    def room_sizes(self):
+        """(participant count, chat messages kept) for every room."""
+        raise NotImplementedError
+
+    # Participants
+    def join(self, room_id, user_id, name, capacity=None):
+        """Add a participant unless present; returns (participant, created).
+
+        With ``capacity``, newcomers are only let in while the room has
+        fewer participants than that, checked and seated atomically;
+        otherwise (None, False).
+        """
+        raise NotImplementedError
+
+    def leave(self, room_id, user_id):
+        """Remove a participant; returns (participant or None, remaining count)."""
+        raise NotImplementedError
+
+    def is_participant(self, room_id, user_id):
+        raise NotImplementedError
+
+    def list_participants(self, room_id):
+        """Participants in join order, or None if the room has none tracked."""
+        raise NotImplementedError
+
+    def toggle_audio(self, room_id, user_id):
+        """Flip a participant's audio; returns the participant or None."""
+        raise NotImplementedError
+
+    def set_stream(self, room_id, user_id, video_enabled, audio_enabled):
+        raise NotImplementedError
+
+    def mute_all(self, room_id):
+        """Mute everyone but the admin; returns the participants muted."""
+        raise NotImplementedError
+
+    def remove_all(self, room_id):
+        """Remove everyone but the admin; returns the participants removed."""
+        raise NotImplementedError
+
+    def moderate(self, room_id, user_ids, actions):
+        """Apply MODERATION_ACTIONS to the given participants in one pass.
+
+        The admin and unknown user_ids are skipped, and ``remove`` wins over
+        the other actions. Returns (participants changed, participants
+        removed); participants already in the requested state are in neither.
+        """
+        raise NotImplementedError
+
+    # Chat
+    def has_chat(self, room_id):
+        raise NotImplementedError
+
+    def add_message(self, room_id, user_id, user_name, text, is_system=False):
+        """Append a chat message; returns it, or None if the room has no chat."""
+        raise NotImplementedError
+
+    def last_seq(self, room_id):
+        raise NotImplementedError
+
+    def messages_since(self, room_id, since):
+        """Messages with seq > ``since`` and the room's last seq, in one read."""
+        raise NotImplementedError
+
+    def latest_messages(self, room_id, count):
+        raise NotImplementedError
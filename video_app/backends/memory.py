@@ -0,0 +1,286 @@
+import itertools
+import threading
+import time
+
+from ..chat import ChatMessage, ChatStore
+from ..registry import ParticipantRegistry
+from .base import RoomStateBackend, moderated_stream
+
+# Shared by every room and seeded from the clock, so versions stay unique
+# across room re-creation, backend resets and restarts
+_version_clock = itertools.count(time.time_ns())
+
+
+class InMemoryRoomState(RoomStateBackend):
+    """Room state in this process's memory.
+
+    Fast, but every worker process has its own copy, so it only works when
+    the app runs as a single process.
+    """
+
+    in_process = True
+
+    def __init__(self):
+        self._locks = {}  # room_id -> threading.Lock
+        self.rooms = {}
+        self.participants = ParticipantRegistry()
+        self.chat_messages = {}  # room_id -> ChatStore
+        self.user_streams = {}  # Track user media streams
+        self.versions = {}  # room_id -> room_version()
+
+    def _lock(self, room_id):
+        # Every write to a room holds its lock, so writers of different
+        # rooms never wait on each other. Reads take no lock.
+        lock = self._locks.get(room_id)
+        if lock is None:
+            lock = self._locks.setdefault(room_id, threading.Lock())
+        return lock
+
+    # Rooms
+    def create_room(self, room_id, name, user_id, user_name, epoch=None):
+        # Claiming the ID must be atomic across request threads
+        with self._lock(room_id):
+            if room_id in self.rooms:
+                return None
+            room = self.rooms[room_id] = {
+                'name': name,
+                'created_by': user_name,
+                'created_by_id': user_id,
+                'created_at': 'now',
+                'is_active': True,
+                # Tells this meeting apart from earlier ones under the same ID
+                'epoch': time.time_ns() if epoch is None else epoch,
+            }
+            self.participants.drop_room(room_id)
+            self.participants.join(room_id, user_id, user_name, is_admin=True)
+            self.chat_messages[room_id] = ChatStore()
+            self.user_streams[room_id] = {}
+            self._bump(room_id)
+        return room
+
+    def get_room(self, room_id):
+        return self.rooms.get(room_id)
+
+    def room_exists(self, room_id):
+        return room_id in self.rooms
+
+    def deactivate_room(self, room_id):
+        with self._lock(room_id):
+            if room_id in self.rooms:
+                self.rooms[room_id]['is_active'] = False
+                self._bump(room_id)
+
+    def delete_room(self, room_id):
+        with self._lock(room_id):
+            existed = self.rooms.pop(room_id, None) is not None
+            self.participants.drop_room(room_id)
+            self.chat_messages.pop(room_id, None)
+            self.user_streams.pop(room_id, None)
+            self.versions.pop(room_id, None)
+            self._locks.pop(room_id, None)
+        return existed
+
+    def room_version(self, room_id):
+        return self.versions.get(room_id, 0)
+
+    def _bump(self, room_id):
+        # After the change it stands for: a reader that sees the old version
+        # may render new state under it, never the reverse
+        self.versions[room_id] = next(_version_clock)
+
+    def stats(self):
+        return {
+            'rooms': len(self.rooms),
+            'active_rooms': sum(1 for room in list(self.rooms.values()) if room['is_active']),
+            'participants': sum(self.participants.count(room_id) for room_id in list(self.rooms)),
+            'chat_messages': sum(len(store) for store in list(self.chat_messages.values())),
+        }
+
+    def room_sizes(self):
+        sizes = []
+        for room_id in list(self.rooms):
+            store = self.chat_messages.get(room_id)
+            sizes.append((self.participants.count(room_id), len(store) if store else 0))
+        return sizes
+
+    # Participants
+    def join(self, room_id, user_id, name, capacity=None):
+        with self._lock(room_id):
+            if (capacity is not None and not self.participants.contains(room_id, user_id)
+                    and self.participants.count(room_id) >= capacity):
+                return None, False
+            # The host stays admin when they leave and come back
+            room = self.rooms.get(room_id)
+            is_admin = room is not None and room['created_by_id'] == user_id
+            participant, created = self.participants.join(room_id, user_id, name, is_admin)
+            if room_id not in self.chat_messages:
+                self.chat_messages[room_id] = ChatStore()
+            self.user_streams.setdefault(room_id, {})
+            if created:
+                self._bump(room_id)
+            return participant.as_dict(), created
+
+    def leave(self, room_id, user_id):
+        with self._lock(room_id):
+            participant = self.participants.leave(room_id, user_id)
+            if room_id in self.user_streams:
+                self.user_streams[room_id].pop(user_id, None)
+            remaining = self.participants.count(room_id)
+            if participant:
+                self._bump(room_id)
+        return (participant.as_dict() if participant else None), remaining
+
+    def is_participant(self, room_id, user_id):
+        return self.participants.contains(room_id, user_id)
+
+    def list_participants(self, room_id):
+        room = self.participants.room(room_id)
+        return room.as_list() if room is not None else None
+
+    def toggle_audio(self, room_id, user_id):
+        with self._lock(room_id):
+            participant = self.participants.get(room_id, user_id)
+            if participant is None:
+                return None
+            participant.audio_enabled = not participant.audio_enabled
+            self._bump(room_id)
+            return participant.as_dict()
+
+    def set_stream(self, room_id, user_id, video_enabled, audio_enabled):
+        with self._lock(room_id):
+            participant = self.participants.get(room_id, user_id)
+            if participant is None:
+                return None
+            participant.video_enabled = video_enabled
+            participant.audio_enabled = audio_enabled
+            self._bump(room_id)
+            return participant.as_dict()
+
+    def mute_all(self, room_id):
+        with self._lock(room_id):
+            room = self.participants.room(room_id)
+            if room is None:
+                return []
+
+            muted = []
+            for participant in room:
+                # Don't mute the admin, and only mute if not already muted
+                if participant is not room.admin and participant.audio_enabled:
+                    participant.audio_enabled = False
+                    muted.append(participant.as_dict())
+            if muted:
+                self._bump(room_id)
+        return muted
+
+    def remove_all(self, room_id):
+        with self._lock(room_id):
+            room = self.participants.room(room_id)
+            if room is None:
+                return []
+
+            removed = room.remove_all_except_admin()
+            if room_id in self.user_streams:
+                admin_user_id = self.rooms[room_id]['created_by_id']
+                self.user_streams[room_id] = {admin_user_id: self.user_streams[room_id].get(admin_user_id)}
+            if removed:
+                self._bump(room_id)
+        return [p.as_dict() for p in removed]
+
+    def moderate(self, room_id, user_ids, actions):
+        with self._lock(room_id):
+            room = self.participants.room(room_id)
+            if room is None:
+                return [], []
+
+            changed, removed = [], []
+            streams = self.user_streams.get(room_id, {})
+            for user_id in user_ids:
+                participant = room.get(user_id)
+                if participant is None or participant is room.admin:
+                    continue
+                if 'remove' in actions:
+                    room.remove(user_id)
+                    streams.pop(user_id, None)
+                    removed.append(participant.as_dict())
+                    continue
+                state = moderated_stream(participant.audio_enabled, participant.video_enabled, actions)
+                if state != (participant.audio_enabled, participant.video_enabled):
+                    participant.audio_enabled, participant.video_enabled = state
+                    changed.append(participant.as_dict())
+            if changed or removed:
+                self._bump(room_id)
+        return changed, removed
+
+    # Chat
+    def has_chat(self, room_id):
+        return room_id in self.chat_messages
+
+    def add_message(self, room_id, user_id, user_name, text, is_system=False):
+        with self._lock(room_id):
+            store = self.chat_messages.get(room_id)
+            if store is None:
+                return None
+            message = store.append(user_id, user_name, text, is_system)
+        return message.as_dict()
+
+    def last_seq(self, room_id):
+        store = self.chat_messages.get(room_id)
+        return store.last_seq if store else 0
+
+    def messages_since(self, room_id, since):
+        store = self.chat_messages.get(room_id)
+        if store is None:
+            return [], 0
+        last_seq = store.last_seq
+        return [m.as_dict() for m in store.since(since, last_seq)], last_seq
+
+    def latest_messages(self, room_id, count):
+        store = self.chat_messages.get(room_id)
+        return [m.as_dict() for m in store.latest(count)] if store else []
+
+    # Checkpoints
+    def export_room(self, room_id):
+        """Everything kept for room_id as plain lists, or None if it is gone.
+
+        ``[room_id, room, version, participants, chat capacity, last_seq,
+        messages]``; taken under the room's lock, so it is one consistent
+        state of the room.
+        """
+        with self._lock(room_id):
+            room = self.rooms.get(room_id)
+            if room is None:
+                return None
+            participants = self.participants.room(room_id) or ()
+            store = self.chat_messages.get(room_id) or ChatStore()
+            return [
+                room_id, dict(room), self.versions.get(room_id, 0),
+                [[p.user_id, p.name, p.is_admin, p.video_enabled, p.audio_enabled] for p in participants],
+                store.capacity, store.last_seq,
+                [[m.seq, m.id, m.user_id, m.user_name, m.message, m.timestamp, m.is_system] for m in store],
+            ]
+
+    def restore_messages(self, room_id, messages):
+        """Put back a room's latest chat messages (dicts, oldest first); new ones are numbered after them."""
+        with self._lock(room_id):
+            self.chat_messages[room_id] = ChatStore.restore(None, messages[-1]['seq'] if messages else 0, [
+                ChatMessage(m['seq'], m['user_id'], m['user_name'], m['message'], m['is_system'],
+                            id=m['id'], timestamp=m['timestamp'])
+                for m in messages
+            ])
+
+    def import_room(self, record):
+        """Put back a room from export_room(), replacing any room under its ID."""
+        room_id, room, version, participants, capacity, last_seq, messages = record
+        with self._lock(room_id):
+            self.rooms[room_id] = room
+            self.participants.drop_room(room_id)
+            registry = self.participants.ensure_room(room_id)
+            for user_id, name, is_admin, video_enabled, audio_enabled in participants:
+                participant, _ = registry.add(user_id, name, is_admin)
+                participant.video_enabled, participant.audio_enabled = video_enabled, audio_enabled
+            self.chat_messages[room_id] = ChatStore.restore(capacity, last_seq, [
+                ChatMessage(seq, user_id, user_name, text, is_system, id=message_id, timestamp=timestamp)
+                for seq, message_id, user_id, user_name, text, timestamp, is_system in messages
+            ])
+            self.user_streams[room_id] = {}
+            self.versions[room_id] = version
@@ -0,0 +1,338 @@
+import json
+import time
+
+import redis
+
+from ..chat import ChatMessage, history_limit
+from .base import RoomStateBackend, moderated_stream
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':'))
+
+
+class RedisRoomState(RoomStateBackend):
+    """Room state in Redis, shared by every worker process.
+
+    Each room lives under its own hash-tagged keys, so a room's keys land on
+    one node of a cluster:
+
+    * ``room:{id}``              hash of room fields
+    * ``room:{id}:participants`` hash user_id -> participant JSON
+    * ``room:{id}:streams``      hash of user media streams
+    * ``room:{id}:seq``          last chat sequence number
+    * ``room:{id}:chat``         sorted set of message JSON scored by seq
+    * ``room:{id}:version``      room_version(), seeded from the clock
+
+    Reads of the hot endpoints are a single pipelined round-trip; writes
+    that must read first use optimistic WATCH/MULTI transactions.
+
+    Only the room state is shared: the settings move the channel layer to
+    Redis along with it, but PeerJS signaling stays in each process.
+    """
+
+    # Long-polls cannot be woken by writers on other workers, so they
+    # re-check the sequence number this often
+    notify_poll_interval = 1
+
+    def __init__(self, url='redis://127.0.0.1:6379/0', client=None, prefix='meet', ttl=24 * 3600):
+        self.client = client or redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _key(self, room_id, suffix=''):
+        return f'{self.prefix}:room:{{{room_id}}}{suffix}'
+
+    def _keys(self, room_id):
+        return [self._key(room_id, suffix) for suffix in ('', ':participants', ':streams', ':seq', ':chat', ':version')]
+
+    def _expire(self, pipe, room_id):
+        for key in self._keys(room_id):
+            pipe.expire(key, self.ttl)
+
+    @staticmethod
+    def _new_participant(user_id, name, is_admin=False):
+        return {
+            'user_id': user_id,
+            'name': name,
+            'is_admin': is_admin,
+            'video_enabled': True,
+            'audio_enabled': True,
+            # Join order for display; hashes are unordered
+            'order': time.time_ns(),
+        }
+
+    @staticmethod
+    def _public(record):
+        record.pop('order', None)
+        return record
+
+    def _sorted(self, raw_participants):
+        records = sorted((json.loads(raw) for raw in raw_participants.values()), key=lambda p: p['order'])
+        return [self._public(p) for p in records]
+
+    # Rooms
+    def create_room(self, room_id, name, user_id, user_name, epoch=None):
+        room = {
+            'name': name,
+            'created_by': user_name,
+            'created_by_id': user_id,
+            'created_at': 'now',
+            'is_active': True,
+            # Tells this meeting apart from earlier ones under the same ID
+            'epoch': time.time_ns() if epoch is None else epoch,
+        }
+        participant = self._new_participant(user_id, user_name, is_admin=True)
+
+        # Claim the ID first; HSETNX is atomic across workers
+        if not self.client.hsetnx(self._key(room_id), 'created_by_id', user_id):
+            return None
+
+        pipe = self.client.pipeline()
+        pipe.delete(*self._keys(room_id)[1:])
+        pipe.hset(self._key(room_id), mapping={**room, 'is_active': 1})
+        pipe.hset(self._key(room_id, ':participants'), user_id, _dumps(participant))
+        pipe.set(self._key(room_id, ':seq'), 0)
+        # Not 0, so versions of a deleted room with this ID never come back
+        pipe.set(self._key(room_id, ':version'), time.time_ns())
+        self._expire(pipe, room_id)
+        pipe.execute()
+        return room
+
+    def get_room(self, room_id):
+        room = self.client.hgetall(self._key(room_id))
+        if not room:
+            return None
+        room['is_active'] = room.get('is_active') == '1'
+        room['epoch'] = int(room.get('epoch', 0))
+        return room
+
+    def room_exists(self, room_id):
+        return bool(self.client.exists(self._key(room_id)))
+
+    def deactivate_room(self, room_id):
+        def deactivate(pipe):
+            if pipe.exists(self._key(room_id)):
+                pipe.multi()
+                pipe.hset(self._key(room_id), 'is_active', 0)
+                pipe.incr(self._key(room_id, ':version'))
+
+        self.client.transaction(deactivate, self._key(room_id))
+
+    def delete_room(self, room_id):
+        return bool(self.client.delete(*self._keys(room_id)))
+
+    def room_version(self, room_id):
+        return int(self.client.get(self._key(room_id, ':version')) or 0)
+
+    def _scan_rooms(self):
+        # Key expiry does the reaping here; walk rooms with a SCAN so the
+        # server is never blocked. Yields (is_active, participants, messages).
+        for key in self.client.scan_iter(match=f'{self.prefix}:room:{{*}}', count=1000):
+            room_id = key[len(f'{self.prefix}:room:{{'):-1]
+            pipe = self.client.pipeline()
+            pipe.hget(key, 'is_active')
+            pipe.hlen(self._key(room_id, ':participants'))
+            pipe.zcard(self._key(room_id, ':chat'))
+            is_active, participant_count, message_count = pipe.execute()
+            yield is_active == '1', participant_count, message_count
+
+    def stats(self):
+        rooms = active_rooms = participants = chat_messages = 0
+        for is_active, participant_count, message_count in self._scan_rooms():
+            rooms += 1
+            active_rooms += is_active
+            participants += participant_count
+            chat_messages += message_count
+        return {
+            'rooms': rooms,
+            'active_rooms': active_rooms,
+            'participants': participants,
+            'chat_messages': chat_messages,
+        }
+
+    def room_sizes(self):
+        return [(participants, messages) for _, participants, messages in self._scan_rooms()]
+
+    # Participants
+    def join(self, room_id, user_id, name, capacity=None):
+        key = self._key(room_id, ':participants')
+
+        def seat(pipe):
+            # Count and seat in one transaction, so workers cannot both
+            # take the last seat
+            raw = pipe.hget(key, user_id)
+            if raw is None and capacity is not None and pipe.hlen(key) >= capacity:
+                return None, False
+            # The host stays admin when they leave and come back
+            is_admin = raw is None and pipe.hget(self._key(room_id), 'created_by_id') == user_id
+            pipe.multi()
+            created = raw is None
+            if created:
+                raw = _dumps(self._new_participant(user_id, name, is_admin))
+                pipe.hset(key, user_id, raw)
+                pipe.incr(self._key(room_id, ':version'))
+            self._expire(pipe, room_id)
+            return raw, created
+
+        raw, created = self.client.transaction(seat, key, value_from_callable=True)
+        return (self._public(json.loads(raw)) if raw else None), created
+
+    def leave(self, room_id, user_id):
+        key = self._key(room_id, ':participants')
+        pipe = self.client.pipeline()
+        pipe.hget(key, user_id)
+        pipe.hdel(key, user_id)
+        pipe.hdel(self._key(room_id, ':streams'), user_id)
+        pipe.hlen(key)
+        raw, _, _, remaining = pipe.execute()
+        if raw:
+            self.client.incr(self._key(room_id, ':version'))
+        return (self._public(json.loads(raw)) if raw else None), remaining
+
+    def is_participant(self, room_id, user_id):
+        return bool(self.client.hexists(self._key(room_id, ':participants'), user_id))
+
+    def list_participants(self, room_id):
+        pipe = self.client.pipeline()
+        pipe.exists(self._key(room_id))
+        pipe.hgetall(self._key(room_id, ':participants'))
+        exists, raw_participants = pipe.execute()
+        if not exists:
+            return None
+        return self._sorted(raw_participants)
+
+    def _update_participant(self, room_id, user_id, update):
+        key = self._key(room_id, ':participants')
+
+        def apply(pipe):
+            raw = pipe.hget(key, user_id)
+            if raw is None:
+                return None
+            record = json.loads(raw)
+            update(record)
+            pipe.multi()
+            pipe.hset(key, user_id, _dumps(record))
+            pipe.incr(self._key(room_id, ':version'))
+            return record
+
+        record = self.client.transaction(apply, key, value_from_callable=True)
+        return self._public(record) if record else None
+
+    def toggle_audio(self, room_id, user_id):
+        def toggle(record):
+            record['audio_enabled'] = not record['audio_enabled']
+
+        return self._update_participant(room_id, user_id, toggle)
+
+    def set_stream(self, room_id, user_id, video_enabled, audio_enabled):
+        def update(record):
+            record['video_enabled'] = video_enabled
+            record['audio_enabled'] = audio_enabled
+
+        return self._update_participant(room_id, user_id, update)
+
+    def mute_all(self, room_id):
+        key = self._key(room_id, ':participants')
+
+        def mute(pipe):
+            records = [json.loads(raw) for raw in pipe.hgetall(key).values()]
+            muted = [p for p in records if not p['is_admin'] and p['audio_enabled']]
+            pipe.multi()
+            for participant in muted:
+                participant['audio_enabled'] = False
+            if muted:
+                pipe.hset(key, mapping={p['user_id']: _dumps(p) for p in muted})
+                pipe.incr(self._key(room_id, ':version'))
+            return muted
+
+        muted = self.client.transaction(mute, key, value_from_callable=True)
+        return [self._public(p) for p in sorted(muted, key=lambda p: p['order'])]
+
+    def remove_all(self, room_id):
+        key = self._key(room_id, ':participants')
+
+        def remove(pipe):
+            records = [json.loads(raw) for raw in pipe.hgetall(key).values()]
+            removed = [p for p in records if not p['is_admin']]
+            pipe.multi()
+            if removed:
+                user_ids = [p['user_id'] for p in removed]
+                pipe.hdel(key, *user_ids)
+                pipe.hdel(self._key(room_id, ':streams'), *user_ids)
+                pipe.incr(self._key(room_id, ':version'))
+            return removed
+
+        removed = self.client.transaction(remove, key, value_from_callable=True)
+        return [self._public(p) for p in sorted(removed, key=lambda p: p['order'])]
+
+    def moderate(self, room_id, user_ids, actions):
+        key = self._key(room_id, ':participants')
+        user_ids = list(user_ids)
+        if not user_ids:
+            return [], []
+
+        def apply(pipe):
+            records = [json.loads(raw) for raw in pipe.hmget(key, user_ids) if raw is not None]
+            records = [p for p in records if not p['is_admin']]
+            changed, removed = [], []
+            for participant in records:
+                if 'remove' in actions:
+                    removed.append(participant)
+                    continue
+                state = moderated_stream(participant['audio_enabled'], participant['video_enabled'], actions)
+                if state != (participant['audio_enabled'], participant['video_enabled']):
+                    participant['audio_enabled'], participant['video_enabled'] = state
+                    changed.append(participant)
+
+            pipe.multi()
+            if changed:
+                pipe.hset(key, mapping={p['user_id']: _dumps(p) for p in changed})
+            if removed:
+                removed_ids = [p['user_id'] for p in removed]
+                pipe.hdel(key, *removed_ids)
+                pipe.hdel(self._key(room_id, ':streams'), *removed_ids)
+            if changed or removed:
+                pipe.incr(self._key(room_id, ':version'))
+            return changed, removed
+
+        changed, removed = self.client.transaction(apply, key, value_from_callable=True)
+        return [self._public(p) for p in changed], [self._public(p) for p in removed]
+
+    # Chat
+    def has_chat(self, room_id):
+        return self.room_exists(room_id)
+
+    def add_message(self, room_id, user_id, user_name, text, is_system=False):
+        seq_key, chat_key = self._key(room_id, ':seq'), self._key(room_id, ':chat')
+
+        # Numbering and storing in one transaction: a reader must never see
+        # a sequence number before its message is in the chat
+        def append(pipe):
+            if not pipe.exists(self._key(room_id)):
+                return None
+            seq = int(pipe.get(seq_key) or 0) + 1
+            message = ChatMessage(seq, user_id, user_name, text, is_system).as_dict()
+            pipe.multi()
+            pipe.set(seq_key, seq)
+            pipe.zadd(chat_key, {_dumps(message): seq})
+            # Same retention policy as the in-memory ring buffer
+            pipe.zremrangebyrank(chat_key, 0, -history_limit() - 1)
+            self._expire(pipe, room_id)
+            return message
+
+        return self.client.transaction(append, self._key(room_id), seq_key, value_from_callable=True)
+
+    def last_seq(self, room_id):
+        return int(self.client.get(self._key(room_id, ':seq')) or 0)
+
+    def messages_since(self, room_id, since):
+        pipe = self.client.pipeline()
+        pipe.get(self._key(room_id, ':seq'))
+        pipe.zrangebyscore(self._key(room_id, ':chat'), f'({since}', '+inf')
+        last_seq, raw_messages = pipe.execute()
+        return [json.loads(raw) for raw in raw_messages], int(last_seq or 0)
+
+    def latest_messages(self, room_id, count):
+        raw_messages = self.client.zrange(self._key(room_id, ':chat'), -count, -1)
+        return [json.loads(raw) for raw in raw_messages]
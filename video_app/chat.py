@@ -0,0 +1,94 @@
+import uuid
+from datetime import datetime
+
+from django.conf import settings
+
+
+def history_limit():
+    # One retention policy for every writer, user and system messages alike
+    return getattr(settings, 'CHAT_HISTORY_LIMIT', 100)
+
+
+class ChatMessage:
+    __slots__ = ('seq', 'id', 'user_id', 'user_name', 'message', 'timestamp', 'is_system')
+
+    def __init__(self, seq, user_id, user_name, message, is_system=False, id=None, timestamp=None):
+        self.seq = seq
+        self.id = id or str(uuid.uuid4())
+        self.user_id = user_id
+        self.user_name = user_name
+        self.message = message
+        self.timestamp = timestamp or datetime.now().strftime('%H:%M:%S')
+        self.is_system = is_system
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'seq': self.seq,
+            'user_id': self.user_id,
+            'user_name': self.user_name,
+            'message': self.message,
+            'timestamp': self.timestamp,
+            'is_system': self.is_system,
+        }
+
+
+class ChatStore:
+    """A room's chat history in a fixed-capacity ring buffer.
+
+    Sequence numbers are contiguous, so the message with sequence ``seq``
+    always lives in slot ``(seq - 1) % capacity``. Appending overwrites the
+    oldest slot once the buffer is full, and range reads are plain index
+    arithmetic.
+    """
+
+    __slots__ = ('capacity', 'last_seq', '_slots')
+
+    def __init__(self, capacity=None):
+        self.capacity = max(1, capacity or history_limit())
+        self.last_seq = 0
+        self._slots = [None] * self.capacity
+
+    def __len__(self):
+        return min(self.last_seq, self.capacity)
+
+    @property
+    def first_seq(self):
+        return self.last_seq - len(self) + 1
+
+    def append(self, user_id, user_name, text, is_system=False):
+        # Readers may run on another thread: fill the slot before publishing
+        # the new sequence number. Writers must not run concurrently
+        # (backends hold the room's lock).
+        seq = self.last_seq + 1
+        message = ChatMessage(seq, user_id, user_name, text, is_system)
+        self._slots[(seq - 1) % self.capacity] = message
+        self.last_seq = seq
+        return message
+
+    @classmethod
+    def restore(cls, capacity, last_seq, messages):
+        """A store holding ``messages`` (ChatMessages, oldest first) up to ``last_seq``."""
+        store = cls(capacity)
+        for message in messages[-store.capacity:]:
+            store._slots[(message.seq - 1) % store.capacity] = message
+        store.last_seq = last_seq
+        return store
+
+    def since(self, seq, last_seq=None):
+        """Messages with a sequence number greater than ``seq``, oldest first.
+
+        Up to ``last_seq`` if given, a value of last_seq the caller read
+        earlier, so it can report the same one.
+        """
+        last_seq = self.last_seq if last_seq is None else last_seq
+        start = max(seq + 1, last_seq - min(last_seq, self.capacity) + 1)
+        messages = [self._slots[(s - 1) % self.capacity] for s in range(start, last_seq + 1)]
+        # Skip slots a concurrent append recycled for a newer message
+        return [m for m in messages if m.seq <= last_seq]
+
+    def latest(self, count):
+        return self.since(self.last_seq - count)
+
+    def __iter__(self):
+        return iter(self.since(0))
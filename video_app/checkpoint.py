@@ -0,0 +1,201 @@
+import atexit
+import gc
+import logging
+import mmap
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.signals import request_started
+
+from .backends import get_backend
+from .lifecycle import reaper
+from .presence import presence
+from .sharding import owns_room, shard_name, sharding_enabled
+from .snapshots import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+FORMAT = 1
+
+
+def checkpoint_enabled():
+    return getattr(settings, 'ROOM_CHECKPOINT_ENABLED', False)
+
+
+class Checkpointer:
+    """Periodic snapshots of the in-memory room state, for fast restarts.
+
+    Every ROOM_CHECKPOINT_INTERVAL seconds a daemon thread writes all rooms
+    (participants and chat history included) to ROOM_CHECKPOINT_PATH, one
+    JSON line per room after a header line. A room is copied under its
+    lock, which is held for the copy only, and only rooms whose version or
+    chat changed since the last checkpoint are encoded again; the others
+    reuse their line. The file is written under a temporary name and
+    renamed over the previous one, so a crash mid-write leaves that one.
+    With ROOM_SHARDS each worker writes its own file, the shard name
+    appended to the path.
+
+    On restart the file is read through mmap before the first request and
+    the rooms are put back as they were, each participant given one
+    presence timeout to reconnect. Checkpoints older than
+    ROOM_CHECKPOINT_MAX_AGE seconds are ignored.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()  # one writer at a time
+        self._encoded = {}  # room_id -> ((version, last_seq), line)
+        self._thread = None
+        self.stats = {'rooms': 0, 'encoded': 0, 'bytes': 0, 'duration_s': 0.0, 'written_at': None}
+
+    @staticmethod
+    def path():
+        path = Path(getattr(settings, 'ROOM_CHECKPOINT_PATH', settings.BASE_DIR / 'room_state.checkpoint'))
+        if sharding_enabled():
+            # Each shard checkpoints only the rooms it owns
+            path = path.with_name(f'{path.name}.{shard_name()}')
+        return path
+
+    @staticmethod
+    def interval():
+        return getattr(settings, 'ROOM_CHECKPOINT_INTERVAL', 2)
+
+    @staticmethod
+    def max_age():
+        return getattr(settings, 'ROOM_CHECKPOINT_MAX_AGE', 600)
+
+    def write(self, backend=None):
+        """Write a checkpoint now; returns the number of rooms in it."""
+        backend = backend or get_backend()
+        started = time.perf_counter()
+        with self._lock:
+            encoded, changed = {}, 0
+            for room_id in list(backend.rooms):
+                key = (backend.room_version(room_id), backend.last_seq(room_id))
+                entry = self._encoded.get(room_id)
+                if entry is None or entry[0] != key:
+                    record = backend.export_room(room_id)
+                    if record is None:
+                        continue  # deleted meanwhile
+                    entry = (key, dumps(record))
+                    changed += 1
+                encoded[room_id] = entry
+
+            path = self.path()
+            if not changed and encoded.keys() == self._encoded.keys() and path.exists():
+                # Nothing to write; mark the checkpoint as still current
+                os.utime(path)
+            else:
+                header = dumps({'format': FORMAT, 'rooms': len(encoded), 'written_at': time.time()})
+                # A name of its own, so no other writer can truncate it
+                output = tempfile.NamedTemporaryFile(dir=path.parent, prefix=path.name + '.', suffix='.tmp', delete=False)
+                try:
+                    with output:
+                        output.write(b'\n'.join([header, *(line for _, line in encoded.values())]) + b'\n')
+                        output.flush()
+                        os.fsync(output.fileno())
+                    os.replace(output.name, path)
+                except BaseException:
+                    os.unlink(output.name)
+                    raise
+                self.stats['bytes'] = path.stat().st_size
+            self._encoded = encoded
+
+            self.stats.update(
+                rooms=len(encoded), encoded=changed, written_at=time.time(),
+                duration_s=round(time.perf_counter() - started, 6),
+            )
+        return len(encoded)
+
+    def restore(self, backend=None):
+        """Load the last checkpoint into the backend; returns the rooms restored.
+
+        Rooms the backend already has, and rooms another shard owns, are
+        skipped.
+        """
+        backend = backend or get_backend()
+        try:
+            checkpoint = open(self.path(), 'rb')
+        except FileNotFoundError:
+            return 0
+
+        with checkpoint:
+            stat = os.fstat(checkpoint.fileno())
+            if not stat.st_size or time.time() - stat.st_mtime > self.max_age():
+                return 0
+            # Hundreds of thousands of long-lived objects are made at once;
+            # the cycle collector would keep re-scanning them all meanwhile
+            collecting = gc.isenabled()
+            gc.disable()
+            try:
+                with mmap.mmap(checkpoint.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    return self._load(backend, data)
+            finally:
+                if collecting:
+                    gc.enable()
+
+    def _load(self, backend, data):
+        if loads(data.readline()).get('format') != FORMAT:
+            return 0
+        restored = 0
+        for line in iter(data.readline, b''):
+            record = loads(line)
+            room_id = record[0]
+            if not owns_room(room_id) or backend.room_exists(room_id):
+                continue
+            backend.import_room(record)
+            for participant in record[3]:
+                presence.seen(room_id, participant[0])
+            if record[1]['is_active']:
+                reaper.touch(room_id)
+            else:
+                reaper.deactivated(room_id)
+            restored += 1
+        return restored
+
+    def clear(self):
+        with self._lock:
+            self._encoded = {}
+
+    def start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='room-checkpoint', daemon=True)
+                    self._thread.start()
+                    # A deploy stops the server cleanly: checkpoint what it had
+                    atexit.register(self._write_logged)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval())
+            self._write_logged()
+
+    def _write_logged(self):
+        try:
+            self.write()
+        except OSError:
+            logger.exception('Could not write a room state checkpoint')
+
+
+checkpointer = Checkpointer()
+
+
+def restore_on_first_request(sender, **kwargs):
+    # Runs once, before the first request and before the database restore,
+    # which then only adds the rooms missing from the checkpoint
+    request_started.disconnect(restore_on_first_request)
+    if not checkpoint_enabled() or not get_backend().in_process:
+        return
+    started = time.perf_counter()
+    try:
+        count = checkpointer.restore()
+    except (OSError, ValueError, TypeError, KeyError, IndexError):
+        logger.exception('Could not restore rooms from the checkpoint')
+        count = 0
+    if count:
+        logger.info('Restored %d rooms from the checkpoint in %.3fs', count, time.perf_counter() - started)
+    checkpointer.start()
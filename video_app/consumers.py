@@ -0,0 +1,250 @@
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+
+from .backends import get_backend
+from .events import room_group_name
+from .fanout import fanout
+from .presence import heartbeat
+from .sharding import owns_room
+from .speakers import parse_levels, report_levels
+
+
+class RoomConsumer(AsyncWebsocketConsumer):
+    """Per-room event bus.
+
+    Pushes chat messages and join/leave/mute/remove events to everyone in
+    the room, so the page does not have to poll for them. Events arrive in
+    ``{"events": [...]}`` batches, see fanout.FanoutScheduler.
+    """
+
+    async def connect(self):
+        self.room_id = self.scope['url_route']['kwargs']['room_id']
+        if not owns_room(self.room_id):
+            # Its events are sent by the worker that owns it
+            await self.close()
+            return
+        self.user_id = await self.get_session_user_id()
+
+        # Only participants of an existing room may subscribe
+        user_in_room = self.user_id and await self.is_participant()
+        if not user_in_room:
+            await self.close()
+            return
+
+        self.group_name = room_group_name(self.room_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        fanout.attach()
+        heartbeat(self.room_id, self.user_id)
+
+    @database_sync_to_async
+    def get_session_user_id(self):
+        # Loading the session may hit the database
+        session = self.scope.get('session')
+        return session.get('user_id') if session is not None else None
+
+    @sync_to_async
+    def is_participant(self):
+        return get_backend().is_participant(self.room_id, self.user_id)
+
+    async def disconnect(self, code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # Clients send their periodic ping, which keeps intermediaries from
+        # idling us out and doubles as the presence heartbeat, and their
+        # audio levels; everything else comes in through the views
+        if text_data == 'ping':
+            heartbeat(self.room_id, self.user_id)
+            await self.send(text_data='pong')
+        elif text_data and text_data.startswith('{'):
+            try:
+                report = json.loads(text_data)
+                levels = parse_levels(report['levels'])
+                pin = report.get('pin')
+            except (ValueError, TypeError, KeyError, AttributeError):
+                return
+            if levels is not None:
+                await self.report_levels(levels, pin if isinstance(pin, str) else None)
+
+    async def report_levels(self, levels, pin):
+        # The new order comes back as a speakers.updated event to the whole room
+        if get_backend().in_process:
+            report_levels(self.room_id, self.user_id, levels, pin)
+        else:
+            await sync_to_async(report_levels)(self.room_id, self.user_id, levels, pin)
+
+    async def room_batch(self, event):
+        # Already encoded once by the fan-out scheduler for the whole room
+        await self.send(text_data=event['text'])
+
+
+# PeerJS signaling: connected peers and messages waiting for a peer that has
+# not connected yet, both keyed by (room_id, peer_id). Peers of one room can
+# only ever reach each other, since the room is part of every lookup. Both
+# live in this process: peers connected to different workers never see
+# each other, which is why a room's sockets must all reach its owner
+# (ROOM_SHARDS) when several workers run.
+signaling_peers = {}  # -> (channel_name, token)
+pending_signals = {}  # -> [message, ...]
+
+RELAYED_SIGNALS = ('OFFER', 'ANSWER', 'CANDIDATE', 'LEAVE')
+
+
+class PeerSignalingConsumer(AsyncWebsocketConsumer):
+    """Signaling server speaking the PeerJS server protocol.
+
+    Clients connect with ``new Peer(userId, {key: roomId, path: '/peerjs', ...})``:
+    the PeerJS ``key`` carries the room ID and the peer ID must be the
+    session's user_id, so only participants of a room can signal each other.
+    OFFER/ANSWER/CANDIDATE/LEAVE are relayed to ``dst`` with ``src`` filled
+    in; messages for a participant who has not connected yet are held for
+    PEERJS_EXPIRE_TIMEOUT seconds and then answered with EXPIRE. A peer that
+    sends nothing (not even HEARTBEAT) for PEERJS_ALIVE_TIMEOUT is dropped.
+    """
+
+    async def connect(self):
+        query = parse_qs(self.scope['query_string'].decode())
+        self.peer_id = query.get('id', [''])[0]
+        self.room_id = query.get('key', [''])[0]
+        self.token = query.get('token', [''])[0]
+        self.alive_timer = None
+
+        # PeerJS expects errors as messages on an accepted socket
+        await self.accept()
+
+        if not self.peer_id or not self.token or not self.room_id:
+            await self.reject('ERROR', 'No id, token, or key supplied to websocket server')
+            return
+
+        if not owns_room(self.room_id):
+            await self.reject('ERROR', 'Room is served by another worker')
+            return
+
+        session_user_id = await self.get_session_user_id()
+        if session_user_id != self.peer_id or not await self.is_participant(self.peer_id):
+            await self.reject('ERROR', 'Invalid key provided')
+            return
+
+        existing = signaling_peers.get((self.room_id, self.peer_id))
+        if existing and existing[1] != self.token:
+            await self.reject('ID-TAKEN', 'ID is taken')
+            return
+
+        signaling_peers[(self.room_id, self.peer_id)] = (self.channel_name, self.token)
+        await self.send_signal({'type': 'OPEN'})
+
+        # Deliver whatever arrived before we connected
+        for message in pending_signals.pop((self.room_id, self.peer_id), []):
+            await self.send_signal(message)
+
+        self.keep_alive()
+
+    async def reject(self, message_type, msg):
+        await self.send_signal({'type': message_type, 'payload': {'msg': msg}})
+        await self.close()
+
+    @database_sync_to_async
+    def get_session_user_id(self):
+        session = self.scope.get('session')
+        return session.get('user_id') if session is not None else None
+
+    @sync_to_async
+    def is_participant(self, peer_id):
+        return get_backend().is_participant(self.room_id, peer_id)
+
+    def keep_alive(self):
+        if self.alive_timer is not None:
+            self.alive_timer.cancel()
+        timeout = getattr(settings, 'PEERJS_ALIVE_TIMEOUT', 60)
+        self.alive_timer = asyncio.get_running_loop().call_later(
+            timeout, lambda: asyncio.ensure_future(self.close())
+        )
+
+    async def disconnect(self, code):
+        if self.alive_timer is not None:
+            self.alive_timer.cancel()
+        key = (getattr(self, 'room_id', None), getattr(self, 'peer_id', None))
+        # A reconnect with the same token may already have replaced us
+        if signaling_peers.get(key, (None,))[0] == self.channel_name:
+            del signaling_peers[key]
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if (self.room_id, self.peer_id) not in signaling_peers:
+            return
+        self.keep_alive()
+        heartbeat(self.room_id, self.peer_id)
+
+        try:
+            message = json.loads(text_data or '')
+        except ValueError:
+            return
+        if not isinstance(message, dict):
+            return
+
+        message_type = message.get('type')
+        dst = message.get('dst')
+        if message_type not in RELAYED_SIGNALS or not dst:
+            # HEARTBEAT only refreshes the alive timer
+            return
+
+        await self.relay({
+            'type': message_type,
+            'src': self.peer_id,
+            'dst': dst,
+            'payload': message.get('payload'),
+        })
+
+    async def relay(self, message):
+        dst_key = (self.room_id, message['dst'])
+        destination = signaling_peers.get(dst_key)
+        if destination is not None:
+            await self.channel_layer.send(destination[0], {'type': 'signal.message', 'message': message})
+            return
+
+        if message['type'] == 'LEAVE':
+            return
+
+        # Hold messages for a participant that is still connecting; anyone
+        # outside the room is reported gone straight away
+        if not await self.is_participant(message['dst']):
+            await self.send_signal(self.expire_message(message))
+            return
+
+        pending_signals.setdefault(dst_key, []).append(message)
+        timeout = getattr(settings, 'PEERJS_EXPIRE_TIMEOUT', 5)
+        asyncio.get_running_loop().call_later(
+            timeout, lambda: asyncio.ensure_future(self.expire(dst_key, message))
+        )
+
+    async def expire(self, dst_key, message):
+        queued = pending_signals.get(dst_key)
+        if not queued or message not in queued:
+            return
+        queued.remove(message)
+        if not queued:
+            del pending_signals[dst_key]
+
+        source = signaling_peers.get((self.room_id, message['src']))
+        if source is not None:
+            await self.channel_layer.send(source[0], {
+                'type': 'signal.message',
+                'message': self.expire_message(message),
+            })
+
+    @staticmethod
+    def expire_message(message):
+        return {'type': 'EXPIRE', 'src': message['dst'], 'dst': message['src']}
+
+    async def signal_message(self, event):
+        await self.send_signal(event['message'])
+
+    async def send_signal(self, message):
+        await self.send(text_data=json.dumps(message))
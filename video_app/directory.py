@@ -0,0 +1,302 @@
+import base64
+import json
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+
+from django.core.signals import request_started
+
+from .backends import get_backend
+
+
+class SortedKeys:
+    """A sorted set of keys, kept as a list of sorted blocks.
+
+    Adding or removing a key shifts one block of at most 2 * LOAD keys
+    rather than the whole list, so updates stay cheap with 100k keys while
+    reading in order is still a walk over plain lists.
+    """
+
+    LOAD = 256
+
+    def __init__(self):
+        self._blocks = []
+        self._maxes = []  # the last key of each block
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def add(self, key):
+        if not self._blocks:
+            self._blocks.append([key])
+            self._maxes.append(key)
+        else:
+            index = min(bisect_left(self._maxes, key), len(self._maxes) - 1)
+            block = self._blocks[index]
+            insort(block, key)
+            self._maxes[index] = block[-1]
+            if len(block) > 2 * self.LOAD:
+                self._blocks[index:index + 1] = [block[:self.LOAD], block[self.LOAD:]]
+                self._maxes[index:index + 1] = [block[self.LOAD - 1], block[-1]]
+        self._len += 1
+
+    def remove(self, key):
+        index = bisect_left(self._maxes, key)
+        block = self._blocks[index]
+        del block[bisect_left(block, key)]
+        if block:
+            self._maxes[index] = block[-1]
+        else:
+            del self._blocks[index]
+            del self._maxes[index]
+        self._len -= 1
+
+    def after(self, key=None, inclusive=False):
+        """The keys past ``key`` (from ``key`` if inclusive; all if None), in order."""
+        index, start = 0, 0
+        if key is not None:
+            find = bisect_left if inclusive else bisect_right
+            index = find(self._maxes, key)
+            if index == len(self._blocks):
+                return
+            start = find(self._blocks[index], key)
+        while index < len(self._blocks):
+            yield from self._blocks[index][start:]
+            index, start = index + 1, 0
+
+
+class DirectoryEntry:
+    __slots__ = ('name', 'created_by', 'members', 'last_activity')
+
+    def __init__(self, name, created_by, members, last_activity):
+        self.name = name
+        self.created_by = created_by
+        self.members = members  # user_ids in the room
+        self.last_activity = last_activity
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor, types):
+    """The key a page ended at; ValueError if the cursor is not one of ours.
+
+    ``types`` are the types of the key's elements, in order: a cursor from
+    another index would not compare with its keys.
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError) as error:
+        raise ValueError('Invalid cursor') from error
+    if not isinstance(key, list) or len(key) != len(types) or not all(
+        isinstance(value, kind) and not isinstance(value, bool) for value, kind in zip(key, types)
+    ):
+        raise ValueError('Invalid cursor')
+    return tuple(key)
+
+
+class RoomDirectory:
+    """The active rooms, indexed for the admin room list.
+
+    Kept up to date from the room signals as rooms are created, joined,
+    left and deactivated, instead of scanning every room ever created.
+    Three sorted indexes are maintained: by last activity (joins, leaves,
+    chat, stream changes), by participant count, and by the casefolded
+    room name and ID for prefix search. Pages are keyset paginated: the
+    cursor is the key of the last room returned, so a page costs a bisect
+    and ``limit`` steps however many rooms there are, and rooms moving in
+    the order between two pages are neither skipped nor repeated twice in
+    a row.
+
+    Like presence, the directory holds the rooms of its own process: with
+    ROOM_SHARDS each worker lists the rooms it owns.
+    """
+
+    ORDERS = ('activity', 'participants')
+    NAME, ID = 0, 1  # the kind of search term, in the search index keys
+    # Types of each index's key elements, to check cursors against
+    KEY_TYPES = {
+        'activity': ((int, float), str),
+        'participants': (int, str),
+        'search': (str, int, str),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rooms = {}  # room_id -> DirectoryEntry
+        self._by_activity = SortedKeys()  # (-last_activity, room_id)
+        self._by_participants = SortedKeys()  # (-participant count, room_id)
+        self._terms = SortedKeys()  # (casefolded name or ID, NAME or ID, room_id)
+
+    def __len__(self):
+        return len(self._rooms)
+
+    def __contains__(self, room_id):
+        return room_id in self._rooms
+
+    # Maintenance, all under the lock
+    def _index(self, room_id, entry):
+        self._by_activity.add((-entry.last_activity, room_id))
+        self._by_participants.add((-len(entry.members), room_id))
+
+    def _unindex(self, room_id, entry):
+        self._by_activity.remove((-entry.last_activity, room_id))
+        self._by_participants.remove((-len(entry.members), room_id))
+
+    def _terms_of(self, room_id, entry):
+        return (entry.name.casefold(), self.NAME, room_id), (room_id.casefold(), self.ID, room_id)
+
+    def add(self, room_id, name, created_by='', members=(), now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._rooms.get(room_id)
+            if entry is not None:
+                self._unindex(room_id, entry)
+                for term in self._terms_of(room_id, entry):
+                    self._terms.remove(term)
+            entry = self._rooms[room_id] = DirectoryEntry(name or '', created_by or '', set(members), now)
+            self._index(room_id, entry)
+            for term in self._terms_of(room_id, entry):
+                self._terms.add(term)
+
+    def remove(self, room_id):
+        with self._lock:
+            entry = self._rooms.pop(room_id, None)
+            if entry is None:
+                return
+            self._unindex(room_id, entry)
+            for term in self._terms_of(room_id, entry):
+                self._terms.remove(term)
+
+    def _update(self, room_id, joined=None, left=None, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._rooms.get(room_id)
+            if entry is None:
+                return
+            self._unindex(room_id, entry)
+            if joined is not None:
+                entry.members.add(joined)
+            if left is not None:
+                entry.members.discard(left)
+            entry.last_activity = max(entry.last_activity, now)
+            self._index(room_id, entry)
+
+    def joined(self, room_id, user_id, now=None):
+        self._update(room_id, joined=user_id, now=now)
+
+    def left(self, room_id, user_id, now=None):
+        self._update(room_id, left=user_id, now=now)
+
+    def touch(self, room_id, now=None):
+        self._update(room_id, now=now)
+
+    def rebuild(self, backend):
+        """Index the backend's active rooms from scratch; returns how many."""
+        self.clear()
+        for room_id in list(backend.rooms):
+            room = backend.get_room(room_id)
+            if room is None or not room['is_active']:
+                continue
+            members = [p['user_id'] for p in backend.list_participants(room_id)]
+            self.add(room_id, room['name'], room['created_by'], members)
+        return len(self)
+
+    def clear(self):
+        with self._lock:
+            self._rooms.clear()
+            self._by_activity = SortedKeys()
+            self._by_participants = SortedKeys()
+            self._terms = SortedKeys()
+
+    # Reading
+    def _describe(self, room_id, entry):
+        return {
+            'room_id': room_id,
+            'name': entry.name,
+            'created_by': entry.created_by,
+            'participants': len(entry.members),
+            'last_activity': round(entry.last_activity, 3),
+        }
+
+    def page(self, order='activity', limit=50, cursor=None):
+        """One page of active rooms; returns ``(rooms, next_cursor)``, the cursor None on the last page.
+
+        ``order`` is 'activity' (most recent first) or 'participants'
+        (largest first); ties go by room ID.
+        """
+        if order not in self.ORDERS:
+            raise ValueError(f'Unknown order {order!r}')
+        after = decode_cursor(cursor, self.KEY_TYPES[order]) if cursor else None
+        with self._lock:
+            index = self._by_activity if order == 'activity' else self._by_participants
+            rooms, last = [], None
+            for key in index.after(after):
+                if len(rooms) == limit:
+                    return rooms, encode_cursor(last)
+                rooms.append(self._describe(key[1], self._rooms[key[1]]))
+                last = key
+        return rooms, None
+
+    def search(self, prefix, limit=50, cursor=None):
+        """Active rooms whose name or ID starts with ``prefix``, ignoring case, in name order.
+
+        Returns ``(rooms, next_cursor)`` like page().
+        """
+        prefix = prefix.casefold()
+        if cursor:
+            after, inclusive = decode_cursor(cursor, self.KEY_TYPES['search']), False
+        else:
+            after, inclusive = (prefix,), True
+        with self._lock:
+            rooms, last = [], None
+            for key in self._terms.after(after, inclusive):
+                term, kind, room_id = key
+                if not term.startswith(prefix):
+                    break
+                entry = self._rooms[room_id]
+                if kind == self.ID and entry.name.casefold().startswith(prefix):
+                    continue  # listed under its name already
+                if len(rooms) == limit:
+                    return rooms, encode_cursor(last)
+                rooms.append(self._describe(room_id, entry))
+                last = key
+        return rooms, None
+
+
+directory = RoomDirectory()
+
+
+def index_on_first_request(sender, **kwargs):
+    # After the checkpoint and database restores, which send no signals
+    request_started.disconnect(index_on_first_request)
+    backend = get_backend()
+    if backend.in_process:
+        directory.rebuild(backend)
+
+
+# Signal receivers, connected in VideoAppConfig.ready()
+def on_room_changed(sender, room_id, changes, **kwargs):
+    if changes.get('is_active') is False:
+        directory.remove(room_id)
+    elif 'name' in changes:
+        # A new room; its participants follow through participant_changed
+        directory.add(room_id, changes['name'], changes.get('created_by'))
+
+
+def on_participant_changed(sender, room_id, participant, **kwargs):
+    directory.joined(room_id, participant['user_id'])
+
+
+def on_participant_removed(sender, room_id, user_id, **kwargs):
+    directory.left(room_id, user_id)
+
+
+def on_room_activity(sender, room_id, **kwargs):
+    directory.touch(room_id)
+
+
+def on_room_deleted(sender, room_id, **kwargs):
+    directory.remove(room_id)
@@ -0,0 +1,27 @@
+def room_group_name(room_id):
+    return f'room_{room_id}'
+
+
+def coalesce_key(event, payload):
+    """Key under which a newer event replaces a pending one, or None."""
+    # Participant updates carry the participant's full state, so only the
+    # latest one per participant matters; speaker updates carry the whole
+    # room's order
+    if event == 'participant.updated':
+        return (event, payload['participant']['user_id'])
+    if event in ('participants.muted', 'speakers.updated'):
+        return (event,)
+    return None
+
+
+def broadcast(room_id, event, **payload):
+    """Push a room event to every socket connected to the room.
+
+    Called from the views after they mutate room state. Events are
+    batched per room by the fan-out scheduler; clients that are not
+    connected over WebSocket still pick the change up by polling.
+    """
+    # Imported here as the scheduler needs room_group_name from this module
+    from .fanout import fanout
+
+    fanout.publish(room_id, event, payload, key=coalesce_key(event, payload))
@@ -0,0 +1,153 @@
+import asyncio
+import collections
+import json
+import threading
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from .events import room_group_name
+
+
+def _encode(events):
+    return json.dumps({'events': events}, separators=(',', ':'))
+
+
+class FanoutScheduler:
+    """Buffers outbound room events and sends them once per tick.
+
+    Events published within FANOUT_TICK seconds of the first one pending for
+    a room go out together as one ``{"events": [...]}`` frame. The frame is
+    encoded once and the same text is handed to every socket in the room.
+    Events published with a coalescing key replace the pending event with
+    the same key, so ten quick audio/video toggles cost one update.
+
+    Flushes run on the event loop that serves the sockets; views (in worker
+    threads) and background threads only hand the room over to it, which
+    never blocks them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # room_id -> {key: event}, in publish order
+        self._first_at = {}  # room_id -> when its oldest pending event came in
+        self._loop = None
+        self._counter = 0
+        self._latencies = collections.deque(maxlen=1000)
+        self._stats = collections.Counter()
+
+    @staticmethod
+    def tick():
+        return getattr(settings, 'FANOUT_TICK', 0.05)
+
+    def publish(self, room_id, event, payload, key=None):
+        now = time.monotonic()
+        with self._lock:
+            pending = self._pending.get(room_id)
+            if pending is None:
+                arm = True
+                pending = self._pending[room_id] = {}
+                self._first_at[room_id] = now
+            else:
+                # Re-arm if the loop that was to flush this room went away
+                arm = now - self._first_at[room_id] > max(1.0, 20 * self.tick())
+            if key is None:
+                self._counter += 1
+                key = self._counter
+            elif pending.pop(key, None) is not None:
+                self._stats['events_coalesced'] += 1
+            pending[key] = {'event': event, **payload}
+            self._stats['events_published'] += 1
+
+        if arm:
+            loop = self._event_loop()
+            if loop is None:
+                # Nothing serves sockets from a loop we can reach (e.g. a
+                # management command): deliver right away
+                async_to_sync(self.flush_room)(room_id)
+            else:
+                try:
+                    loop.call_soon_threadsafe(self._arm, room_id)
+                except RuntimeError:
+                    # The loop closed since it was looked up
+                    async_to_sync(self.flush_room)(room_id)
+
+    def attach(self):
+        """Remember the running loop as the one serving the sockets."""
+        self._event_loop()
+
+    def _event_loop(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not None:
+            # Keep the serving loop for threads that have none (presence,
+            # the reaper, write-behind), so their events are batched too
+            if self._loop is None or not self._loop.is_running():
+                self._loop = loop
+            return loop
+        loop = self._loop
+        if loop is None or not loop.is_running():
+            # From a worker thread this hops to the server's loop; anywhere
+            # else it runs on a throwaway loop that is closed on return
+            loop = async_to_sync(self._running_loop)()
+            self._loop = loop = loop if loop.is_running() else None
+        return loop
+
+    @staticmethod
+    async def _running_loop():
+        return asyncio.get_running_loop()
+
+    def _arm(self, room_id):
+        loop = asyncio.get_running_loop()
+        loop.call_later(self.tick(), lambda: loop.create_task(self.flush_room(room_id)))
+
+    async def flush_room(self, room_id):
+        with self._lock:
+            pending = self._pending.pop(room_id, None)
+            first_at = self._first_at.pop(room_id, None)
+        if not pending:
+            return
+
+        text = _encode(list(pending.values()))
+        channel_layer = get_channel_layer()
+        if channel_layer is not None:
+            await channel_layer.group_send(room_group_name(room_id), {'type': 'room.batch', 'text': text})
+
+        with self._lock:
+            self._latencies.append(time.monotonic() - first_at)
+            self._stats['batches_sent'] += 1
+            self._stats['events_sent'] += len(pending)
+
+    def stats(self):
+        """Queue depth, counters, and the time events wait before going out."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                'queue_depth': sum(len(pending) for pending in self._pending.values()),
+                'rooms_pending': len(self._pending),
+                **{name: self._stats[name] for name in (
+                    'events_published', 'events_coalesced', 'events_sent', 'batches_sent'
+                )},
+            }
+        if latencies:
+            stats['tick_latency_ms'] = {
+                'p50': round(latencies[len(latencies) // 2] * 1000, 3),
+                'p95': round(latencies[int(len(latencies) * 0.95)] * 1000, 3),
+                'max': round(latencies[-1] * 1000, 3),
+            }
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+            self._first_at.clear()
+            self._latencies.clear()
+            self._stats.clear()
+        self._loop = None
+
+
+fanout = FanoutScheduler()
@@ -0,0 +1,242 @@
+import os
+import random
+import string
+import sys
+import threading
+import time
+
+from django.conf import settings
+
+from .backends import get_backend
+from .sharding import owns_room
+from .signals import room_deleted
+
+ROOM_ID_ALPHABET = string.ascii_uppercase + string.digits
+ROOM_ID_LENGTH = 6
+
+
+class TimingWheel:
+    """Hashed timing wheel of deadlines.
+
+    Keys are dropped into the bucket of the tick their deadline falls in;
+    ``advance`` only visits the buckets of ticks that have passed, so the
+    work per call is proportional to what expired, not to everything
+    scheduled. Rescheduling is lazy: the old bucket entry stays behind and
+    is skipped once it no longer matches the key's current deadline.
+    """
+
+    def __init__(self, resolution=1.0, slots=512, start=0.0):
+        self.resolution = resolution
+        self.slots = slots
+        self._buckets = [set() for _ in range(slots)]
+        self._deadlines = {}
+        # Last tick that has been advanced past
+        self._tick = self._tick_of(start)
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def _tick_of(self, when):
+        return int(when // self.resolution)
+
+    def schedule(self, key, deadline):
+        self._deadlines[key] = deadline
+        tick = self._tick_of(deadline)
+        if tick <= self._tick:
+            # Already overdue: expire on the next advance
+            tick = self._tick + 1
+        self._buckets[tick % self.slots].add(key)
+
+    def cancel(self, key):
+        # The bucket entry is skipped lazily
+        self._deadlines.pop(key, None)
+
+    def deadline(self, key):
+        return self._deadlines.get(key)
+
+    def advance(self, now):
+        """Pop and return the keys whose deadline is at or before ``now``."""
+        current = self._tick_of(now)
+        if current <= self._tick:
+            return []
+
+        expired = []
+        # Never loop more than once around the wheel
+        start = max(self._tick + 1, current - self.slots + 1)
+        for tick in range(start, current + 1):
+            bucket = self._buckets[tick % self.slots]
+            if not bucket:
+                continue
+            self._buckets[tick % self.slots] = set()
+            for key in bucket:
+                deadline = self._deadlines.get(key)
+                if deadline is None:
+                    continue
+                if deadline <= now:
+                    del self._deadlines[key]
+                    expired.append(key)
+                elif self._tick_of(deadline) % self.slots == tick % self.slots:
+                    # Due on a later turn of the wheel
+                    self._buckets[tick % self.slots].add(key)
+        self._tick = current
+        return expired
+
+
+class RoomReaper:
+    """Frees rooms that went idle, or stayed deactivated, past their TTL.
+
+    Every room has one deadline: ROOM_IDLE_TTL after its last activity
+    (joins, leaves, chat, and the participants' heartbeats), or
+    ROOM_INACTIVE_TTL after it was deactivated. A daemon thread advances a
+    timing wheel every ROOM_REAPER_INTERVAL seconds and deletes whatever
+    expired from the backend.
+
+    Only the in-process backend needs this; the Redis backend expires its
+    keys on its own.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wheel = None
+        self._inactive = set()
+        self._thread = None
+
+    @staticmethod
+    def idle_ttl():
+        return getattr(settings, 'ROOM_IDLE_TTL', 4 * 3600)
+
+    @staticmethod
+    def inactive_ttl():
+        return getattr(settings, 'ROOM_INACTIVE_TTL', 10 * 60)
+
+    @staticmethod
+    def interval():
+        return getattr(settings, 'ROOM_REAPER_INTERVAL', 5)
+
+    @property
+    def wheel(self):
+        if self._wheel is None:
+            self._wheel = TimingWheel(resolution=self.interval(), start=time.monotonic())
+        return self._wheel
+
+    def __len__(self):
+        return len(self.wheel)
+
+    def touch(self, room_id, now=None):
+        """Record activity in a room, pushing back its idle deadline."""
+        now = time.monotonic() if now is None else now
+        deadline = now + self.idle_ttl()
+        with self._lock:
+            # Every participant's heartbeat counts; skip those that would
+            # not move the deadline to another tick
+            current = self.wheel.deadline(room_id)
+            if room_id not in self._inactive and (current is None or deadline - current >= self.wheel.resolution):
+                self.wheel.schedule(room_id, deadline)
+        self._ensure_started()
+
+    def deactivated(self, room_id, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._inactive.add(room_id)
+            self.wheel.schedule(room_id, now + self.inactive_ttl())
+        self._ensure_started()
+
+    def forget(self, room_id):
+        with self._lock:
+            self.wheel.cancel(room_id)
+            self._inactive.discard(room_id)
+
+    def reap(self, now=None):
+        """Delete every room whose deadline passed; returns their IDs."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            expired = self.wheel.advance(now)
+            self._inactive.difference_update(expired)
+
+        backend = get_backend()
+        for room_id in expired:
+            if backend.delete_room(room_id):
+                room_deleted.send(sender=None, room_id=room_id)
+        return expired
+
+    def clear(self):
+        with self._lock:
+            self._wheel = None
+            self._inactive.clear()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='room-reaper', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval())
+            self.reap()
+
+
+reaper = RoomReaper()
+
+
+def lifecycle_enabled():
+    return get_backend().in_process
+
+
+def generate_room_id():
+    return ''.join(random.choices(ROOM_ID_ALPHABET, k=ROOM_ID_LENGTH))
+
+
+def allocate_room(backend, name, user_id, user_name, attempts=32):
+    """Create a room under a fresh random ID, retrying on collisions.
+
+    Backends refuse to create a room whose ID is live, so the ID is unique
+    among live rooms even with concurrent creators. When sharding, only IDs
+    this worker owns are drawn. Returns (room_id, room).
+    """
+    for _ in range(attempts):
+        room_id = generate_room_id()
+        while not owns_room(room_id):
+            room_id = generate_room_id()
+        room = backend.create_room(room_id, name, user_id, user_name)
+        if room is not None:
+            return room_id, room
+    raise RuntimeError('Could not allocate a free room ID')
+
+
+def process_memory_bytes():
+    # Resident set size where /proc is available, else the peak RSS
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def room_gauges():
+    """Room-count and memory gauges for monitoring."""
+    gauges = get_backend().stats()
+    gauges['rooms_scheduled_for_reaping'] = len(reaper)
+    gauges['process_memory_bytes'] = process_memory_bytes()
+    return gauges
+
+
+# Signal receivers, connected in VideoAppConfig.ready()
+def on_room_changed(sender, room_id, changes, **kwargs):
+    if not lifecycle_enabled():
+        return
+    if changes.get('is_active') is False:
+        reaper.deactivated(room_id)
+    else:
+        reaper.touch(room_id)
+
+
+def on_room_activity(sender, room_id, **kwargs):
+    if lifecycle_enabled():
+        reaper.touch(room_id)
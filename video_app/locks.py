@@ -0,0 +1,31 @@
+import asyncio
+import weakref
+
+
+class RoomLocks:
+    """One asyncio.Lock per room, for views that change a room.
+
+    Backend calls are atomic one by one. Holding the room's lock across a
+    view's calls (check then join, leave then deactivate) keeps requests
+    for the same room from interleaving, and sends their events and system
+    messages in the order of the changes. Rooms never wait on each other.
+
+    A lock only exists while it is held or waited for, and belongs to the
+    event loop that made it.
+    """
+
+    def __init__(self):
+        self._locks = weakref.WeakValueDictionary()
+
+    def __call__(self, room_id):
+        key = (asyncio.get_running_loop(), room_id)
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+    def __len__(self):
+        return len(self._locks)
+
+
+room_locks = RoomLocks()
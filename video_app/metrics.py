@@ -0,0 +1,190 @@
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+
+# Seconds; long-polls land in the top buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SESSION_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1)
+PARTICIPANT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+CHAT_BUCKETS = (0, 10, 25, 50, 100, 250, 500, 1000)
+
+
+def metrics_enabled():
+    return getattr(settings, 'METRICS_ENABLED', True)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Bucket counts of one labelled series; ``observe`` is a bisect and two adds."""
+
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def lines(self, name, labelnames=(), labels=()):
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{_labels(labelnames, labels, [("le", _number(bound))])} {cumulative}'
+        label_text = _labels(labelnames, labels)
+        yield f'{name}_sum{label_text} {_number(self.sum)}'
+        yield f'{name}_count{label_text} {cumulative}'
+
+
+class Metric:
+    """A counter or histogram family, one series per label combination."""
+
+    def __init__(self, name, kind, help, labelnames=(), buckets=None):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = Histogram(self.buckets)
+            series.observe(value)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def lines(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} {self.kind}'
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                if self.kind == 'histogram':
+                    yield from series.lines(self.name, self.labelnames, labels)
+                else:
+                    yield f'{self.name}{_labels(self.labelnames, labels)} {_number(series)}'
+
+
+class MetricsRegistry:
+    """Metrics recorded on the request path, plus gauges read at scrape time."""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, help, labelnames=()):
+        metric = Metric(name, 'counter', help, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Metric(name, 'histogram', help, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, function):
+        """Register a function yielding exposition lines when scraped."""
+        self.collectors.append(function)
+        return function
+
+    def clear(self):
+        for metric in self.metrics:
+            metric.clear()
+
+    def render(self):
+        """The Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.lines())
+        for collector in self.collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+http_requests = registry.counter(
+    'meet_http_requests_total', 'HTTP responses by route and status.', ('method', 'route', 'status'),
+)
+http_exceptions = registry.counter(
+    'meet_http_exceptions_total', 'Unhandled exceptions raised by views.', ('method', 'route'),
+)
+http_duration = registry.histogram(
+    'meet_http_request_duration_seconds', 'Time spent handling a request.', ('method', 'route'),
+)
+session_duration = registry.histogram(
+    'meet_session_duration_seconds', 'Time spent loading and saving sessions.', ('operation',),
+    buckets=SESSION_BUCKETS,
+)
+
+
+def _gauge(name, help, value):
+    yield f'# HELP {name} {help}'
+    yield f'# TYPE {name} gauge'
+    yield f'{name} {_number(value)}'
+
+
+def _distribution(name, help, values, bounds):
+    # Per-room sizes as a histogram, so the series count does not grow
+    # with the number of rooms
+    histogram = Histogram(bounds)
+    for value in values:
+        histogram.observe(value)
+    yield f'# HELP {name} {help}'
+    yield f'# TYPE {name} histogram'
+    yield from histogram.lines(name)
+
+
+@registry.collector
+def room_state():
+    from .backends import get_backend
+    from .fanout import fanout
+    from .lifecycle import room_gauges
+
+    gauges = room_gauges()
+    yield from _gauge('meet_rooms', 'Rooms held in room state.', gauges['rooms'])
+    yield from _gauge('meet_rooms_active', 'Rooms with participants.', gauges['active_rooms'])
+    yield from _gauge('meet_participants', 'Participants across all rooms.', gauges['participants'])
+    yield from _gauge('meet_chat_messages', 'Chat messages kept across all rooms.', gauges['chat_messages'])
+    yield from _gauge(
+        'meet_rooms_scheduled_for_reaping', 'Rooms tracked by the idle reaper.', gauges['rooms_scheduled_for_reaping'],
+    )
+    yield from _gauge(
+        'meet_process_resident_memory_bytes', 'Resident memory of this process.', gauges['process_memory_bytes'],
+    )
+    yield from _gauge('meet_fanout_queue_depth', 'Room events waiting for the next tick.', fanout.stats()['queue_depth'])
+
+    sizes = get_backend().room_sizes()
+    yield from _distribution(
+        'meet_room_participants', 'Participants per room.', [p for p, _ in sizes], PARTICIPANT_BUCKETS,
+    )
+    yield from _distribution(
+        'meet_room_chat_messages', 'Chat messages kept per room.', [m for _, m in sizes], CHAT_BUCKETS,
+    )
@@ -1,11 +1,274 @@
-class DebugMiddleware:
+import asyncio
+import threading
+import time
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+from django.utils.deprecation import MiddlewareMixin
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .admission import load_shedder, retry_after
+from .metrics import http_duration, http_exceptions, http_requests, metrics_enabled, session_duration
+from .profiling import profiler
+from .sharding import FORWARDED_HEADER, forward, owner, shard_name, sharding_enabled
+
+
+# Methods get their own label value; anything else is lumped together
+KNOWN_METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS')
+
+
+def _route(request):
+    # The URL pattern rather than the path, so room IDs do not become series
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else 'unmatched'
+
+
+def _method(request):
+    return request.method if request.method in KNOWN_METHODS else 'other'
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    """Per-route request counts, errors and latency histograms for /metrics.
+
+    Recording is two clock reads and a histogram bisect; nothing leaves the
+    process until Prometheus scrapes. Removed entirely when METRICS_ENABLED
+    is off.
+    """
+
     def __init__(self, get_response):
+        if not metrics_enabled():
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def process_request(self, request):
+        request._metrics_started = time.perf_counter()
+
+    def process_exception(self, request, exception):
+        http_exceptions.inc(_method(request), _route(request))
+
+    def process_response(self, request, response):
+        started = getattr(request, '_metrics_started', None)
+        if started is not None:
+            method, route = _method(request), _route(request)
+            http_duration.observe(time.perf_counter() - started, method, route)
+            http_requests.inc(method, route, response.status_code)
+        return response
+
+
+class LoadSheddingMiddleware(MiddlewareMixin):
+    """Answer room API requests 503 while the process is overloaded.
+
+    See admission.LoadShedder for when that is. Shed requests cost one
+    check and carry a Retry-After; pages, static files, the monitoring
+    endpoints and chat long-polls are always served.
+    """
+
+    SHED_PREFIX = '/api/room/'
+
+    def process_request(self, request):
+        # Long-polls mostly sit idle waiting for news: they are neither
+        # measured nor shed, or idle pollers would pile up retries
+        if not request.path.startswith(self.SHED_PREFIX) or 'wait' in request.GET:
+            return None
+        if load_shedder.overloaded():
+            response = JsonResponse({'success': False, 'error': 'Server busy, try again shortly'}, status=503)
+            response['Retry-After'] = retry_after(load_shedder.retry_after())
+            return response
+        request._admission_started = time.perf_counter()
+        load_shedder.started()
+        return None
+
+    def process_response(self, request, response):
+        started = getattr(request, '_admission_started', None)
+        if started is not None:
+            load_shedder.finished(time.perf_counter() - started)
+        return response
+
+
+class ShardRoutingMiddleware:
+    """Forward requests for rooms owned by another worker to that worker.
+
+    The room comes from the URL, or from the form of a join-room POST; see
+    sharding.HashRing for who owns it. Forwarding is an HTTP request to
+    the owner's ROOM_SHARDS URL, awaited on the event loop so long-polls
+    hold no thread. Removed entirely unless ROOM_SHARDS is set.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not sharding_enabled():
+            raise MiddlewareNotUsed
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        shard = self.owner(request)
+        if shard is None:
+            return self.get_response(request)
+        return async_to_sync(forward)(request, shard)
+
+    async def __acall__(self, request):
+        shard = self.owner(request)
+        if shard is None:
+            return await self.get_response(request)
+        return await forward(request, shard)
+
+    @staticmethod
+    def owner(request):
+        """The other worker that should answer ``request``, or None for this one."""
+        if FORWARDED_HEADER in request.headers:
+            return None  # never forward twice
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        room_id = match.kwargs.get('room_id')
+        if room_id is None and match.url_name == 'join_room' and request.method == 'POST':
+            request.body  # kept for forwarding; a multipart form would consume it
+            room_id = request.POST.get('room_id', '').strip().upper()
+        if not room_id:
+            return None
+        shard = owner(room_id)
+        return None if shard == shard_name() else shard
+
+
+async def _read_chunks(chunks):
+    # Fingerprinted assets are small and in the page cache
+    for chunk in chunks:
+        yield chunk
+
+
+class AssetMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise that stays async under ASGI.
+
+    WhiteNoiseMiddleware is sync-only, so Django would run every request
+    behind it in a worker thread and the chat long-polls would hold one
+    each. Static files are answered straight from WhiteNoise's in-memory
+    file table, precompressed variant and immutable headers included;
+    everything else goes on untouched. Under WSGI the response is a file
+    wrapper the server can sendfile().
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        print(f"Path: {request.path}")
-        print(f"Session keys: {list(request.session.keys())}")
-        print(f"User in session: {request.session.get('user_name', 'Not set')}")
-        
-        response = self.get_response(request)
-        return response
\ No newline at end of file
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is None:
+            return await self.get_response(request)
+        response = self.serve(static_file, request)
+        if response.streaming:
+            # A sync file iterator would cost a thread hop per chunk
+            response.streaming_content = _read_chunks(response.streaming_content)
+        return response
+
+
+class ProfilingMiddleware(MiddlewareMixin):
+    """Samples the stacks of selected requests for flame graphs.
+
+    Which requests are selected is up to profiling.SamplingProfiler; while
+    it selects nothing the cost is one check per request. The samples are
+    downloaded from api/admin/profile/.
+    """
+
+    async def __acall__(self, request):
+        # Under ASGI process_view runs in the worker thread of sync views;
+        # async views run on this, the event loop's thread
+        request._loop_thread = threading.get_ident()
+        return await super().__acall__(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not profiler.active:
+            return None
+        route = _route(request)
+        if not profiler.wants(route, view_kwargs.get('room_id')):
+            return None
+
+        ident = threading.get_ident()
+        if asyncio.iscoroutinefunction(view_func):
+            # The loop thread runs other requests' coroutines too, so their
+            # frames can show up in this request's samples
+            ident = getattr(request, '_loop_thread', ident)
+        request._profiled = (ident, route)
+        profiler.sampler.track(ident, route)
+        return None
+
+    def process_response(self, request, response):
+        profiled = getattr(request, '_profiled', None)
+        if profiled is not None:
+            profiler.sampler.untrack(*profiled)
+        return response
+
+
+def timed_session_store(store_class):
+    """Subclass a SessionStore so its loads and saves are timed."""
+
+    class TimedSessionStore(store_class):
+        def load(self):
+            started = time.perf_counter()
+            try:
+                return super().load()
+            finally:
+                session_duration.observe(time.perf_counter() - started, 'load')
+
+        def save(self, must_create=False):
+            started = time.perf_counter()
+            try:
+                return super().save(must_create)
+            finally:
+                session_duration.observe(time.perf_counter() - started, 'save')
+
+    return TimedSessionStore
+
+
+class TimedSessionMiddleware(SessionMiddleware):
+    """SessionMiddleware that records session backend timings for /metrics."""
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if metrics_enabled():
+            self.SessionStore = timed_session_store(self.SessionStore)
+
+
+class SlidingSessionMiddleware(MiddlewareMixin):
+    """Slide the session expiry without writing the session on every request.
+
+    Replaces ``SESSION_SAVE_EVERY_REQUEST``: the session is only re-saved
+    (a new signed cookie, or one cache write) once less than
+    ``SESSION_REFRESH_THRESHOLD`` seconds of its lifetime remain. Requests
+    without a session cookie never load a session at all.
+    """
+
+    REFRESHED_KEY = '_refreshed_at'
+
+    def process_response(self, request, response):
+        if settings.SESSION_COOKIE_NAME in request.COOKIES and not request.session.is_empty():
+            now = int(time.time())
+            refreshed_at = request.session.get(self.REFRESHED_KEY, 0)
+            threshold = getattr(settings, 'SESSION_REFRESH_THRESHOLD', settings.SESSION_COOKIE_AGE // 4)
+            if now - refreshed_at >= settings.SESSION_COOKIE_AGE - threshold:
+                request.session[self.REFRESHED_KEY] = now
+        return response
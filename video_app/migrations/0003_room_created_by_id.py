@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_app', '0002_alter_room_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='created_by_id',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:42
+
+from django.db import migrations, models
+
+# External-content FTS5 index over the archive, kept in step by triggers.
+# room_id is indexed too, so a search only walks one room's postings; the
+# prefix indexes keep search-as-you-type on one to three letters from
+# expanding into every matching term.
+FTS_SQL = [
+    """
+    CREATE VIRTUAL TABLE video_app_archivedmessage_fts USING fts5(
+        room_id, message,
+        content='video_app_archivedmessage', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER video_app_archivedmessage_fts_insert AFTER INSERT ON video_app_archivedmessage BEGIN
+        INSERT INTO video_app_archivedmessage_fts(rowid, room_id, message) VALUES (new.id, new.room_id, new.message);
+    END
+    """,
+    """
+    CREATE TRIGGER video_app_archivedmessage_fts_delete AFTER DELETE ON video_app_archivedmessage BEGIN
+        INSERT INTO video_app_archivedmessage_fts(video_app_archivedmessage_fts, rowid, room_id, message)
+        VALUES ('delete', old.id, old.room_id, old.message);
+    END
+    """,
+]
+
+FTS_DROP_SQL = [
+    'DROP TRIGGER IF EXISTS video_app_archivedmessage_fts_delete',
+    'DROP TRIGGER IF EXISTS video_app_archivedmessage_fts_insert',
+    'DROP TABLE IF EXISTS video_app_archivedmessage_fts',
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        # Search is SQLite-only; other databases get the table without it
+        if schema_editor.connection.vendor == 'sqlite':
+            for statement in statements:
+                schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_app', '0003_room_created_by_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('room_id', models.CharField(max_length=20)),
+                ('seq', models.PositiveIntegerField()),
+                ('message_id', models.CharField(max_length=36)),
+                ('user_id', models.CharField(max_length=255)),
+                ('user_name', models.CharField(max_length=255)),
+                ('message', models.TextField()),
+                ('timestamp', models.CharField(max_length=8)),
+                ('is_system', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='archivedmessage',
+            constraint=models.UniqueConstraint(fields=('room_id', 'seq'), name='archived_message_room_seq'),
+        ),
+        migrations.RunPython(_run(FTS_SQL), _run(FTS_DROP_SQL)),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:29
+
+from django.db import migrations, models
+
+# SQLite rebuilds the table to add the column, which drops its triggers;
+# the search index itself keeps the same rowids
+TRIGGERS_SQL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS video_app_archivedmessage_fts_insert AFTER INSERT ON video_app_archivedmessage BEGIN
+        INSERT INTO video_app_archivedmessage_fts(rowid, room_id, message) VALUES (new.id, new.room_id, new.message);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS video_app_archivedmessage_fts_delete AFTER DELETE ON video_app_archivedmessage BEGIN
+        INSERT INTO video_app_archivedmessage_fts(video_app_archivedmessage_fts, rowid, room_id, message)
+        VALUES ('delete', old.id, old.room_id, old.message);
+    END
+    """,
+]
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in TRIGGERS_SQL:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_app', '0004_archivedmessage'),
+    ]
+
+    operations = [
+        # Unapplying rebuilds the table too; this then runs last
+        migrations.RunPython(migrations.RunPython.noop, create_triggers),
+        migrations.RemoveConstraint(
+            model_name='archivedmessage',
+            name='archived_message_room_seq',
+        ),
+        migrations.AddField(
+            model_name='archivedmessage',
+            name='epoch',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name='archivedmessage',
+            constraint=models.UniqueConstraint(fields=('room_id', 'epoch', 'seq'), name='archived_message_room_epoch_seq'),
+        ),
+        migrations.RunPython(create_triggers, migrations.RunPython.noop),
+    ]
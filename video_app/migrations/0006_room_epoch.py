@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_app', '0005_archivedmessage_epoch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='epoch',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -6,9 +6,12 @@ class Room(models.Model):
     id = models.CharField(primary_key=True, max_length=20, unique=True, default=shortuuid.uuid)
     name = models.CharField(max_length=255)
     created_by = models.CharField(max_length=255)
+    created_by_id = models.CharField(max_length=255, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
     max_participants = models.IntegerField(default=10)
+    # The meeting's epoch, so a restored room keeps its chat archive
+    epoch = models.BigIntegerField(default=0)
     
     def __str__(self):
         return f"{self.name} ({self.id})"
@@ -26,4 +29,31 @@ class Participant(models.Model):
         unique_together = ['room', 'user_id']
     
     def __str__(self):
-        return f"{self.name} in {self.room.name}"
\ No newline at end of file
+        return f"{self.name} in {self.room.name}"
+
+class ArchivedMessage(models.Model):
+    """A chat message as archived by archive.ChatArchive.
+
+    Not tied to Room: messages outlive the rooms they were sent in, which
+    are only persisted while ROOM_PERSISTENCE_ENABLED is on. Room IDs are
+    reused and seq starts over with each meeting, so messages are keyed by
+    the room's ``epoch`` too; the unique (room_id, epoch, seq) index is
+    what keyset pagination walks.
+    """
+    room_id = models.CharField(max_length=20)
+    epoch = models.BigIntegerField(default=0)
+    seq = models.PositiveIntegerField()
+    message_id = models.CharField(max_length=36)
+    user_id = models.CharField(max_length=255)
+    user_name = models.CharField(max_length=255)
+    message = models.TextField()
+    timestamp = models.CharField(max_length=8)
+    is_system = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room_id', 'epoch', 'seq'], name='archived_message_room_epoch_seq'),
+        ]
+
+    def __str__(self):
+        return f"#{self.seq} in {self.room_id}"
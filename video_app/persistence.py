@@ -0,0 +1,259 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import DatabaseError, close_old_connections, transaction
+
+from .archive import history as archive_history
+from .backends import get_backend
+from .chat import history_limit
+from .lifecycle import reaper
+from .models import Participant, Room
+from .presence import presence
+from .sharding import owns_room
+
+logger = logging.getLogger(__name__)
+
+ROOM_FIELDS = ('name', 'created_by', 'created_by_id', 'is_active', 'epoch')
+PARTICIPANT_FIELDS = ('name', 'is_admin', 'video_enabled', 'audio_enabled')
+
+# Participants deleted per query, within SQLite's limit on query variables
+DELETE_BATCH = 500
+# Failed flushes a batch is retried for before it is dropped
+MAX_FLUSH_ATTEMPTS = 3
+
+
+def persistence_enabled():
+    return getattr(settings, 'ROOM_PERSISTENCE_ENABLED', False)
+
+
+class WriteBehindQueue:
+    """Coalesces room state changes and writes them to the database later.
+
+    Views only record what changed (a dict update under a lock); a daemon
+    thread flushes the accumulated changes every ``interval`` seconds in one
+    transaction, so request latency never includes a database write. Only
+    the latest state of each room and participant is written, however many
+    times it changed in between. A batch that keeps failing is dropped
+    after MAX_FLUSH_ATTEMPTS flushes, so one bad row cannot stop the
+    writes for good.
+    """
+
+    def __init__(self, interval=None):
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._rooms = {}  # room_id -> changed fields
+        self._participants = {}  # (room_id, user_id) -> participant dict, or None to delete
+        self._thread = None
+        self._stopped = threading.Event()
+        self._failed_flushes = 0
+
+    def room_changed(self, room_id, changes):
+        with self._lock:
+            self._rooms.setdefault(room_id, {}).update(changes)
+        self._ensure_started()
+
+    def participant_changed(self, room_id, participant):
+        with self._lock:
+            self._participants[(room_id, participant['user_id'])] = participant
+        self._ensure_started()
+
+    def participant_removed(self, room_id, user_id):
+        with self._lock:
+            self._participants[(room_id, user_id)] = None
+        self._ensure_started()
+
+    @property
+    def interval(self):
+        return self._interval or getattr(settings, 'ROOM_PERSISTENCE_INTERVAL', 5)
+
+    def pending(self):
+        with self._lock:
+            return len(self._rooms) + len(self._participants)
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='room-write-behind', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Write-behind flush failed')
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self._stopped.set()
+
+    def flush(self):
+        """Write every pending change now; returns the number of changes written."""
+        with self._lock:
+            rooms, self._rooms = self._rooms, {}
+            changed_participants, self._participants = self._participants, {}
+
+        if not rooms and not changed_participants:
+            return 0
+
+        try:
+            with transaction.atomic():
+                self._write_rooms(rooms)
+                self._write_participants(changed_participants)
+        except Exception:
+            with self._lock:
+                self._failed_flushes += 1
+                if self._failed_flushes >= MAX_FLUSH_ATTEMPTS:
+                    self._failed_flushes = 0
+                    logger.error(
+                        'Dropping %d room and %d participant changes after %d failed writes',
+                        len(rooms), len(changed_participants), MAX_FLUSH_ATTEMPTS,
+                    )
+                else:
+                    # Put the batch back, unless newer changes superseded it
+                    for room_id, changes in rooms.items():
+                        self._rooms[room_id] = {**changes, **self._rooms.get(room_id, {})}
+                    for key, participant in changed_participants.items():
+                        self._participants.setdefault(key, participant)
+            raise
+
+        with self._lock:
+            self._failed_flushes = 0
+        return len(rooms) + len(changed_participants)
+
+    def _write_rooms(self, rooms):
+        created = [
+            Room(id=room_id, **{field: changes[field] for field in ROOM_FIELDS})
+            for room_id, changes in rooms.items()
+            if all(field in changes for field in ROOM_FIELDS)
+        ]
+        if created:
+            Room.objects.bulk_create(
+                created,
+                update_conflicts=True,
+                unique_fields=['id'],
+                update_fields=list(ROOM_FIELDS),
+            )
+
+        # Partial changes (e.g. deactivation) of rooms written earlier
+        updated = [
+            room_id for room_id, changes in rooms.items()
+            if not all(field in changes for field in ROOM_FIELDS)
+        ]
+        if updated:
+            existing = Room.objects.in_bulk(updated)
+            for room_id, room in existing.items():
+                for field, value in rooms[room_id].items():
+                    if field in ROOM_FIELDS:
+                        setattr(room, field, value)
+            fields = sorted({f for room_id in existing for f in rooms[room_id] if f in ROOM_FIELDS})
+            if fields:
+                Room.objects.bulk_update(existing.values(), fields)
+
+    def _write_participants(self, changed_participants):
+        removed = {}
+        for (room_id, user_id), participant in changed_participants.items():
+            if participant is None:
+                removed.setdefault(room_id, []).append(user_id)
+        for room_id, user_ids in removed.items():
+            for start in range(0, len(user_ids), DELETE_BATCH):
+                Participant.objects.filter(room_id=room_id, user_id__in=user_ids[start:start + DELETE_BATCH]).delete()
+
+        upserts = {key: p for key, p in changed_participants.items() if p is not None}
+        if not upserts:
+            return
+
+        # Skip rooms that were never persisted rather than fail the batch
+        room_ids = set(Room.objects.filter(id__in={room_id for room_id, _ in upserts}).values_list('id', flat=True))
+        rows = [
+            Participant(room_id=room_id, user_id=user_id, **{field: p[field] for field in PARTICIPANT_FIELDS})
+            for (room_id, user_id), p in upserts.items()
+            if room_id in room_ids
+        ]
+        if rows:
+            Participant.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['room', 'user_id'],
+                update_fields=list(PARTICIPANT_FIELDS),
+            )
+
+
+write_behind = WriteBehindQueue()
+
+
+def on_room_changed(sender, room_id, changes, **kwargs):
+    if persistence_enabled():
+        write_behind.room_changed(room_id, changes)
+
+
+def on_participant_changed(sender, room_id, participant, **kwargs):
+    if persistence_enabled():
+        write_behind.participant_changed(room_id, participant)
+
+
+def on_participant_removed(sender, room_id, user_id, **kwargs):
+    if persistence_enabled():
+        write_behind.participant_removed(room_id, user_id)
+
+
+def on_room_deleted(sender, room_id, **kwargs):
+    # Reaped rooms must not come back on the next boot
+    if persistence_enabled():
+        write_behind.room_changed(room_id, {'is_active': False})
+
+
+def restore_rooms(backend=None):
+    """Load active rooms and their participants back into the backend.
+
+    Only needed for the in-process backend; shared backends outlive the
+    process on their own. When sharding, only the rooms this worker owns
+    are loaded, so rooms follow the ring when workers are added or removed.
+    Returns the number of rooms restored.
+    """
+    backend = backend or get_backend()
+    if not backend.in_process:
+        return 0
+
+    restored = 0
+    for room in Room.objects.filter(is_active=True).prefetch_related('participants'):
+        if not owns_room(room.id) or backend.room_exists(room.id):
+            continue
+
+        room_participants = sorted(room.participants.all(), key=lambda p: p.joined_at)
+        backend.create_room(room.id, room.name, room.created_by_id, room.created_by, epoch=room.epoch)
+        # Same epoch, so the chat goes on from its archived tail: restarting
+        # at seq 1 would collide with the messages already archived
+        messages, _ = archive_history(room.id, room.epoch, limit=history_limit())
+        backend.restore_messages(room.id, messages)
+
+        # create_room adds the creator; drop them again if they had left
+        if not any(p.user_id == room.created_by_id for p in room_participants):
+            backend.leave(room.id, room.created_by_id)
+
+        for participant in room_participants:
+            backend.join(room.id, participant.user_id, participant.name)
+            backend.set_stream(room.id, participant.user_id, participant.video_enabled, participant.audio_enabled)
+            # Give everyone one presence timeout to reconnect
+            presence.seen(room.id, participant.user_id)
+        reaper.touch(room.id)
+        restored += 1
+    return restored
+
+
+def restore_on_first_request(sender, **kwargs):
+    # Runs once, in a sync context, before the first request is handled
+    request_started.disconnect(restore_on_first_request)
+    if persistence_enabled():
+        try:
+            count = restore_rooms()
+        except DatabaseError:
+            # e.g. migrations not applied yet; serve with empty state
+            logger.exception('Could not restore rooms from the database')
+            return
+        if count:
+            logger.info('Restored %d active rooms from the database', count)
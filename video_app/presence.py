@@ -0,0 +1,133 @@
+import threading
+import time
+
+from django.conf import settings
+
+from .backends import get_backend
+from .lifecycle import TimingWheel, lifecycle_enabled, reaper
+from .signals import participants_expired
+
+
+class PresenceTracker:
+    """Last-seen tracking for participants, with eviction of the silent ones.
+
+    Any request or socket message from a participant counts as a heartbeat
+    and pushes their deadline PRESENCE_TIMEOUT seconds out. A daemon thread
+    sweeps a timing wheel every PRESENCE_SWEEP_INTERVAL seconds and sends
+    ``participants_expired`` once per room with everyone who went quiet, so
+    a crashed browser stops being called by the rest of the mesh.
+
+    Like the room reaper this only runs for the in-process backend, where
+    every heartbeat reaches the process holding the state.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wheel = None
+        self._rooms = {}  # room_id -> {user_id, ...} being tracked
+        self._thread = None
+
+    @staticmethod
+    def timeout():
+        return getattr(settings, 'PRESENCE_TIMEOUT', 45)
+
+    @staticmethod
+    def interval():
+        return getattr(settings, 'PRESENCE_SWEEP_INTERVAL', 5)
+
+    @property
+    def wheel(self):
+        if self._wheel is None:
+            self._wheel = TimingWheel(resolution=self.interval(), start=time.monotonic())
+        return self._wheel
+
+    def __len__(self):
+        return len(self.wheel)
+
+    def seen(self, room_id, user_id, now=None):
+        """Record a heartbeat from a participant; False if it did not move their deadline."""
+        now = time.monotonic() if now is None else now
+        key = (room_id, user_id)
+        deadline = now + self.timeout()
+        with self._lock:
+            # Heartbeats arrive far more often than the sweep resolution;
+            # skip those that would not move the deadline to another tick
+            current = self.wheel.deadline(key)
+            if current is not None and deadline - current < self.wheel.resolution:
+                return False
+            self.wheel.schedule(key, deadline)
+            self._rooms.setdefault(room_id, set()).add(user_id)
+        self._ensure_started()
+        return True
+
+    def last_seen(self, room_id, user_id):
+        deadline = self.wheel.deadline((room_id, user_id))
+        return None if deadline is None else deadline - self.timeout()
+
+    def forget(self, room_id, user_id):
+        with self._lock:
+            self._discard(room_id, user_id)
+
+    def forget_room(self, room_id):
+        with self._lock:
+            for user_id in self._rooms.pop(room_id, ()):
+                self.wheel.cancel((room_id, user_id))
+
+    def _discard(self, room_id, user_id):
+        self.wheel.cancel((room_id, user_id))
+        users = self._rooms.get(room_id)
+        if users is not None:
+            users.discard(user_id)
+            if not users:
+                del self._rooms[room_id]
+
+    def sweep(self, now=None):
+        """Evict participants past their deadline; returns {room_id: [user_id, ...]}."""
+        now = time.monotonic() if now is None else now
+        expired = {}
+        with self._lock:
+            for room_id, user_id in self.wheel.advance(now):
+                self._discard(room_id, user_id)
+                expired.setdefault(room_id, []).append(user_id)
+
+        for room_id, user_ids in expired.items():
+            participants_expired.send(sender=None, room_id=room_id, user_ids=user_ids)
+        return expired
+
+    def clear(self):
+        with self._lock:
+            self._wheel = None
+            self._rooms.clear()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='presence-sweeper', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval())
+            self.sweep()
+
+
+presence = PresenceTracker()
+
+
+def heartbeat(room_id, user_id):
+    """Note that a participant is still around; cheap enough for every request."""
+    backend = get_backend()
+    if user_id and backend.in_process and backend.is_participant(room_id, user_id):
+        # A call nobody joins, leaves or chats in is still in use
+        if presence.seen(room_id, user_id) and lifecycle_enabled():
+            reaper.touch(room_id)
+
+
+# Signal receivers, connected in VideoAppConfig.ready()
+def on_participant_removed(sender, room_id, user_id, **kwargs):
+    presence.forget(room_id, user_id)
+
+
+def on_room_deleted(sender, room_id, **kwargs):
+    presence.forget_room(room_id)
@@ -0,0 +1,156 @@
+import collections
+import random
+import sys
+import threading
+import time
+
+from django.conf import settings
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f'{frame.f_globals.get("__name__", "?")}.{getattr(code, "co_qualname", code.co_name)}'
+
+
+class StackSampler:
+    """Samples the stacks of chosen threads into collapsed-stack counts.
+
+    A daemon thread wakes every PROFILER_INTERVAL seconds while any thread
+    is tracked and folds each tracked thread's current stack into a
+    ``root;...;leaf`` string, the input format of flamegraph.pl and
+    speedscope. At most PROFILER_MAX_STACKS distinct stacks are kept; later
+    new ones are counted under ``<label>;[other]``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tracked = {}  # thread ident -> [label, ...] of requests on it
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.stacks = collections.Counter()
+        self.samples = 0
+
+    @staticmethod
+    def interval():
+        return getattr(settings, 'PROFILER_INTERVAL', 0.005)
+
+    @staticmethod
+    def max_stacks():
+        return getattr(settings, 'PROFILER_MAX_STACKS', 5000)
+
+    def track(self, ident, label):
+        with self._lock:
+            self._tracked.setdefault(ident, []).append(label)
+        self._ensure_started()
+        self._wakeup.set()
+
+    def untrack(self, ident, label):
+        with self._lock:
+            labels = self._tracked.get(ident)
+            if labels:
+                labels.remove(label)
+                if not labels:
+                    del self._tracked[ident]
+
+    def sample(self):
+        with self._lock:
+            tracked = {ident: labels[0] for ident, labels in self._tracked.items()}
+        if not tracked:
+            return
+        frames = sys._current_frames()
+        for ident, label in tracked.items():
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None and len(names) < 200:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            names.append(label)
+            self._add(';'.join(reversed(names)), label)
+
+    def _add(self, stack, label):
+        with self._lock:
+            self.samples += 1
+            if stack not in self.stacks and len(self.stacks) >= self.max_stacks():
+                stack = f'{label};[other]'
+            self.stacks[stack] += 1
+
+    def collapsed(self):
+        """Flame-graph-ready text: one ``stack count`` line per stack."""
+        with self._lock:
+            return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def clear(self):
+        with self._lock:
+            self.stacks.clear()
+            self.samples = 0
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                idle = not self._tracked
+            if idle:
+                # Nothing to sample: sleep until a request is tracked
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            time.sleep(self.interval())
+            self.sample()
+
+
+class SamplingProfiler:
+    """Decides which requests to profile, and holds their samples.
+
+    A request is profiled when its route is in PROFILER_ROUTES, its room in
+    PROFILER_ROOMS, or else with probability 1/PROFILER_SAMPLE_RATE (0 turns
+    random sampling off). Staff can change all three at runtime through
+    api/admin/profile/; the settings are only the starting point.
+    """
+
+    def __init__(self):
+        self.sampler = StackSampler()
+        self._config = None
+
+    @property
+    def config(self):
+        if self._config is None:
+            self.configure(
+                sample_rate=getattr(settings, 'PROFILER_SAMPLE_RATE', 0),
+                routes=getattr(settings, 'PROFILER_ROUTES', ()),
+                rooms=getattr(settings, 'PROFILER_ROOMS', ()),
+            )
+        return self._config
+
+    def configure(self, sample_rate, routes, rooms):
+        self._config = {
+            'sample_rate': max(0, int(sample_rate)),
+            'routes': frozenset(routes),
+            'rooms': frozenset(rooms),
+        }
+
+    @property
+    def active(self):
+        config = self.config
+        return bool(config['sample_rate'] or config['routes'] or config['rooms'])
+
+    def wants(self, route, room_id):
+        config = self.config
+        if route in config['routes'] or (room_id is not None and room_id in config['rooms']):
+            return True
+        rate = config['sample_rate']
+        return rate > 0 and random.random() * rate < 1
+
+    def reset(self):
+        self._config = None
+        self.sampler.clear()
+
+
+profiler = SamplingProfiler()
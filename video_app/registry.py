@@ -0,0 +1,115 @@
+class ParticipantRecord:
+    __slots__ = ('user_id', 'name', 'is_admin', 'video_enabled', 'audio_enabled')
+
+    def __init__(self, user_id, name, is_admin=False, video_enabled=True, audio_enabled=True):
+        self.user_id = user_id
+        self.name = name
+        self.is_admin = is_admin
+        self.video_enabled = video_enabled
+        self.audio_enabled = audio_enabled
+
+    def as_dict(self):
+        return {
+            'user_id': self.user_id,
+            'name': self.name,
+            'is_admin': self.is_admin,
+            'video_enabled': self.video_enabled,
+            'audio_enabled': self.audio_enabled,
+        }
+
+
+class RoomParticipants:
+    """One room's participants keyed by user_id.
+
+    Dicts keep insertion order and delete in O(1), so the join order used
+    for display survives removals without rebuilding anything.
+    """
+
+    __slots__ = ('_by_id', 'admin')
+
+    def __init__(self):
+        self._by_id = {}
+        self.admin = None
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self):
+        return iter(self._by_id.values())
+
+    def __contains__(self, user_id):
+        return user_id in self._by_id
+
+    def get(self, user_id):
+        return self._by_id.get(user_id)
+
+    def add(self, user_id, name, is_admin=False):
+        """Add a participant unless already present; returns (record, created)."""
+        record = self._by_id.get(user_id)
+        if record is not None:
+            return record, False
+
+        record = self._by_id[user_id] = ParticipantRecord(user_id, name, is_admin)
+        if is_admin:
+            self.admin = record
+        return record, True
+
+    def remove(self, user_id):
+        record = self._by_id.pop(user_id, None)
+        if record is not None and record is self.admin:
+            self.admin = None
+        return record
+
+    def remove_all_except_admin(self):
+        removed = [p for p in self._by_id.values() if p is not self.admin]
+        self._by_id = {self.admin.user_id: self.admin} if self.admin else {}
+        return removed
+
+    def as_list(self):
+        # list() copies the values in one step, so a writer on another
+        # thread cannot change the dict while it is being walked
+        return [p.as_dict() for p in list(self._by_id.values())]
+
+
+class ParticipantRegistry:
+    """Participants of every room, addressed by ``(room_id, user_id)``."""
+
+    def __init__(self):
+        self._rooms = {}
+
+    def __contains__(self, room_id):
+        return room_id in self._rooms
+
+    def room(self, room_id):
+        return self._rooms.get(room_id)
+
+    def ensure_room(self, room_id):
+        room = self._rooms.get(room_id)
+        if room is None:
+            room = self._rooms.setdefault(room_id, RoomParticipants())
+        return room
+
+    def get(self, room_id, user_id):
+        room = self._rooms.get(room_id)
+        return room.get(user_id) if room is not None else None
+
+    def contains(self, room_id, user_id):
+        room = self._rooms.get(room_id)
+        return room is not None and user_id in room
+
+    def count(self, room_id):
+        room = self._rooms.get(room_id)
+        return len(room) if room is not None else 0
+
+    def join(self, room_id, user_id, name, is_admin=False):
+        return self.ensure_room(room_id).add(user_id, name, is_admin)
+
+    def leave(self, room_id, user_id):
+        room = self._rooms.get(room_id)
+        return room.remove(user_id) if room is not None else None
+
+    def drop_room(self, room_id):
+        return self._rooms.pop(room_id, None)
+
+    def clear(self):
+        self._rooms.clear()
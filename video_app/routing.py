@@ -0,0 +1,10 @@
+from django.urls import path
+
+from . import consumers
+
+websocket_urlpatterns = [
+    path('ws/room/<str:room_id>/', consumers.RoomConsumer.as_asgi()),
+
+    # PeerJS clients connect to <path>peerjs?key=...&id=...&token=...
+    path('peerjs/peerjs', consumers.PeerSignalingConsumer.as_asgi()),
+]
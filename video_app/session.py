@@ -0,0 +1,34 @@
+class MeetingUser:
+    """The visitor's meeting identity, as entered on the landing page."""
+
+    __slots__ = ('user_id', 'name', 'email')
+
+    def __init__(self, user_id, name, email):
+        self.user_id = user_id
+        self.name = name
+        self.email = email
+
+
+def get_meeting_user(request):
+    """Return the request's MeetingUser, or None if they have not entered yet.
+
+    The session is decoded once per request and the result cached on it,
+    so views can call this as often as they like.
+    """
+    try:
+        return request._meeting_user
+    except AttributeError:
+        pass
+
+    session = request.session
+    name = session.get('user_name')
+    user = MeetingUser(session.get('user_id'), name, session.get('user_email')) if name else None
+    request._meeting_user = user
+    return user
+
+
+def set_meeting_user(request, user_id, name, email):
+    request.session['user_name'] = name
+    request.session['user_email'] = email
+    request.session['user_id'] = user_id
+    request._meeting_user = MeetingUser(user_id, name, email)
@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import threading
+from bisect import bisect, insort
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+# Set on forwarded requests, so the receiving worker serves them even if
+# its ring disagrees (e.g. halfway through a deploy) instead of bouncing
+FORWARDED_HEADER = 'X-Room-Shard-Forwarded'
+# Names the worker that answered a forwarded request
+SHARD_HEADER = 'X-Room-Shard'
+
+# Not passed on between client, worker and owner
+HOP_BY_HOP_HEADERS = frozenset((
+    'connection', 'keep-alive', 'proxy-connection', 'transfer-encoding', 'te', 'trailer', 'upgrade',
+    'content-length',
+))
+
+# Long-polls are held up to views.LONG_POLL_MAX_WAIT seconds
+FORWARD_TIMEOUT = 60
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Consistent hashing of room IDs onto worker names.
+
+    Each worker is placed on the ring at ``vnodes`` pseudo-random points
+    and owns the keys hashing between its points and the ones before, so
+    rooms spread evenly and adding or removing one of N workers only
+    moves about 1/N of them.
+    """
+
+    def __init__(self, nodes=(), vnodes=128):
+        self.vnodes = vnodes
+        self._points = []  # sorted (hash, node)
+        self.nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def add(self, node):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for replica in range(self.vnodes):
+            insort(self._points, (_hash(f'{node}#{replica}'), node))
+
+    def remove(self, node):
+        self.nodes.discard(node)
+        self._points = [point for point in self._points if point[1] != node]
+
+    def owner(self, key):
+        """The node owning ``key``, or None on an empty ring."""
+        if not self._points:
+            return None
+        index = bisect(self._points, (_hash(key), '')) % len(self._points)
+        return self._points[index][1]
+
+
+def shards():
+    """Worker name -> base URL of every worker; empty unless sharding."""
+    return getattr(settings, 'ROOM_SHARDS', {})
+
+
+def shard_name():
+    return getattr(settings, 'ROOM_SHARD_NAME', '')
+
+
+def sharding_enabled():
+    return bool(shards())
+
+
+_ring = None
+_ring_lock = threading.Lock()
+
+
+def get_ring():
+    global _ring
+    if _ring is None:
+        with _ring_lock:
+            if _ring is None:
+                _ring = HashRing(shards(), getattr(settings, 'ROOM_SHARD_VNODES', 128))
+    return _ring
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    global _ring
+    if setting in ('ROOM_SHARDS', 'ROOM_SHARD_VNODES'):
+        _ring = None
+
+
+def owner(room_id):
+    """Name of the worker holding room_id's state, or None unless sharding."""
+    return get_ring().owner(room_id) if sharding_enabled() else None
+
+
+def owns_room(room_id):
+    return not sharding_enabled() or owner(room_id) == shard_name()
+
+
+async def http_request(url, method, path, headers=(), body=b'', timeout=FORWARD_TIMEOUT):
+    """One HTTP/1.1 request to ``url`` (scheme://host:port).
+
+    Returns (status, [(header, value), ...], body). A new connection per
+    request keeps this small; workers forward to each other over loopback
+    or a local network.
+    """
+    parts = urlsplit(url)
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(parts.hostname, parts.port or 80), timeout,
+    )
+    try:
+        head = [f'{method} {path} HTTP/1.1']
+        head.extend(f'{name}: {value}' for name, value in headers)
+        if not any(name.lower() == 'host' for name, _ in headers):
+            head.append(f'Host: {parts.netloc}')
+        head.append(f'Content-Length: {len(body)}')
+        head.append('Connection: close')
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+        return await asyncio.wait_for(_read_response(reader, method), timeout)
+    finally:
+        writer.close()
+
+
+async def _read_response(reader, method):
+    status_line = await reader.readline()
+    status = int(status_line.split()[1])
+    headers = []
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers.append((name.strip(), value.strip()))
+
+    fields = {name.lower(): value for name, value in headers}
+    if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+        body = b''
+    elif fields.get('transfer-encoding', '').lower() == 'chunked':
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if not size:
+                await reader.readline()
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+        body = b''.join(chunks)
+    elif 'content-length' in fields:
+        body = await reader.readexactly(int(fields['content-length']))
+    else:
+        body = await reader.read()
+    return status, headers, body
+
+
+async def forward(request, shard):
+    """Have worker ``shard`` answer ``request``; returns its response."""
+    from django.http import HttpResponse, JsonResponse
+
+    headers = [
+        (name, value) for name, value in request.headers.items()
+        if name.lower() not in HOP_BY_HOP_HEADERS
+    ]
+    headers.append((FORWARDED_HEADER, shard_name()))
+    headers.append(('X-Forwarded-For', request.META.get('REMOTE_ADDR', '')))
+    try:
+        status, upstream_headers, body = await http_request(
+            shards()[shard], request.method, request.get_full_path(), headers, request.body,
+        )
+    except (OSError, ValueError, IndexError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+        return JsonResponse({'success': False, 'error': 'Room unavailable, try again shortly'}, status=502)
+
+    response = HttpResponse(body, status=status)
+    for name, value in upstream_headers:
+        lower = name.lower()
+        if lower == 'set-cookie':
+            response.cookies.load(value)
+        elif lower not in HOP_BY_HOP_HEADERS:
+            response[name] = value
+    response[SHARD_HEADER] = shard
+    return response
@@ -0,0 +1,23 @@
+from django.dispatch import Signal
+
+# Sent by the views whenever they change room state, so subsystems that
+# mirror it (persistence, indexes, ...) stay in sync without the views
+# knowing about them. Receivers must be cheap: they run on the request path.
+
+# room_id, changes: dict of the room fields that changed (all of them on create)
+room_changed = Signal()
+
+# room_id, participant: the participant's full current dict
+participant_changed = Signal()
+
+# room_id, user_id
+participant_removed = Signal()
+
+# room_id: the room and everything kept for it was freed
+room_deleted = Signal()
+
+# room_id, message: the new chat message's dict
+message_added = Signal()
+
+# room_id, user_ids: participants that stopped sending heartbeats
+participants_expired = Signal()
@@ -0,0 +1,173 @@
+import collections
+import json
+import threading
+
+from django.conf import settings
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is 3-10x slower
+    orjson = None
+
+
+def dumps(value):
+    """Compact JSON as bytes."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(',', ':')).encode()
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def diff_participants(old, new):
+    """(added, removed user_ids, changed) from one ``{user_id: participant}`` to another."""
+    added = [p for user_id, p in new.items() if user_id not in old]
+    removed = [user_id for user_id in old if user_id not in new]
+    changed = [p for user_id, p in new.items() if user_id in old and old[user_id] != p]
+    return added, removed, changed
+
+
+class RoomSnapshot:
+    __slots__ = ('versions', 'bodies', 'diffs', 'chat_seq', 'chat_bodies')
+
+    def __init__(self):
+        self.versions = collections.OrderedDict()  # version -> {user_id: participant}
+        self.bodies = {}  # version -> full participants response
+        self.diffs = {}  # (from version, to version) -> delta response
+        self.chat_seq = None
+        self.chat_bodies = {}  # since -> messages response at chat_seq
+
+
+class SnapshotCache:
+    """Serialized API responses of each room, encoded once per version.
+
+    Every poller of a room asks for the same few things: the participant
+    list at the room's current version, the delta from the version it last
+    saw, and the chat messages after the seq it last saw. Each of those is
+    encoded once and the bytes are shared until the room changes. The last
+    SNAPSHOT_VERSIONS participant lists are kept to compute deltas from;
+    clients further behind get the full list.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rooms = collections.OrderedDict()  # least recently stored first
+
+    @staticmethod
+    def kept_versions():
+        return getattr(settings, 'SNAPSHOT_VERSIONS', 16)
+
+    @staticmethod
+    def max_rooms():
+        return getattr(settings, 'SNAPSHOT_MAX_ROOMS', 10000)
+
+    def _room(self, room_id):
+        # Callers hold the lock. Shared backends never tell this process
+        # about deleted rooms, so the cache is bounded instead.
+        room = self._rooms.get(room_id)
+        if room is None:
+            room = self._rooms[room_id] = RoomSnapshot()
+            while len(self._rooms) > self.max_rooms():
+                self._rooms.popitem(last=False)
+        else:
+            self._rooms.move_to_end(room_id)
+        return room
+
+    def participants(self, backend, room_id, since=None):
+        """Response body for room_id's participants, or None if it has none.
+
+        With ``since`` (a version the client has) the body is a delta when
+        that version is still known, else the full list.
+        """
+        version = backend.room_version(room_id)
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is not None and version in room.versions:
+                if since is None or since not in room.versions:
+                    return room.bodies[version]
+                body = room.diffs.get((since, version))
+                if body is not None:
+                    return body
+                old, new = room.versions[since], room.versions[version]
+            else:
+                old = new = None
+
+        if new is None:
+            participants = backend.list_participants(room_id)
+            if participants is None:
+                return None
+            new = {p['user_id']: p for p in participants}
+            body = dumps({'participants': participants, 'version': version, 'success': True})
+            # A change between the two version reads may be in the list
+            # already; only cache what is known to belong to the version
+            if backend.room_version(room_id) == version:
+                self._store(room_id, version, new, body)
+            if since is None:
+                return body
+            with self._lock:
+                room = self._rooms.get(room_id)
+                old = room.versions.get(since) if room is not None else None
+            if old is None:
+                return body
+
+        added, removed, changed = diff_participants(old, new)
+        body = dumps({
+            'added': added, 'removed': removed, 'changed': changed,
+            'version': version, 'since': since, 'success': True,
+        })
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is not None and version in room.versions:
+                room.diffs[(since, version)] = body
+        return body
+
+    def _store(self, room_id, version, participants, body):
+        with self._lock:
+            room = self._room(room_id)
+            room.versions[version] = participants
+            room.bodies[version] = body
+            room.versions.move_to_end(version)
+            while len(room.versions) > self.kept_versions():
+                dropped, _ = room.versions.popitem(last=False)
+                room.bodies.pop(dropped, None)
+            # Deltas are only asked for towards the newest version
+            room.diffs = {key: value for key, value in room.diffs.items() if key[1] == version}
+
+    def messages(self, room_id, since, last_seq):
+        """Cached messages body for ``since`` if the room is still at ``last_seq``."""
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is None or room.chat_seq != last_seq:
+                return None
+            return room.chat_bodies.get(since)
+
+    def store_messages(self, room_id, since, last_seq, room_messages):
+        body = dumps({'messages': room_messages, 'last_seq': last_seq, 'success': True})
+        with self._lock:
+            room = self._room(room_id)
+            if room.chat_seq != last_seq:
+                if room.chat_seq is not None and last_seq < room.chat_seq:
+                    return body  # a slower request; keep the newer cache
+                room.chat_seq, room.chat_bodies = last_seq, {}
+            if len(room.chat_bodies) < self.kept_versions():
+                room.chat_bodies[since] = body
+        return body
+
+    def forget(self, room_id):
+        with self._lock:
+            self._rooms.pop(room_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._rooms.clear()
+
+
+snapshots = SnapshotCache()
+
+
+def on_room_deleted(sender, room_id, **kwargs):
+    snapshots.forget(room_id)
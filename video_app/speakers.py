@@ -0,0 +1,295 @@
+import logging
+import statistics
+import threading
+import time
+
+from django.conf import settings
+
+from .backends import get_backend
+from .events import broadcast
+
+logger = logging.getLogger(__name__)
+
+# Audio levels as in RFC 6464: -dBov, 0 the loudest and 127 silence
+SILENCE = 127
+MAX_SAMPLES = 50
+
+
+def parse_levels(values):
+    """Audio level samples from a report, or None if they are not valid."""
+    try:
+        levels = [int(value) for value in values]
+    except (TypeError, ValueError):
+        return None
+    if not levels or len(levels) > MAX_SAMPLES or not all(0 <= level <= SILENCE for level in levels):
+        return None
+    return levels
+
+
+class RoomSpeakers:
+    __slots__ = ('lock', 'levels', 'active', 'pins', 'published')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.levels = {}  # user_id -> [smoothed level, monotonic time last heard speaking]
+        self.active = []  # [user_id, monotonic time made active], in order of election
+        self.pins = {}  # viewer -> user_id always received at full quality
+        self.published = None  # last {'active': ..., 'order': ..., 'pins': ...} sent to the room
+
+
+class SpeakerCoordinator:
+    """Active speakers of each room and the video each participant receives.
+
+    Clients report a few audio level samples about once a second. A
+    participant whose smoothed level is past SPEAKER_THRESHOLD is speaking;
+    up to SPEAKER_ACTIVE_COUNT of them are the active speakers. A louder
+    newcomer only takes the quietest one's place when it is louder by
+    SPEAKER_SWITCH_MARGIN dB and that one has held it SPEAKER_MIN_HOLD
+    seconds, and active speakers stay so through SPEAKER_RELEASE seconds of
+    silence, so the speaker tiles do not flicker between two people talking
+    over each other.
+
+    Each viewer then gets a video budget: its pin and the active speakers
+    first, then whoever spoke last, VIDEO_FULL_STREAMS of them at full
+    quality and up to VIDEO_MAX_STREAMS in all, the rest without video.
+    Participants with their camera off take no slot. Only the room's order
+    and the pins are published; each viewer's budget follows from them.
+
+    Reports only mark their room; a background thread re-elects each marked
+    room once every SPEAKER_TICK seconds, however many reports came in.
+    Each room has its own lock. Like presence, the state lives in the
+    process that owns the room.
+    """
+
+    SMOOTHING = 0.5  # weight of each new report
+
+    def __init__(self):
+        self._lock = threading.Lock()  # guards _rooms, _dirty and _thread
+        self._rooms = {}  # room_id -> RoomSpeakers
+        self._dirty = set()  # rooms to re-elect on the next tick
+        self._thread = None
+
+    @staticmethod
+    def tick():
+        return getattr(settings, 'SPEAKER_TICK', 0.25)
+
+    @staticmethod
+    def active_count():
+        return getattr(settings, 'SPEAKER_ACTIVE_COUNT', 2)
+
+    @staticmethod
+    def threshold():
+        return getattr(settings, 'SPEAKER_THRESHOLD', 50)
+
+    @staticmethod
+    def switch_margin():
+        return getattr(settings, 'SPEAKER_SWITCH_MARGIN', 6)
+
+    @staticmethod
+    def min_hold():
+        return getattr(settings, 'SPEAKER_MIN_HOLD', 2.0)
+
+    @staticmethod
+    def release():
+        return getattr(settings, 'SPEAKER_RELEASE', 3.0)
+
+    @staticmethod
+    def full_streams():
+        return getattr(settings, 'VIDEO_FULL_STREAMS', 2)
+
+    @staticmethod
+    def max_streams():
+        return getattr(settings, 'VIDEO_MAX_STREAMS', 6)
+
+    def __len__(self):
+        return len(self._rooms)
+
+    def __contains__(self, room_id):
+        return room_id in self._rooms
+
+    def report(self, room_id, user_id, levels, pin=None, now=None):
+        """Record a participant's level samples; ``pin`` '' unpins."""
+        now = time.monotonic() if now is None else now
+        level = statistics.median(levels)  # a click or a cough is no speech
+        with self._lock:
+            room = self._rooms.setdefault(room_id, RoomSpeakers())
+        with room.lock:
+            entry = room.levels.get(user_id)
+            if entry is None:
+                entry = room.levels[user_id] = [SILENCE, None]
+            entry[0] = entry[0] * (1 - self.SMOOTHING) + level * self.SMOOTHING
+            if entry[0] <= self.threshold():
+                entry[1] = now
+            if pin is not None:
+                if pin:
+                    room.pins[user_id] = pin
+                else:
+                    room.pins.pop(user_id, None)
+
+    def update(self, room_id, participants, now=None):
+        """Re-elect room_id's speakers and order; returns the new state if it changed, else None."""
+        now = time.monotonic() if now is None else now
+        room = self._rooms.get(room_id)
+        if room is None:
+            return None
+        with room.lock:
+            present = {p['user_id'] for p in participants}
+            room.levels = {user_id: entry for user_id, entry in room.levels.items() if user_id in present}
+            room.pins = {
+                viewer: pinned for viewer, pinned in room.pins.items() if viewer in present and pinned in present
+            }
+            self._elect(room, now)
+            state = {
+                'active': [user_id for user_id, _ in room.active],
+                'order': self._order(room, participants),
+                'pins': dict(room.pins),
+                'full_streams': self.full_streams(),
+                'max_streams': self.max_streams(),
+            }
+            if state == room.published:
+                return None
+            room.published = state
+            return state
+
+    def _elect(self, room, now):
+        def speaking(user_id):
+            heard = room.levels[user_id][1]
+            return heard is not None and now - heard <= self.release()
+
+        def level(user_id):
+            return room.levels[user_id][0]
+
+        room.active = [entry for entry in room.active if entry[0] in room.levels and speaking(entry[0])]
+        active = {user_id for user_id, _ in room.active}
+        candidates = sorted((user_id for user_id in room.levels if user_id not in active and speaking(user_id)),
+                            key=level)
+        for user_id in candidates:
+            if len(room.active) < self.active_count():
+                room.active.append([user_id, now])
+                continue
+            quietest = max(room.active, key=lambda entry: level(entry[0]))
+            if now - quietest[1] >= self.min_hold() and level(user_id) + self.switch_margin() <= level(quietest[0]):
+                room.active[room.active.index(quietest)] = [user_id, now]
+
+    def _order(self, room, participants):
+        # Whose video goes first: active speakers, then the most recently
+        # heard, then in joining order; cameras that are off take no slot
+        active = [user_id for user_id, _ in room.active]
+
+        def rank(indexed):
+            index, p = indexed
+            user_id = p['user_id']
+            if user_id in active:
+                return (0, active.index(user_id), index)
+            heard = room.levels.get(user_id, (None, None))[1]
+            if heard is not None:
+                return (1, -heard, index)
+            return (2, 0, index)
+
+        videos = [indexed for indexed in enumerate(participants) if indexed[1]['video_enabled']]
+        return [p['user_id'] for _, p in sorted(videos, key=rank)]
+
+    @staticmethod
+    def budget(state, viewer):
+        """``viewer``'s ``{'full': [...], 'reduced': [...]}`` under a published state.
+
+        Its pin first, then the room's order; clients derive theirs the
+        same way from the speakers.updated event.
+        """
+        pinned = state['pins'].get(viewer)
+        ranked = [user_id for user_id in state['order'] if user_id not in (viewer, pinned)]
+        if pinned is not None and pinned != viewer and pinned in state['order']:
+            ranked.insert(0, pinned)
+        streams = ranked[:state['max_streams']]
+        return {'full': streams[:state['full_streams']], 'reduced': streams[state['full_streams']:]}
+
+    def subscriptions(self, room_id, viewer, participants):
+        """What ``viewer`` receives of everyone else: ``{user_id: {'video': tier, 'audio': bool}}``.
+
+        The participant's own video_enabled/audio_enabled, narrowed by the
+        viewer's budget; before any budget everyone's video is full.
+        """
+        room = self._rooms.get(room_id)
+        state = room.published if room is not None else None
+        budget = self.budget(state, viewer) if state is not None else None
+        subscriptions = {}
+        for p in participants:
+            if p['user_id'] == viewer:
+                continue
+            if not p['video_enabled']:
+                video = 'off'
+            elif budget is None or p['user_id'] in budget['full']:
+                video = 'full'
+            elif p['user_id'] in budget['reduced']:
+                video = 'reduced'
+            else:
+                video = 'off'
+            subscriptions[p['user_id']] = {'video': video, 'audio': p['audio_enabled']}
+        return subscriptions
+
+    def schedule(self, room_id):
+        """Re-elect room_id on the next tick."""
+        with self._lock:
+            self._dirty.add(room_id)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='speakers', daemon=True)
+                self._thread.start()
+
+    def flush(self):
+        """Re-elect every scheduled room and publish what changed; returns how many were re-elected."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        backend = get_backend()
+        for room_id in dirty:
+            if room_id not in self._rooms:
+                continue
+            participants = backend.list_participants(room_id)
+            state = self.update(room_id, participants) if participants else None
+            if state is not None:
+                broadcast(room_id, 'speakers.updated', **state)
+        return len(dirty)
+
+    def _run(self):
+        while True:
+            time.sleep(self.tick())
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Speaker tick failed')
+
+    def forget(self, room_id):
+        with self._lock:
+            self._rooms.pop(room_id, None)
+            self._dirty.discard(room_id)
+
+    def clear(self):
+        with self._lock:
+            self._rooms.clear()
+            self._dirty.clear()
+
+
+speakers = SpeakerCoordinator()
+
+
+def report_levels(room_id, user_id, levels, pin=None):
+    """Take a participant's level report; returns their subscriptions, or None if not in the room."""
+    participants = get_backend().list_participants(room_id)
+    if not participants or not any(p['user_id'] == user_id for p in participants):
+        return None
+    speakers.report(room_id, user_id, levels, pin)
+    speakers.schedule(room_id)
+    return speakers.subscriptions(room_id, user_id, participants)
+
+
+def on_participant_changed(sender, room_id, participant, **kwargs):
+    # A camera turned on or off frees or takes a slot in everyone's budget
+    if room_id in speakers:
+        speakers.schedule(room_id)
+
+
+def on_participant_removed(sender, room_id, user_id, **kwargs):
+    on_participant_changed(sender, room_id, None)
+
+
+def on_room_deleted(sender, room_id, **kwargs):
+    speakers.forget(room_id)
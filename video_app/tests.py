@@ -1,3 +1,1729 @@
-from django.test import TestCase
+import asyncio
+import http.server
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.db import DatabaseError
+from django.http import HttpResponse
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from meet_clone.asgi import application
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+from .admission import (
+    acquire, chat_room_limiter, chat_user_limiter, load_shedder, moderation_room_limiter,
+    moderation_user_limiter, waiting_room,
+)
+from .archive import archive, search_query
+from .backends import get_backend, reset_backend
+from .backends.memory import InMemoryRoomState
+from .checkpoint import checkpointer
+from .directory import RoomDirectory, SortedKeys, directory, encode_cursor
+from .lifecycle import TimingWheel, allocate_room, reaper
+from .presence import heartbeat, presence
+from .fanout import fanout
+from .metrics import Histogram, registry
+from .profiling import profiler
+from .models import ArchivedMessage, Participant, Room
+from .persistence import MAX_FLUSH_ATTEMPTS, restore_rooms, write_behind
+from .chat import ChatStore
+from .events import broadcast
+from .registry import RoomParticipants
+from .sharding import FORWARDED_HEADER, HashRing, owner
+from .signals import room_deleted
+from .snapshots import dumps as snapshots_dumps, snapshots
+from .speakers import SpeakerCoordinator, report_levels, speakers
+
+
+class RoomTestMixin:
+    def setUp(self):
+        reset_backend()
+        reaper.clear()
+        presence.clear()
+        fanout.clear()
+        profiler.reset()
+        archive.clear()
+        snapshots.clear()
+        waiting_room.clear()
+        load_shedder.reset()
+        speakers.clear()
+        checkpointer.clear()
+        directory.clear()
+        # Rate limits and load shedding are timing-dependent; AdmissionTests
+        # turns them back on
+        test_settings = override_settings(
+            ROOM_PERSISTENCE_ENABLED=False, CHAT_ARCHIVE_ENABLED=False, ROOM_CHECKPOINT_ENABLED=False,
+            CHAT_USER_RATE=None, CHAT_ROOM_RATE=None, MODERATION_USER_RATE=None, MODERATION_ROOM_RATE=None,
+            OVERLOAD_MAX_IN_FLIGHT=None, OVERLOAD_MAX_LATENCY=None,
+        )
+        test_settings.enable()
+        self.addCleanup(test_settings.disable)
+
+    def enter(self, client, name):
+        client.post('/', {'name': name, 'email': f'{name}@example.com'})
+        return client.session['user_id']
+
+    def create_room(self, client, name='Standup'):
+        response = client.post('/create-room/', {'room_name': name})
+        return response['Location'].strip('/').split('/')[-1]
+
+
+def websocket(client, path):
+    cookie = f'sessionid={client.cookies["sessionid"].value}'
+    return WebsocketCommunicator(
+        application,
+        path,
+        headers=[(b'cookie', cookie.encode()), (b'origin', b'http://testserver')],
+    )
+
+
+class RoomConsumerTests(RoomTestMixin, TransactionTestCase):
+    def connect(self, client, room_id):
+        return websocket(client, f'/ws/room/{room_id}/')
+
+    def test_chat_message_is_pushed_to_room(self):
+        self.enter(self.client, 'host')
+        room_id = self.create_room(self.client)
+
+        @async_to_sync
+        async def scenario():
+            communicator = self.connect(self.client, room_id)
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+
+            await sync_to_async(self.client.post)(
+                f'/api/room/{room_id}/chat/send/', {'message': 'hello'}
+            )
+            frame = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return frame['events'][0]
+
+        event = scenario()
+        self.assertEqual(event['event'], 'chat.message')
+        self.assertEqual(event['message']['message'], 'hello')
+
+    @override_settings(FANOUT_TICK=0.5)
+    def test_burst_is_coalesced_into_one_frame(self):
+        host_id = self.enter(self.client, 'host')
+        room_id = self.create_room(self.client)
+        mute_url = f'/api/room/{room_id}/mute/{host_id}/'
+
+        @async_to_sync
+        async def scenario():
+            communicator = self.connect(self.client, room_id)
+            await communicator.connect()
+            post = sync_to_async(self.client.post)
+            await post(mute_url)
+            await post(mute_url)
+            await post(f'/api/room/{room_id}/chat/send/', {'message': 'hello'})
+            frame = await communicator.receive_json_from(timeout=2)
+            self.assertTrue(await communicator.receive_nothing(timeout=0.6))
+            await communicator.disconnect()
+            return frame['events']
+
+        events = scenario()
+        # Both toggles' system messages, then only the latest participant state
+        self.assertEqual(
+            [e['event'] for e in events],
+            ['chat.message', 'chat.message', 'participant.updated', 'chat.message'],
+        )
+        self.assertTrue(events[2]['participant']['audio_enabled'])
+
+        stats = fanout.stats()
+        self.assertEqual(stats['events_coalesced'], 1)
+        self.assertEqual(stats['batches_sent'], 1)
+        self.assertEqual(stats['queue_depth'], 0)
+
+    @override_settings(FANOUT_TICK=0.2)
+    def test_events_from_background_threads_are_batched(self):
+        self.enter(self.client, 'host')
+        room_id = self.create_room(self.client)
+
+        @async_to_sync
+        async def scenario():
+            communicator = self.connect(self.client, room_id)
+            await communicator.connect()
+
+            def evict():
+                # e.g. the presence sweeper, on a thread of its own
+                broadcast(room_id, 'participant.left', user_id='u1')
+                broadcast(room_id, 'participant.left', user_id='u2')
+
+            thread = threading.Thread(target=evict)
+            thread.start()
+            await sync_to_async(thread.join)()
+            frame = await communicator.receive_json_from(timeout=2)
+            await communicator.disconnect()
+            return frame['events']
+
+        self.assertEqual([e['user_id'] for e in scenario()], ['u1', 'u2'])
+        self.assertEqual(fanout.stats()['batches_sent'], 1)
+
+    def test_non_participant_is_rejected(self):
+        self.enter(self.client, 'host')
+        room_id = self.create_room(self.client)
+
+        other = self.client_class()
+        self.enter(other, 'guest')
+
+        @async_to_sync
+        async def scenario():
+            communicator = self.connect(other, room_id)
+            connected, _ = await communicator.connect()
+            return connected
+
+        self.assertFalse(scenario())
+
+
+class ChatCursorTests(RoomTestMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.enter(self.client, 'host')
+        self.room_id = self.create_room(self.client)
+        self.url = f'/api/room/{self.room_id}/chat/messages/'
+
+    def send(self, text):
+        return self.client.post(f'/api/room/{self.room_id}/chat/send/', {'message': text})
+
+    def test_since_returns_only_newer_messages(self):
+        self.send('one')
+        self.send('two')
+        self.send('three')
+
+        data = self.client.get(self.url, {'since': 1}).json()
+        self.assertEqual([m['message'] for m in data['messages']], ['two', 'three'])
+        self.assertEqual(data['last_seq'], 3)
+
+    def test_unchanged_room_answers_not_modified(self):
+        self.send('one')
+        response = self.client.get(self.url)
+        etag = response['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.send('two')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_long_poll_wakes_on_new_message(self):
+        @async_to_sync
+        async def scenario():
+            poll = asyncio.ensure_future(
+                self.async_client.get(self.url, {'since': 0, 'wait': 10})
+            )
+            await asyncio.sleep(0.1)
+            self.assertFalse(poll.done())
+
+            await sync_to_async(self.send)('hello')
+            return await asyncio.wait_for(poll, 5)
+
+        data = scenario().json()
+        self.assertEqual([m['message'] for m in data['messages']], ['hello'])
+
+    def test_long_poll_returns_when_the_room_is_deleted(self):
+        def delete_room():
+            # As the reaper does
+            get_backend().delete_room(self.room_id)
+            room_deleted.send(sender=None, room_id=self.room_id)
+
+        @async_to_sync
+        async def scenario():
+            poll = asyncio.ensure_future(
+                self.async_client.get(self.url, {'since': 0, 'wait': 20})
+            )
+            await asyncio.sleep(0.1)
+            self.assertFalse(poll.done())
+
+            await sync_to_async(delete_room)()
+            return await asyncio.wait_for(poll, 3)
+
+        self.assertEqual(scenario().json(), {'messages': [], 'success': False})
+
+
+class BackendSelectionTests(SimpleTestCase):
+    def test_concurrent_first_use_shares_one_backend(self):
+        reset_backend()
+        barrier = threading.Barrier(8)
+        backends = []
+
+        def first_request():
+            barrier.wait()
+            backends.append(get_backend())
+
+        threads = [threading.Thread(target=first_request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len({id(backend) for backend in backends}), 1)
+
+
+class ChatStoreTests(SimpleTestCase):
+    def test_evicts_oldest_past_capacity(self):
+        store = ChatStore(capacity=3)
+        for i in range(5):
+            store.append('u1', 'Ann', f'm{i}')
+
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.first_seq, 3)
+        self.assertEqual([m.message for m in store], ['m2', 'm3', 'm4'])
+
+    def test_range_reads_by_sequence(self):
+        store = ChatStore(capacity=3)
+        for i in range(5):
+            store.append('u1', 'Ann', f'm{i}')
+
+        self.assertEqual([m.seq for m in store.since(3)], [4, 5])
+        self.assertEqual([m.seq for m in store.since(0)], [3, 4, 5])
+        self.assertEqual(store.since(5), [])
+        self.assertEqual([m.seq for m in store.latest(2)], [4, 5])
+
+    @override_settings(CHAT_HISTORY_LIMIT=2)
+    def test_system_messages_share_the_retention_limit(self):
+        store = ChatStore()
+        for i in range(4):
+            store.append('system', 'System', f'muted {i}', is_system=True)
+        self.assertEqual(len(store), 2)
+
+
+class RoomParticipantsTests(SimpleTestCase):
+    def test_join_is_idempotent_and_keeps_order(self):
+        room = RoomParticipants()
+        room.add('a', 'Ann', is_admin=True)
+        room.add('b', 'Bob')
+        _, created = room.add('b', 'Bob')
+        room.add('c', 'Cat')
+
+        self.assertFalse(created)
+        self.assertEqual([p.user_id for p in room], ['a', 'b', 'c'])
+        self.assertEqual(len(room), 3)
+
+    def test_remove_all_keeps_admin(self):
+        room = RoomParticipants()
+        room.add('a', 'Ann', is_admin=True)
+        room.add('b', 'Bob')
+        room.add('c', 'Cat')
+
+        removed = room.remove_all_except_admin()
+        self.assertEqual([p.user_id for p in removed], ['b', 'c'])
+        self.assertEqual([p.user_id for p in room], ['a'])
+        self.assertIs(room.admin, room.get('a'))
+
+    def test_removing_admin_clears_pointer(self):
+        room = RoomParticipants()
+        room.add('a', 'Ann', is_admin=True)
+        room.remove('a')
+        self.assertIsNone(room.admin)
+        self.assertEqual(room.remove_all_except_admin(), [])
+
+
+class RoomStateBackendContract:
+    def make_backend(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.backend = self.make_backend()
+        self.backend.create_room('ROOM1', 'Standup', 'host', 'Hana')
+
+    def test_room_lifecycle(self):
+        room = self.backend.get_room('ROOM1')
+        self.assertEqual(room['created_by_id'], 'host')
+        self.assertTrue(room['is_active'])
+        self.assertIsNone(self.backend.get_room('NOPE'))
+
+        self.backend.deactivate_room('ROOM1')
+        self.assertFalse(self.backend.get_room('ROOM1')['is_active'])
+
+    def test_participants_keep_join_order(self):
+        _, created = self.backend.join('ROOM1', 'u1', 'Ann')
+        self.assertTrue(created)
+        _, created = self.backend.join('ROOM1', 'u1', 'Ann')
+        self.assertFalse(created)
+        self.backend.join('ROOM1', 'u2', 'Bob')
+
+        names = [p['name'] for p in self.backend.list_participants('ROOM1')]
+        self.assertEqual(names, ['Hana', 'Ann', 'Bob'])
+        self.assertTrue(self.backend.is_participant('ROOM1', 'u2'))
+        self.assertIsNone(self.backend.list_participants('NOPE'))
+
+    def test_join_respects_capacity(self):
+        self.assertTrue(self.backend.join('ROOM1', 'u1', 'Ann', capacity=2)[1])
+        self.assertEqual(self.backend.join('ROOM1', 'u2', 'Bob', capacity=2), (None, False))
+        # Those already in keep their seat
+        participant, created = self.backend.join('ROOM1', 'u1', 'Ann', capacity=2)
+        self.assertEqual((participant['name'], created), ('Ann', False))
+        self.assertEqual(len(self.backend.list_participants('ROOM1')), 2)
+
+    def test_leave_reports_remaining(self):
+        self.backend.join('ROOM1', 'u1', 'Ann')
+        left, remaining = self.backend.leave('ROOM1', 'u1')
+        self.assertEqual(left['name'], 'Ann')
+        self.assertEqual(remaining, 1)
+        self.assertEqual(self.backend.leave('ROOM1', 'u1'), (None, 1))
+
+    def test_moderation(self):
+        self.backend.join('ROOM1', 'u1', 'Ann')
+        self.backend.join('ROOM1', 'u2', 'Bob')
+
+        self.assertFalse(self.backend.toggle_audio('ROOM1', 'u1')['audio_enabled'])
+        self.assertIsNone(self.backend.toggle_audio('ROOM1', 'ghost'))
+
+        muted = self.backend.mute_all('ROOM1')
+        self.assertEqual([p['user_id'] for p in muted], ['u2'])
+
+        removed = self.backend.remove_all('ROOM1')
+        self.assertEqual([p['user_id'] for p in removed], ['u1', 'u2'])
+        self.assertEqual([p['user_id'] for p in self.backend.list_participants('ROOM1')], ['host'])
+
+    def test_host_stays_admin_after_rejoining(self):
+        self.backend.join('ROOM1', 'u1', 'Ann')
+        self.backend.leave('ROOM1', 'host')
+        participant, _ = self.backend.join('ROOM1', 'host', 'Hana')
+        self.assertTrue(participant['is_admin'])
+
+        self.assertEqual([p['user_id'] for p in self.backend.mute_all('ROOM1')], ['u1'])
+        self.assertEqual([p['user_id'] for p in self.backend.remove_all('ROOM1')], ['u1'])
+        self.assertEqual([p['user_id'] for p in self.backend.list_participants('ROOM1')], ['host'])
+        self.assertEqual(self.backend.moderate('ROOM1', ['host'], {'remove'}), ([], []))
+
+    def test_batch_moderation(self):
+        for user_id, name in (('u1', 'Ann'), ('u2', 'Bob'), ('u3', 'Cy')):
+            self.backend.join('ROOM1', user_id, name)
+        self.backend.set_stream('ROOM1', 'u2', True, False)
+
+        changed, removed = self.backend.moderate('ROOM1', ['host', 'u1', 'u2', 'ghost'], {'mute', 'disable_video'})
+        self.assertEqual([p['user_id'] for p in changed], ['u1', 'u2'])
+        self.assertEqual(removed, [])
+        self.assertTrue(all(not p['audio_enabled'] and not p['video_enabled'] for p in changed))
+        self.assertTrue(self.backend.list_participants('ROOM1')[0]['audio_enabled'])
+
+        # Already muted: nothing to report
+        self.assertEqual(self.backend.moderate('ROOM1', ['u1'], {'mute'}), ([], []))
+
+        changed, removed = self.backend.moderate('ROOM1', ['u1', 'u3'], {'unmute', 'remove'})
+        self.assertEqual(changed, [])
+        self.assertEqual([p['user_id'] for p in removed], ['u1', 'u3'])
+        self.assertEqual([p['user_id'] for p in self.backend.list_participants('ROOM1')], ['host', 'u2'])
+
+    def test_room_version_changes_with_participants(self):
+        versions = [self.backend.room_version('ROOM1')]
+
+        def changed():
+            versions.append(self.backend.room_version('ROOM1'))
+            return versions[-1] != versions[-2]
+
+        self.backend.join('ROOM1', 'u1', 'Ann')
+        self.assertTrue(changed())
+        self.backend.join('ROOM1', 'u1', 'Ann')
+        self.assertFalse(changed())
+        self.backend.toggle_audio('ROOM1', 'u1')
+        self.assertTrue(changed())
+        self.backend.moderate('ROOM1', ['u1'], {'mute'})
+        self.assertFalse(changed())
+        self.backend.leave('ROOM1', 'u1')
+        self.assertTrue(changed())
+
+        self.backend.delete_room('ROOM1')
+        self.assertEqual(self.backend.room_version('ROOM1'), 0)
+        self.backend.create_room('ROOM1', 'Standup', 'host', 'Hana')
+        self.assertNotIn(self.backend.room_version('ROOM1'), versions)
+
+    @override_settings(CHAT_HISTORY_LIMIT=3)
+    def test_chat_cursor_and_retention(self):
+        self.backend.create_room('ROOM2', 'Retro', 'host', 'Hana')
+        for i in range(5):
+            self.backend.add_message('ROOM2', 'host', 'Hana', f'm{i}')
+
+        messages, last_seq = self.backend.messages_since('ROOM2', 3)
+        self.assertEqual(last_seq, 5)
+        self.assertEqual([m['message'] for m in messages], ['m3', 'm4'])
+        self.assertEqual(len(self.backend.messages_since('ROOM2', 0)[0]), 3)
+        self.assertEqual([m['seq'] for m in self.backend.latest_messages('ROOM2', 2)], [4, 5])
+        self.assertIsNone(self.backend.add_message('NOPE', 'host', 'Hana', 'hi'))
+
+    def test_concurrent_messages_are_visible_with_their_seq(self):
+        self.backend.create_room('ROOM3', 'Retro', 'host', 'Hana')
+        done = threading.Event()
+        gaps = []
+
+        def read():
+            while not done.is_set():
+                messages, last_seq = self.backend.messages_since('ROOM3', 0)
+                if last_seq and (not messages or messages[-1]['seq'] != last_seq):
+                    gaps.append(last_seq)
+
+        def write(writer):
+            for i in range(20):
+                self.backend.add_message('ROOM3', f'user{writer}', 'Guest', f'm{i}')
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        writers = [threading.Thread(target=write, args=(writer,)) for writer in range(4)]
+        for thread in writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        done.set()
+        reader.join()
+
+        messages, last_seq = self.backend.messages_since('ROOM3', 0)
+        self.assertEqual(last_seq, 80)
+        self.assertEqual([m['seq'] for m in messages], list(range(1, 81)))
+        self.assertEqual(gaps, [])
+
+
+class InMemoryRoomStateTests(RoomStateBackendContract, SimpleTestCase):
+    def make_backend(self):
+        return InMemoryRoomState()
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class RedisRoomStateTests(RoomStateBackendContract, SimpleTestCase):
+    def make_backend(self):
+        from .backends.redis import RedisRoomState
+        return RedisRoomState(client=fakeredis.FakeRedis(decode_responses=True))
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class RedisChatCursorTests(ChatCursorTests):
+    def setUp(self):
+        redis_settings = override_settings(
+            ROOM_STATE_BACKEND='video_app.backends.redis.RedisRoomState',
+            ROOM_STATE_OPTIONS={'client': fakeredis.FakeRedis(decode_responses=True)},
+        )
+        redis_settings.enable()
+        self.addCleanup(redis_settings.disable)
+        super().setUp()
+
+
+@override_settings(ROOM_PERSISTENCE_INTERVAL=3600)
+class WriteBehindPersistenceTests(RoomTestMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        # The mixin turns persistence off for everyone else
+        test_settings = override_settings(ROOM_PERSISTENCE_ENABLED=True)
+        test_settings.enable()
+        self.addCleanup(test_settings.disable)
+        write_behind.flush()
+
+    def test_changes_are_written_only_on_flush(self):
+        host_id = self.enter(self.client, 'host')
+        room_id = self.create_room(self.client)
+        guest = self.client_class()
+        guest_id = self.enter(guest, 'guest')
+        guest.post('/join-room/', {'room_id': room_id})
+        self.client.post(f'/api/room/{room_id}/mute/{guest_id}/')
+
+        self.assertFalse(Room.objects.exists())
+        write_behind.flush()
+
+        room = Room.objects.get(id=room_id)
+        self.assertEqual(room.created_by_id, host_id)
+        self.assertTrue(room.is_active)
+        guest_row = Participant.objects.get(room=room, user_id=guest_id)
+        self.assertFalse(guest_row.audio_enabled)
+        self.assertEqual(write_behind.pending(), 0)
+
+    def test_leaving_deletes_participant_and_deactivates_room(self):
+        self.enter(self.client, 'host')
+        room_id = self.create_room(self.client)
+        write_behind.flush()
+
+        self.client.get(f'/room/{room_id}/leave/')
+        write_behind.flush()
+
+        self.assertFalse(Room.objects.get(id=room_id).is_active)
+        self.assertFalse(Participant.objects.exists())
+
+    def test_many_removals_are_written_in_batches(self):
+        self.enter(self.client, 'host')
+        room_ids = [self.create_room(self.client, f'Room {index}') for index in range(50)]
+        write_behind.flush()
+        for index in range(1200):
+            write_behind.participant_removed(room_ids[index % 50], f'guest{index}')
+        self.assertEqual(write_behind.flush(), 1200)
+        self.assertEqual(Participant.objects.count(), 50)  # the hosts
+
+    def test_failing_batches_are_dropped_eventually(self):
+        write_behind.participant_removed('ROOM1', 'guest')
+        with mock.patch.object(write_behind, '_write_participants', side_effect=DatabaseError('locked')):
+            for _ in range(MAX_FLUSH_ATTEMPTS - 1):
+                with self.assertRaises(DatabaseError):
+                    write_behind.flush()
+                self.assertEqual(write_behind.pending(), 1)
+            with self.assertRaises(DatabaseError), self.assertLogs('video_app.persistence', 'ERROR'):
+                write_behind.flush()
+        self.assertEqual(write_behind.pending(), 0)
+
+    def test_restore_loads_active_rooms(self):
+        self.enter(self.client, 'host')
+        room_id = self.create_room(self.client)
+        guest = self.client_class()
+        guest_id = self.enter(guest, 'guest')
+        guest.post('/join-room/', {'room_id': room_id})
+        write_behind.flush()
+
+        backend = InMemoryRoomState()
+        self.assertEqual(restore_rooms(backend), 1)
+        self.assertTrue(backend.is_participant(room_id, guest_id))
+        self.assertEqual(len(backend.list_participants(room_id)), 2)
+
+    @override_settings(CHAT_ARCHIVE_ENABLED=True, CHAT_ARCHIVE_INTERVAL=3600)
+    def test_restore_keeps_the_meeting_archive(self):
+        self.enter(self.client, 'host')
+        room_id = self.create_room(self.client)
+        for text in ('one', 'two'):
+            self.client.post(f'/api/room/{room_id}/chat/send/', {'message': text})
+        archive.flush()
+        write_behind.flush()
+        epoch = get_backend().get_room(room_id)['epoch']
+
+        backend = InMemoryRoomState()
+        restore_rooms(backend)
+        self.assertEqual(backend.get_room(room_id)['epoch'], epoch)
+        self.assertEqual([m['message'] for m in backend.messages_since(room_id, 0)[0]], ['one', 'two'])
+        # New messages are numbered after the archived ones, not over them
+        self.assertEqual(backend.add_message(room_id, 'host', 'Host', 'three')['seq'], 3)
+
+
+class CheckpointTests(RoomTestMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'rooms.checkpoint')
+        test_settings = override_settings(ROOM_CHECKPOINT_PATH=self.path)
+        test_settings.enable()
+        self.addCleanup(test_settings.disable)
+
+    def test_restart_restores_rooms_with_chat(self):
+        self.enter(self.client, 'host')
+        room_id = self.create_room(self.client)
+        guest = self.client_class()
+        guest_id = self.enter(guest, 'guest')
+        guest.post('/join-room/', {'room_id': room_id})
+        guest.post(f'/api/room/{room_id}/chat/send/', {'message': 'hello'})
+        self.client.post(f'/api/room/{room_id}/mute/{guest_id}/')
+        before = get_backend()
+        participants, messages = before.list_participants(room_id), before.latest_messages(room_id, 10)
+        version = before.room_version(room_id)
+        self.assertEqual(checkpointer.write(), 1)
+
+        reset_backend()  # the restart
+        checkpointer.clear()
+        self.assertEqual(checkpointer.restore(), 1)
+        backend = get_backend()
+        self.assertEqual(backend.list_participants(room_id), participants)
+        self.assertEqual(backend.latest_messages(room_id, 10), messages)
+        self.assertEqual(backend.room_version(room_id), version)
+        self.assertTrue(presence.last_seen(room_id, guest_id))
+        response = guest.post(f'/api/room/{room_id}/chat/send/', {'message': 'back'})
+        self.assertEqual(response.json()['message']['seq'], messages[-1]['seq'] + 1)
+
+    def test_only_changed_rooms_are_encoded_again(self):
+        self.enter(self.client, 'host')
+        first, second = self.create_room(self.client, 'One'), self.create_room(self.client, 'Two')
+        checkpointer.write()
+        self.assertEqual(checkpointer.stats['encoded'], 2)
+
+        self.client.post(f'/api/room/{first}/chat/send/', {'message': 'hello'})
+        checkpointer.write()
+        self.assertEqual(checkpointer.stats['encoded'], 1)
+        os.utime(self.path, (0, 0))
+        checkpointer.write()
+        self.assertEqual(checkpointer.stats['encoded'], 0)
+        self.assertGreater(os.stat(self.path).st_mtime, 0)  # still marked current
+
+        get_backend().delete_room(second)
+        checkpointer.write()
+        backend = InMemoryRoomState()
+        self.assertEqual(checkpointer.restore(backend), 1)
+        self.assertEqual(backend.last_seq(first), 1)
+
+    @override_settings(ROOM_SHARDS={'w0': 'http://127.0.0.1:8100', 'w1': 'http://127.0.0.1:8101'})
+    def test_each_shard_writes_its_own_checkpoint(self):
+        with override_settings(ROOM_SHARD_NAME='w0'):
+            checkpointer.write()
+        with override_settings(ROOM_SHARD_NAME='w1'):
+            checkpointer.write()
+        self.assertEqual(sorted(os.listdir(os.path.dirname(self.path))), ['rooms.checkpoint.w0', 'rooms.checkpoint.w1'])
+
+    def test_stale_checkpoints_are_ignored(self):
+        self.enter(self.client, 'host')
+        self.create_room(self.client)
+        checkpointer.write()
+        stale = time.time() - 3600
+        os.utime(self.path, (stale, stale))
+        self.assertEqual(checkpointer.restore(InMemoryRoomState()), 0)
+
+
+class RoomDirectoryTests(RoomTestMixin, TransactionTestCase):
+    def list_rooms(self, **params):
+        from django.contrib.auth.models import User
+
+        staff = self.client_class()
+        staff.force_login(User.objects.get_or_create(username='ops', is_staff=True)[0])
+        return staff.get('/api/admin/rooms/', params)
+
+    def test_directory_follows_rooms(self):
+        self.enter(self.client, 'host')
+        standup, review = self.create_room(self.client, 'Standup'), self.create_room(self.client, 'Design review')
+        guest = self.client_class()
+        self.enter(guest, 'guest')
+        guest.post('/join-room/', {'room_id': standup})
+
+        rooms = self.list_rooms(order='participants').json()['rooms']
+        self.assertEqual([(room['room_id'], room['participants']) for room in rooms], [(standup, 2), (review, 1)])
+        self.assertEqual(rooms[0]['name'], 'Standup')
+        self.client.post(f'/api/room/{review}/chat/send/', {'message': 'hello'})
+        self.assertEqual([room['room_id'] for room in self.list_rooms().json()['rooms']], [review, standup])
+        self.assertEqual([room['room_id'] for room in self.list_rooms(q='design').json()['rooms']], [review])
+        self.assertEqual([room['room_id'] for room in self.list_rooms(q=review[:4].lower()).json()['rooms']], [review])
+
+        # The last one out deactivates the room
+        self.client.post(f'/room/{review}/leave/')
+        response = self.list_rooms().json()
+        self.assertEqual([room['room_id'] for room in response['rooms']], [standup])
+        self.assertEqual(response['active_rooms'], 1)
+
+        # Rooms restored on restart send no signals; the first request indexes them
+        directory.clear()
+        directory.rebuild(get_backend())
+        self.assertEqual(directory.page()[0][0]['participants'], 2)
+
+    def test_pages_follow_the_cursor(self):
+        rooms = RoomDirectory()
+        for index in range(10):
+            rooms.add(f'R{index}', f'Room {index}', now=index)
+        rooms.joined('R3', 'alice', now=3)
+        seen, cursor = [], None
+        while True:
+            page, cursor = rooms.page('activity', 3, cursor)
+            seen.extend(room['room_id'] for room in page)
+            if len(seen) == 3:
+                rooms.touch('R0', now=20)  # moves to the front, behind the cursor
+            if cursor is None:
+                break
+        self.assertEqual(seen, [f'R{index}' for index in range(9, 0, -1)])
+        self.assertEqual(rooms.page('participants', 1)[0][0]['room_id'], 'R3')
+
+        # A room matching by name and by ID is listed once
+        rooms.add('ROOMX', 'Room X')
+        page, cursor = rooms.search('ROOM', 5)
+        found = [room['room_id'] for room in page]
+        while cursor:
+            page, cursor = rooms.search('ROOM', 5, cursor)
+            found.extend(room['room_id'] for room in page)
+        self.assertEqual(sorted(found), sorted([f'R{index}' for index in range(10)] + ['ROOMX']))
+        with self.assertRaises(ValueError):
+            rooms.page('activity', 3, 'not a cursor')
+        # Cursors that would not compare with the index's keys
+        for key in (['x', None], [1, 'R1', 2], [True, 'R1']):
+            with self.assertRaises(ValueError):
+                rooms.page('participants', 3, encode_cursor(key))
+        with self.assertRaises(ValueError):
+            rooms.search('room', 3, encode_cursor([1, 'R1']))
+
+    def test_sorted_keys_split_and_merge_blocks(self):
+        keys = SortedKeys()
+        keys.LOAD = 2
+        for key in [5, 1, 9, 3, 7, 2, 8, 6, 4, 0]:
+            keys.add(key)
+        self.assertEqual(list(keys.after()), list(range(10)))
+        for key in [0, 4, 5, 9]:
+            keys.remove(key)
+        self.assertEqual(list(keys.after(3)), [6, 7, 8])
+        self.assertEqual(list(keys.after(3, inclusive=True)), [3, 6, 7, 8])
+        self.assertEqual(len(keys), 6)
+
+    def test_directory_is_staff_only(self):
+        self.assertEqual(self.client.get('/api/admin/rooms/').status_code, 302)
+        self.assertEqual(self.list_rooms(order='size').status_code, 400)
+        self.assertEqual(self.list_rooms(cursor='!!').status_code, 400)
+        self.assertEqual(self.list_rooms(cursor=encode_cursor(['x', None])).status_code, 400)
+
+
+@override_settings(CHAT_ARCHIVE_INTERVAL=3600)
+class ChatArchiveTests(RoomTestMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        test_settings = override_settings(CHAT_ARCHIVE_ENABLED=True)
+        test_settings.enable()
+        self.addCleanup(test_settings.disable)
+        self.enter(self.client, 'host')
+        self.room_id = self.create_room(self.client)
+
+    def send(self, *texts):
+        for text in texts:
+            self.client.post(f'/api/room/{self.room_id}/chat/send/', {'message': text})
+
+    def test_messages_are_archived_in_batches(self):
+        self.send('one', 'two')
+        self.assertFalse(ArchivedMessage.objects.exists())
+        self.assertEqual(archive.flush(), 2)
+        self.assertEqual(list(ArchivedMessage.objects.values_list('seq', flat=True).order_by('seq')), [1, 2])
+
+        # A retried batch is not archived twice
+        backend = get_backend()
+        message = backend.latest_messages(self.room_id, 1)[0]
+        archive.add(self.room_id, backend.get_room(self.room_id)['epoch'], message)
+        archive.flush()
+        self.assertEqual(ArchivedMessage.objects.count(), 2)
+
+    def test_history_pages_back_by_seq(self):
+        self.send(*[f'message {i}' for i in range(1, 6)])
+        archive.flush()
+
+        url = f'/api/room/{self.room_id}/chat/history/'
+        page = self.client.get(url, {'limit': 2}).json()
+        self.assertEqual([m['seq'] for m in page['messages']], [4, 5])
+        page = self.client.get(url, {'limit': 2, 'before': page['before']}).json()
+        self.assertEqual([m['seq'] for m in page['messages']], [2, 3])
+        page = self.client.get(url, {'limit': 2, 'before': page['before']}).json()
+        self.assertEqual([m['message'] for m in page['messages']], ['message 1'])
+        self.assertIsNone(page['before'])
+
+    def test_search_matches_words_and_prefixes_in_one_room(self):
+        self.send('Deploy the release', 'lunch plans', 'release notes are up', 'deployment failed')
+        other = self.client_class()
+        self.enter(other, 'other')
+        other_room = self.create_room(other)
+        other.post(f'/api/room/{other_room}/chat/send/', {'message': 'release party'})
+        archive.flush()
+
+        url = f'/api/room/{self.room_id}/chat/search/'
+        hits = self.client.get(url, {'q': 'release'}).json()['messages']
+        self.assertEqual([m['message'] for m in hits], ['release notes are up', 'Deploy the release'])
+        hits = self.client.get(url, {'q': 'deploy'}).json()['messages']
+        self.assertEqual(len(hits), 2)
+
+        page = self.client.get(url, {'q': 'deploy', 'limit': 1}).json()
+        self.assertEqual(page['messages'][0]['message'], 'deployment failed')
+        page = self.client.get(url, {'q': 'deploy', 'limit': 1, 'before': page['before']}).json()
+        self.assertEqual(page['messages'][0]['message'], 'Deploy the release')
+        self.assertIsNone(page['before'])
+
+        # Query syntax is not passed through to FTS5
+        self.assertEqual(self.client.get(url, {'q': '" OR NEAR(*'}).json()['messages'], [])
+        self.assertEqual(search_query('ROOM1', 'a "b'), 'room_id : "ROOM1" AND "a" "b"*')
+
+    def test_a_reused_room_id_starts_a_new_archive(self):
+        self.send('secret')
+        archive.flush()
+        backend = get_backend()
+        backend.delete_room(self.room_id)
+        reaper.forget(self.room_id)
+
+        newcomer = self.client_class()
+        newcomer_id = self.enter(newcomer, 'newcomer')
+        backend.create_room(self.room_id, 'Next meeting', newcomer_id, 'newcomer')
+        newcomer.post(f'/api/room/{self.room_id}/chat/send/', {'message': 'fresh start'})
+        archive.flush()
+        self.assertEqual(ArchivedMessage.objects.filter(seq=1).count(), 2)
+
+        page = newcomer.get(f'/api/room/{self.room_id}/chat/history/').json()
+        self.assertEqual([m['message'] for m in page['messages']], ['fresh start'])
+        search = newcomer.get(f'/api/room/{self.room_id}/chat/search/', {'q': 'secret'}).json()
+        self.assertEqual(search['messages'], [])
+
+    def test_only_participants_read_the_archive(self):
+        stranger = self.client_class()
+        self.enter(stranger, 'stranger')
+        self.assertEqual(stranger.get(f'/api/room/{self.room_id}/chat/history/').status_code, 403)
+        self.assertEqual(stranger.get(f'/api/room/{self.room_id}/chat/search/', {'q': 'x'}).status_code, 403)
+
+
+class PeerSignalingTests(RoomTestMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.host_id = self.enter(self.client, 'host')
+        self.room_id = self.create_room(self.client)
+        self.guest = self.client_class()
+        self.guest_id = self.enter(self.guest, 'guest')
+        self.guest.post('/join-room/', {'room_id': self.room_id})
+
+    def peer(self, client, peer_id, key=None):
+        return websocket(client, f'/peerjs/peerjs?key={key or self.room_id}&id={peer_id}&token=t-{peer_id}')
+
+    def test_offer_and_answer_are_relayed(self):
+        @async_to_sync
+        async def scenario():
+            host = self.peer(self.client, self.host_id)
+            guest = self.peer(self.guest, self.guest_id)
+            await host.connect()
+            await guest.connect()
+            self.assertEqual(await host.receive_json_from(), {'type': 'OPEN'})
+            self.assertEqual(await guest.receive_json_from(), {'type': 'OPEN'})
+
+            await host.send_json_to({'type': 'OFFER', 'dst': self.guest_id, 'payload': {'sdp': 'o'}})
+            offer = await guest.receive_json_from()
+            await guest.send_json_to({'type': 'ANSWER', 'dst': self.host_id, 'payload': {'sdp': 'a'}})
+            answer = await host.receive_json_from()
+
+            await host.disconnect()
+            await guest.disconnect()
+            return offer, answer
+
+        offer, answer = scenario()
+        self.assertEqual(offer['src'], self.host_id)
+        self.assertEqual(offer['payload'], {'sdp': 'o'})
+        self.assertEqual(answer['src'], self.guest_id)
+
+    def test_peer_id_must_match_session_and_room(self):
+        @async_to_sync
+        async def scenario():
+            impostor = self.peer(self.guest, self.host_id)
+            await impostor.connect()
+            first = await impostor.receive_json_from()
+
+            wrong_room = self.peer(self.guest, self.guest_id, key='NOROOM')
+            await wrong_room.connect()
+            second = await wrong_room.receive_json_from()
+            return first, second
+
+        first, second = scenario()
+        self.assertEqual(first['type'], 'ERROR')
+        self.assertEqual(second['type'], 'ERROR')
+
+    @override_settings(PEERJS_EXPIRE_TIMEOUT=0.1)
+    def test_signal_for_unconnected_peer_is_held_then_expires(self):
+        @async_to_sync
+        async def scenario():
+            host = self.peer(self.client, self.host_id)
+            await host.connect()
+            await host.receive_json_from()
+
+            await host.send_json_to({'type': 'OFFER', 'dst': self.guest_id, 'payload': {}})
+            expired = await host.receive_json_from(timeout=2)
+
+            await host.send_json_to({'type': 'CANDIDATE', 'dst': self.guest_id, 'payload': {'c': 1}})
+            guest = self.peer(self.guest, self.guest_id)
+            await guest.connect()
+            await guest.receive_json_from()
+            held = await guest.receive_json_from()
+
+            await host.disconnect()
+            await guest.disconnect()
+            return expired, held
+
+        expired, held = scenario()
+        self.assertEqual(expired, {'type': 'EXPIRE', 'src': self.guest_id, 'dst': self.host_id})
+        self.assertEqual(held['type'], 'CANDIDATE')
+        self.assertEqual(held['payload'], {'c': 1})
+
+
+class SlidingSessionTests(RoomTestMixin, TransactionTestCase):
+    def test_session_is_resaved_only_near_expiry(self):
+        self.enter(self.client, 'host')
+        # First request stamps the refresh time
+        self.assertIn('sessionid', self.client.get('/create-room/').cookies)
+        self.assertNotIn('sessionid', self.client.get('/create-room/').cookies)
+
+        later = time.time() + 3600 - 60
+        with mock.patch('video_app.middleware.time.time', return_value=later):
+            self.assertIn('sessionid', self.client.get('/create-room/').cookies)
+
+    def test_requests_without_session_set_no_cookie(self):
+        self.assertNotIn('sessionid', self.client.get('/').cookies)
+
+
+class TimingWheelTests(SimpleTestCase):
+    def test_expires_only_past_deadlines(self):
+        wheel = TimingWheel(resolution=1, slots=8)
+        wheel.schedule('a', 3)
+        wheel.schedule('b', 5)
+        wheel.schedule('c', 20)  # more than one turn ahead
+
+        self.assertEqual(wheel.advance(2), [])
+        self.assertEqual(wheel.advance(4), ['a'])
+        self.assertEqual(wheel.advance(10), ['b'])
+        self.assertEqual(wheel.advance(19), [])
+        self.assertEqual(wheel.advance(21), ['c'])
+        self.assertEqual(len(wheel), 0)
+
+    def test_reschedule_and_cancel(self):
+        wheel = TimingWheel(resolution=1, slots=8)
+        wheel.schedule('a', 3)
+        wheel.schedule('a', 6)
+        wheel.schedule('b', 3)
+        wheel.cancel('b')
+
+        self.assertEqual(wheel.advance(4), [])
+        self.assertEqual(wheel.advance(7), ['a'])
+
+    def test_overdue_deadline_expires_next(self):
+        wheel = TimingWheel(resolution=1, slots=8)
+        wheel.schedule('a', 10)
+        wheel.advance(12)
+        wheel.schedule('late', 5)
+        self.assertEqual(wheel.advance(13), ['late'])
+
+
+class RoomLifecycleTests(RoomTestMixin, TransactionTestCase):
+    def test_deactivated_room_is_freed_after_inactive_ttl(self):
+        self.enter(self.client, 'host')
+        room_id = self.create_room(self.client)
+        self.client.post(f'/api/room/{room_id}/chat/send/', {'message': 'hi'})
+        self.client.get(f'/room/{room_id}/leave/')
+
+        self.assertEqual(reaper.reap(time.monotonic() + 60), [])
+        self.assertEqual(reaper.reap(time.monotonic() + reaper.inactive_ttl() + 60), [room_id])
+
+        backend = get_backend()
+        self.assertIsNone(backend.get_room(room_id))
+        self.assertFalse(backend.has_chat(room_id))
+        self.assertEqual(backend.stats()['rooms'], 0)
+
+    def test_activity_pushes_back_idle_deadline(self):
+        self.enter(self.client, 'host')
+        room_id = self.create_room(self.client)
+        idle_deadline = time.monotonic() + reaper.idle_ttl()
+
+        with mock.patch('video_app.lifecycle.time.monotonic', return_value=time.monotonic() + 3600):
+            self.client.post(f'/api/room/{room_id}/chat/send/', {'message': 'still here'})
+
+        self.assertEqual(reaper.reap(idle_deadline + 60), [])
+        self.assertEqual(reaper.reap(idle_deadline + 3600 + 60), [room_id])
+
+    def test_heartbeats_keep_a_quiet_call_alive(self):
+        host_id = self.enter(self.client, 'host')
+        room_id = self.create_room(self.client)
+        idle_deadline = time.monotonic() + reaper.idle_ttl()
+
+        with mock.patch('video_app.lifecycle.time.monotonic', return_value=time.monotonic() + 3600):
+            heartbeat(room_id, host_id)
+
+        self.assertEqual(reaper.reap(idle_deadline + 60), [])
+        self.assertEqual(reaper.reap(idle_deadline + 3600 + 60), [room_id])
+
+    def test_allocation_skips_live_ids(self):
+        backend = get_backend()
+        backend.create_room('AAAAAA', 'Taken', 'u1', 'Ann')
+        with mock.patch('video_app.lifecycle.generate_room_id', side_effect=['AAAAAA', 'BBBBBB']):
+            room_id, room = allocate_room(backend, 'Fresh', 'u2', 'Bob')
+
+        self.assertEqual(room_id, 'BBBBBB')
+        self.assertEqual(backend.get_room('AAAAAA')['name'], 'Taken')
+
+    def test_gauges_are_staff_only(self):
+        self.assertEqual(self.client.get('/api/admin/gauges/').status_code, 302)
+
+
+class PresenceTests(RoomTestMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.host_id = self.enter(self.client, 'host')
+        self.room_id = self.create_room(self.client)
+        self.guest = self.client_class()
+        self.guest_id = self.enter(self.guest, 'guest')
+        self.guest.post('/join-room/', {'room_id': self.room_id})
+
+    def test_silent_participants_are_evicted_in_one_sweep(self):
+        later = time.monotonic() + 30
+        with mock.patch('video_app.presence.time.monotonic', return_value=later):
+            # Polling counts as a heartbeat
+            self.guest.get(f'/api/room/{self.room_id}/chat/messages/')
+
+        expired = presence.sweep(time.monotonic() + presence.timeout() + 10)
+        self.assertEqual(expired, {self.room_id: [self.host_id]})
+
+        backend = get_backend()
+        self.assertEqual([p['user_id'] for p in backend.list_participants(self.room_id)], [self.guest_id])
+        messages, _ = backend.messages_since(self.room_id, 0)
+        self.assertEqual(messages[-1]['message'], 'host has left the meeting')
+
+        presence.sweep(later + presence.timeout() + 10)
+        self.assertFalse(backend.get_room(self.room_id)['is_active'])
+
+    def test_explicit_leave_stops_tracking(self):
+        self.guest.get(f'/room/{self.room_id}/leave/')
+        self.assertIsNone(presence.last_seen(self.room_id, self.guest_id))
+        self.assertIsNotNone(presence.last_seen(self.room_id, self.host_id))
+
+    def test_outsiders_are_not_tracked(self):
+        outsider = self.client_class()
+        self.enter(outsider, 'outsider')
+        outsider.get(f'/api/room/{self.room_id}/participants/')
+        self.assertEqual(len(presence), 2)
+
+
+class ModerationApiTests(RoomTestMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.enter(self.client, 'host')
+        self.room_id = self.create_room(self.client)
+        self.guests = []
+        for name in ('ann', 'bob', 'cy'):
+            guest = self.client_class()
+            self.guests.append(self.enter(guest, name))
+            guest.post('/join-room/', {'room_id': self.room_id})
+        self.guest = guest
+
+    def moderate(self, client, payload):
+        return client.post(f'/api/room/{self.room_id}/moderate/', json.dumps(payload), content_type='application/json')
+
+    def test_one_message_and_one_event_per_batch(self):
+        backend = get_backend()
+        seq = backend.last_seq(self.room_id)
+        with mock.patch('video_app.views.broadcast') as broadcast:
+            response = self.moderate(self.client, {'user_ids': self.guests, 'actions': ['mute', 'remove']})
+
+        self.assertEqual(response.json()['removed_user_ids'], self.guests)
+        events = [c for c in broadcast.call_args_list if c.args[1] != 'chat.message']
+        self.assertEqual(events, [mock.call(self.room_id, 'participants.moderated', participants=[], removed_user_ids=self.guests)])
+        messages, _ = backend.messages_since(self.room_id, seq)
+        self.assertEqual([m['message'] for m in messages], ['3 participants have been removed from the meeting'])
+
+    def test_summary_names_a_single_participant(self):
+        self.moderate(self.client, {'user_ids': self.guests[:1], 'actions': ['mute', 'disable_video']})
+        message = get_backend().latest_messages(self.room_id, 1)[0]['message']
+        self.assertEqual(message, 'ann has been muted and had their video turned off')
+
+    def test_only_the_host_may_moderate(self):
+        response = self.moderate(self.guest, {'user_ids': self.guests, 'actions': ['remove']})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(len(get_backend().list_participants(self.room_id)), 4)
+
+    def test_rejects_unknown_actions(self):
+        self.assertEqual(self.moderate(self.client, {'user_ids': self.guests, 'actions': ['ban']}).status_code, 400)
+        self.assertEqual(self.moderate(self.client, {'user_ids': 'abc', 'actions': ['mute']}).status_code, 400)
+        self.assertEqual(self.client.get(f'/api/room/{self.room_id}/moderate/').status_code, 405)
+
+
+@override_settings(ROOM_MAX_PARTICIPANTS=None)
+class ConcurrencyTests(RoomTestMixin, TransactionTestCase):
+    rounds = 5000
+
+    def setUp(self):
+        super().setUp()
+        self.enter(self.client, 'host')
+        self.room_id = self.create_room(self.client)
+        self.guest = self.client_class()
+        self.guest_id = self.enter(self.guest, 'ann')
+        self.guest.post('/join-room/', {'room_id': self.room_id})
+
+    def test_backend_writers_lose_no_updates(self):
+        # Switch threads as often as possible to provoke interleavings
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.addCleanup(sys.setswitchinterval, interval)
+
+        backend = get_backend()
+        seq = backend.last_seq(self.room_id)
+        start = threading.Barrier(8)
+        created, errors = [], []
+
+        def worker(body):
+            def run():
+                start.wait()
+                try:
+                    for i in range(self.rounds):
+                        body(i)
+                except Exception as error:
+                    errors.append(error)
+            return threading.Thread(target=run)
+
+        def toggle(i):
+            backend.toggle_audio(self.room_id, self.guest_id)
+            backend.add_message(self.room_id, 'u', 'U', str(i))
+            created.append(backend.join(self.room_id, 'late', 'Late')[1])
+
+        def churn(i):
+            backend.join(self.room_id, f'churn{i}', 'Churn')
+            backend.leave(self.room_id, f'churn{i}')
+
+        threads = [worker(toggle) for _ in range(4)] + [worker(churn) for _ in range(2)]
+        # Moderation rewrites the guest's audio state, readers walk the room
+        threads.append(worker(lambda i: backend.moderate(self.room_id, [self.guest_id], {'disable_video'})))
+        threads.append(worker(lambda i: backend.list_participants(self.room_id)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        guest = next(p for p in backend.list_participants(self.room_id) if p['user_id'] == self.guest_id)
+        self.assertTrue(guest['audio_enabled'])  # toggled an even number of times
+        self.assertEqual(backend.last_seq(self.room_id), seq + 4 * self.rounds)
+        self.assertEqual(created.count(True), 1)
+        self.assertEqual(len(backend.list_participants(self.room_id)), 3)
+
+    def test_concurrent_requests_apply_in_arrival_order(self):
+        backend = get_backend()
+        seq = backend.last_seq(self.room_id)
+        joiners = []
+        for i in range(20):
+            client = self.async_client_class()
+            sync_client = self.client_class()
+            self.enter(sync_client, f'guest{i}')
+            client.cookies = sync_client.cookies
+            joiners.append(client)
+        self.async_client.cookies = self.client.cookies
+        mute_url = f'/api/room/{self.room_id}/mute/{self.guest_id}/'
+
+        @async_to_sync
+        async def scenario():
+            requests = [self.async_client.post(mute_url) for _ in range(40)]
+            requests += [client.post('/join-room/', {'room_id': self.room_id}) for client in joiners]
+            requests += [
+                self.async_client.post(f'/api/room/{self.room_id}/chat/send/', {'message': f'm{i}'})
+                for i in range(20)
+            ]
+            return await asyncio.gather(*requests)
+
+        self.assertTrue(all(response.status_code in (200, 302) for response in scenario()))
+
+        participants = backend.list_participants(self.room_id)
+        self.assertEqual(len(participants), 22)
+        guest = next(p for p in participants if p['user_id'] == self.guest_id)
+        self.assertTrue(guest['audio_enabled'])
+
+        room_messages, last_seq = backend.messages_since(self.room_id, seq)
+        self.assertEqual(last_seq, seq + 60)
+        mutes = [m['message'] for m in room_messages if m['is_system']]
+        self.assertEqual(mutes, ['ann has been muted', 'ann has been unmuted'] * 20)
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class RedisConcurrencyTests(ConcurrencyTests):
+    rounds = 100  # fakeredis runs one command at a time
+
+    def setUp(self):
+        redis_settings = override_settings(
+            ROOM_STATE_BACKEND='video_app.backends.redis.RedisRoomState',
+            ROOM_STATE_OPTIONS={'client': fakeredis.FakeRedis(decode_responses=True)},
+        )
+        redis_settings.enable()
+        self.addCleanup(redis_settings.disable)
+        super().setUp()
+
+
+@override_settings(ROOM_MAX_PARTICIPANTS=2)
+class AdmissionTests(RoomTestMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.enter(self.client, 'host')
+        self.room_id = self.create_room(self.client)
+        self.queue_url = f'/api/room/{self.room_id}/queue/'
+        for limiter in (chat_user_limiter, chat_room_limiter, moderation_user_limiter, moderation_room_limiter):
+            limiter.clear()
+
+    def guest(self, name):
+        client = self.client_class()
+        self.enter(client, name)
+        return client, client.post('/join-room/', {'room_id': self.room_id})
+
+    def test_full_room_seats_the_queue_in_order(self):
+        ann, response = self.guest('ann')
+        self.assertEqual(response.status_code, 302)
+        bob, response = self.guest('bob')
+        self.assertEqual(response.context['position'], 1)
+        cy, response = self.guest('cy')
+        self.assertEqual(response.context['position'], 2)
+        self.assertEqual(len(get_backend().list_participants(self.room_id)), 2)
+
+        ann.get(f'/room/{self.room_id}/leave/')
+        self.assertEqual(bob.get(self.queue_url).json()['admitted'], True)
+        self.assertEqual(cy.get(self.queue_url).json(), {'success': True, 'admitted': False, 'position': 1})
+        # Someone new cannot skip the line while seats are taken
+        _, response = self.guest('dee')
+        self.assertEqual(response.context['position'], 2)
+
+    @override_settings(ROOM_WAITING_LIMIT=0)
+    def test_full_room_without_queue_turns_guests_away(self):
+        self.guest('ann')
+        _, response = self.guest('bob')
+        self.assertNotIn('position', response.context)
+        self.assertContains(response, 'The meeting is full')
+
+    @override_settings(CHAT_USER_RATE=(1, 2), CHAT_ROOM_RATE=(100, 100))
+    def test_chat_is_rate_limited_per_user(self):
+        url = f'/api/room/{self.room_id}/chat/send/'
+        self.assertEqual(self.client.post(url, {'message': 'one'}).status_code, 200)
+        self.assertEqual(self.client.post(url, {'message': 'two'}).status_code, 200)
+        response = self.client.post(url, {'message': 'three'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(get_backend().last_seq(self.room_id), 2)
+
+    def test_tokens_are_taken_from_every_bucket_or_none(self):
+        with override_settings(CHAT_USER_RATE=(1, 2), CHAT_ROOM_RATE=(0.5, 1)):
+            checks = [(chat_user_limiter, 'ann'), (chat_room_limiter, 'ROOM1')]
+            self.assertEqual(acquire(checks, now=0), 0)
+            self.assertEqual(acquire(checks, now=0), 2)  # the room's bucket refills in 2s
+            self.assertEqual(chat_user_limiter.wait('ann', now=0), 0)  # still has its second token
+            self.assertEqual(acquire(checks, now=2), 0)
+
+    @override_settings(CHAT_USER_RATE=(0.001, 1))
+    def test_concurrent_requests_cannot_share_the_last_token(self):
+        barrier = threading.Barrier(8)
+        results = []
+
+        def request():
+            barrier.wait()
+            results.append(acquire([(chat_user_limiter, 'u1')]))
+
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(0), 1)
+
+    @override_settings(MODERATION_USER_RATE=(1, 1))
+    def test_moderation_is_rate_limited(self):
+        ann, _ = self.guest('ann')
+        ann_id = ann.session['user_id']
+        url = f'/api/room/{self.room_id}/mute/{ann_id}/'
+        self.assertEqual(self.client.post(url).status_code, 200)
+        self.assertEqual(self.client.post(url).status_code, 429)
+
+    @override_settings(OVERLOAD_MAX_IN_FLIGHT=1, OVERLOAD_MAX_LATENCY=2.0)
+    def test_overload_sheds_room_api_requests(self):
+        load_shedder.started()  # a request still being worked on
+        response = self.client.get(f'/api/room/{self.room_id}/participants/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        # Pages and chat long-polls are still served
+        self.assertEqual(self.client.get('/join-room/').status_code, 200)
+        self.assertEqual(self.client.get(f'/api/room/{self.room_id}/chat/messages/?wait=0').status_code, 200)
+
+        load_shedder.finished(30.0, now=100)
+        self.assertTrue(load_shedder.overloaded(now=100))
+        # Without new slow requests the latency decays and shedding stops
+        self.assertFalse(load_shedder.overloaded(now=110))
+        self.assertEqual(load_shedder.stats(now=110)['shed'], 2)
+
+
+class OwnerStub(http.server.BaseHTTPRequestHandler):
+    # Stands in for the worker owning a room; records what it was sent
+    def do_GET(self):
+        self.server.received.append((self.command, self.path, self.headers, b''))
+        self.answer()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.received.append((self.command, self.path, self.headers, body))
+        self.answer()
+
+    def answer(self):
+        body = b'{"from": "b"}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Set-Cookie', 'sessionid=fromb; Path=/; HttpOnly')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ShardingTests(RoomTestMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner_b = http.server.ThreadingHTTPServer(('127.0.0.1', 0), OwnerStub)
+        self.owner_b.received = []
+        threading.Thread(target=self.owner_b.serve_forever, daemon=True).start()
+        self.addCleanup(self.owner_b.server_close)
+        self.addCleanup(self.owner_b.shutdown)
+        shard_settings = override_settings(
+            ROOM_SHARDS={'a': 'http://127.0.0.1:9', 'b': f'http://127.0.0.1:{self.owner_b.server_port}'},
+            ROOM_SHARD_NAME='a',
+        )
+        shard_settings.enable()
+        self.addCleanup(shard_settings.disable)
+
+    def room_of(self, shard):
+        return next(room_id for room_id in (f'ROOM{i}' for i in range(100)) if owner(room_id) == shard)
+
+    def test_adding_a_worker_moves_only_its_share_of_rooms(self):
+        rooms = [f'ROOM{i}' for i in range(4000)]
+        ring = HashRing(['w1', 'w2', 'w3', 'w4'])
+        before = {room_id: ring.owner(room_id) for room_id in rooms}
+        for node in ring.nodes:
+            self.assertAlmostEqual(list(before.values()).count(node) / len(rooms), 0.25, delta=0.06)
+
+        ring.add('w5')
+        moved = [room_id for room_id in rooms if ring.owner(room_id) != before[room_id]]
+        self.assertAlmostEqual(len(moved) / len(rooms), 0.2, delta=0.06)
+        self.assertEqual({ring.owner(room_id) for room_id in moved}, {'w5'})
+
+        ring.remove('w5')
+        self.assertEqual({room_id: ring.owner(room_id) for room_id in rooms}, before)
+
+    def test_rooms_are_created_on_their_owner(self):
+        self.enter(self.client, 'host')
+        for _ in range(10):
+            self.assertEqual(owner(self.create_room(self.client)), 'a')
+
+    def test_requests_for_other_workers_rooms_are_forwarded(self):
+        self.enter(self.client, 'ann')
+        room_id = self.room_of('b')
+        response = self.client.get(f'/api/room/{room_id}/participants/?version=3')
+        self.assertEqual(response.json(), {'from': 'b'})
+        self.assertEqual(response['X-Room-Shard'], 'b')
+        self.assertEqual(response.cookies['sessionid'].value, 'fromb')
+
+        response = self.client.post('/join-room/', {'room_id': room_id.lower()})
+        self.assertEqual(response.json(), {'from': 'b'})
+        (_, path, headers, _), (method, _, _, body) = self.owner_b.received
+        self.assertEqual(path, f'/api/room/{room_id}/participants/?version=3')
+        self.assertEqual(headers[FORWARDED_HEADER], 'a')
+        self.assertIn('sessionid=', headers['Cookie'])
+        self.assertEqual(method, 'POST')
+        self.assertIn(f'name="room_id"\r\n\r\n{room_id.lower()}'.encode(), body)
+
+        # This worker's rooms, and requests forwarded to it, are its own
+        response = self.client.get(f'/api/room/{self.room_of("a")}/participants/')
+        self.assertNotIn('X-Room-Shard', response)
+        response = self.client.get(f'/api/room/{room_id}/participants/', HTTP_X_ROOM_SHARD_FORWARDED='c')
+        self.assertNotIn('X-Room-Shard', response)
+        self.assertEqual(len(self.owner_b.received), 2)
+
+    def test_forwarding_under_asgi(self):
+        url = f'/api/room/{self.room_of("b")}/chat/messages/'
+
+        @async_to_sync
+        async def get():
+            return await self.async_client.get(url)
+
+        self.assertEqual(get().json(), {'from': 'b'})
+        self.owner_b.shutdown()
+        self.owner_b.server_close()
+        self.assertEqual(get().status_code, 502)
+
+    def test_sockets_are_refused_for_other_workers_rooms(self):
+        self.enter(self.client, 'ann')
+
+        @async_to_sync
+        async def scenario():
+            communicator = websocket(self.client, f'/ws/room/{self.room_of("b")}/')
+            connected, _ = await communicator.connect()
+            return connected
+
+        self.assertFalse(scenario())
+
+
+def member(user_id, video=True):
+    return {'user_id': user_id, 'video_enabled': video, 'audio_enabled': True}
+
+
+@override_settings(
+    SPEAKER_ACTIVE_COUNT=1, SPEAKER_THRESHOLD=50, SPEAKER_SWITCH_MARGIN=6, SPEAKER_MIN_HOLD=2.0,
+    SPEAKER_RELEASE=3.0, VIDEO_FULL_STREAMS=1, VIDEO_MAX_STREAMS=2,
+)
+class SpeakerTests(RoomTestMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.coordinator = SpeakerCoordinator()
+        self.room = [member('ann'), member('bob'), member('cy'), member('dee')]
+
+    def speak(self, user_id, level, now):
+        self.coordinator.report('ROOM', user_id, [level] * 5, now=now)
+        return self.coordinator.update('ROOM', self.room, now=now)
+
+    def active(self, now):
+        self.coordinator.update('ROOM', self.room, now=now)
+        return [user_id for user_id, _ in self.coordinator._rooms['ROOM'].active]
+
+    def test_active_speaker_changes_with_hysteresis(self):
+        for now in range(3):
+            self.speak('ann', 30, now)
+        self.assertEqual(self.active(2), ['ann'])
+
+        # Slightly louder is not enough to take over
+        for now in (2.5, 3, 3.5):
+            self.speak('bob', 28, now)
+        self.assertEqual(self.active(3.5), ['ann'])
+        # Clearly louder is, once ann has held the floor long enough
+        for now in (4, 4.5):
+            self.speak('bob', 10, now)
+        self.assertEqual(self.active(4.5), ['bob'])
+
+        # Falling silent keeps the floor through the release time
+        self.speak('bob', 127, 5)
+        self.speak('bob', 127, 5.5)
+        self.assertEqual(self.active(6), ['bob'])
+        self.assertEqual(self.active(8), [])
+
+    def test_budget_puts_speakers_first_and_caps_streams(self):
+        budget = self.coordinator.budget
+        self.speak('cy', 20, 0)
+        state = self.speak('cy', 20, 0)
+        self.assertEqual(state['active'], ['cy'])
+        self.assertEqual(state['order'], ['cy', 'ann', 'bob', 'dee'])
+        self.assertEqual(budget(state, 'ann'), {'full': ['cy'], 'reduced': ['bob']})
+        self.assertEqual(budget(state, 'cy'), {'full': ['ann'], 'reduced': ['bob']})
+
+        # Cameras that are off take no slot
+        self.room[1] = member('bob', video=False)
+        state = self.coordinator.update('ROOM', self.room, now=0)
+        self.assertEqual(budget(state, 'ann'), {'full': ['cy'], 'reduced': ['dee']})
+        self.assertEqual(
+            self.coordinator.subscriptions('ROOM', 'ann', self.room),
+            {'bob': {'video': 'off', 'audio': True}, 'cy': {'video': 'full', 'audio': True},
+             'dee': {'video': 'reduced', 'audio': True}},
+        )
+        # Nothing new, nothing to publish
+        self.assertIsNone(self.coordinator.update('ROOM', self.room, now=0))
+
+        # A pin outranks the active speaker, for that viewer only
+        self.coordinator.report('ROOM', 'ann', [127], pin='dee', now=1)
+        state = self.coordinator.update('ROOM', self.room, now=1)
+        self.assertEqual(budget(state, 'ann'), {'full': ['dee'], 'reduced': ['cy']})
+        self.assertEqual(budget(state, 'bob'), {'full': ['cy'], 'reduced': ['ann']})
+
+    def test_reports_are_elected_once_per_tick(self):
+        self.enter(self.client, 'host')
+        room_id = self.create_room(self.client)
+        host_id = self.client.session['user_id']
+        with mock.patch.object(speakers, 'update', wraps=speakers.update) as update:
+            for _ in range(5):
+                self.assertEqual(report_levels(room_id, host_id, [20, 20, 20]), {})
+            speakers.flush()
+        # Whether the tick thread or flush() got there first
+        self.assertEqual(update.call_count, 1)
+        self.assertIsNone(report_levels(room_id, 'stranger', [20]))
+
+    def test_levels_over_socket_publish_budgets(self):
+        self.enter(self.client, 'host')
+        room_id = self.create_room(self.client)
+        guest = self.client_class()
+        guest_id = self.enter(guest, 'guest')
+
+        @async_to_sync
+        async def scenario():
+            communicator = websocket(self.client, f'/ws/room/{room_id}/')
+            await communicator.connect()
+            await sync_to_async(guest.post)('/join-room/', {'room_id': room_id})
+            await communicator.receive_json_from(timeout=2)  # the join
+            await communicator.send_to(text_data=json.dumps({'levels': [20, 20, 20]}))
+            frame = await communicator.receive_json_from(timeout=2)
+            await communicator.disconnect()
+            return frame['events'][0]
+
+        event = scenario()
+        host_id = self.client.session['user_id']
+        self.assertEqual(event['event'], 'speakers.updated')
+        self.assertEqual(event['order'], [host_id, guest_id])
+        self.assertEqual(SpeakerCoordinator.budget(event, guest_id)['full'], [host_id])
+
+        response = guest.post(f'/api/room/{room_id}/audio-levels/', {'levels': '127,127'})
+        self.assertEqual(response.json()['subscriptions'], {
+            self.client.session['user_id']: {'video': 'full', 'audio': True},
+        })
+        response = guest.post(f'/api/room/{room_id}/audio-levels/', {'levels': '300'})
+        self.assertEqual(response.status_code, 400)
+
+
+class MetricsTests(RoomTestMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        registry.clear()
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram((0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value)
+        self.assertEqual(list(histogram.lines('t', ('route',), ('a"b',))), [
+            't_bucket{route="a\\"b",le="0.1"} 2',
+            't_bucket{route="a\\"b",le="1"} 3',
+            't_bucket{route="a\\"b",le="+Inf"} 4',
+            't_sum{route="a\\"b"} 3.65',
+            't_count{route="a\\"b"} 4',
+        ])
+
+    def test_exposes_route_latency_and_room_gauges(self):
+        self.enter(self.client, 'host')
+        room_id = self.create_room(self.client)
+        self.client.get(f'/api/room/{room_id}/participants/')
+
+        response = self.client.get('/metrics')
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        route = 'api/room/<str:room_id>/participants/'
+        self.assertIn(f'meet_http_requests_total{{method="GET",route="{route}",status="200"}} 1', text)
+        self.assertIn(f'meet_http_request_duration_seconds_count{{method="GET",route="{route}"}} 1', text)
+        self.assertIn('meet_session_duration_seconds_count{operation="load"}', text)
+        self.assertIn('meet_rooms 1\n', text)
+        self.assertIn('meet_room_participants_bucket{le="1"} 1', text)
+        self.assertNotIn(room_id, text)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_can_be_turned_off(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+
+def _spin(seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        pass
+
+
+@override_settings(PROFILER_INTERVAL=0.001)
+class ProfilingTests(RoomTestMixin, TransactionTestCase):
+    def test_sampler_folds_tracked_thread_stacks(self):
+        ident = threading.get_ident()
+        profiler.sampler.track(ident, 'bench')
+        _spin(0.05)
+        profiler.sampler.untrack(ident, 'bench')
+
+        stacks = profiler.sampler.collapsed().splitlines()
+        self.assertTrue(stacks)
+        self.assertTrue(all(line.startswith('bench;') for line in stacks))
+        self.assertTrue(any('video_app.tests._spin' in line for line in stacks))
+
+    def test_profiles_requests_to_chosen_routes(self):
+        self.enter(self.client, 'host')
+        room_id = self.create_room(self.client)
+        route = 'api/room/<str:room_id>/participants/'
+        profiler.configure(sample_rate=0, routes=[route], rooms=[])
+
+        def slow_list(*args):
+            _spin(0.05)
+            return []
+
+        # Both views are async; under ASGI they run on the loop's thread
+        self.async_client.cookies = self.client.cookies
+        with mock.patch.object(InMemoryRoomState, 'list_participants', slow_list):
+            async_to_sync(self.async_client.get)(f'/api/room/{room_id}/participants/')
+            async_to_sync(self.async_client.get)(f'/api/room/{room_id}/chat/messages/')
+
+        text = profiler.sampler.collapsed()
+        self.assertIn('video_app.views.get_participants', text)
+        self.assertNotIn('get_messages', text)
+        self.assertTrue(all(line.startswith(route + ';') for line in text.splitlines()))
+
+    def test_admin_download_and_configure(self):
+        self.assertEqual(self.client.get('/api/admin/profile/').status_code, 302)
+
+        from django.contrib.auth.models import User
+        staff = self.client_class()
+        staff.force_login(User.objects.create_user('ops', is_staff=True))
+        response = staff.post('/api/admin/profile/', {'sample_rate': '100', 'room': ['ROOM1']})
+        self.assertEqual(response.json()['rooms'], ['ROOM1'])
+        self.assertTrue(profiler.wants('any', 'ROOM1'))
+
+        response = staff.get('/api/admin/profile/')
+        self.assertIn('profile.folded', response['Content-Disposition'])
+
+
+class SnapshotTests(RoomTestMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.enter(self.client, 'host')
+        self.room_id = self.create_room(self.client)
+        self.url = f'/api/room/{self.room_id}/participants/'
+
+    def test_deltas_since_a_version(self):
+        version = self.client.get(self.url).json()['version']
+
+        guest = self.client_class()
+        guest_id = self.enter(guest, 'guest')
+        guest.post('/join-room/', {'room_id': self.room_id})
+        delta = self.client.get(self.url, {'version': version}).json()
+        self.assertEqual([p['user_id'] for p in delta['added']], [guest_id])
+        self.assertEqual((delta['removed'], delta['changed'], delta['since']), ([], [], version))
+
+        self.client.post(f'/api/room/{self.room_id}/mute/{guest_id}/')
+        delta = self.client.get(self.url, {'version': delta['version']}).json()
+        self.assertEqual(delta['added'], [])
+        self.assertFalse(delta['changed'][0]['audio_enabled'])
+
+        guest.get(f'/room/{self.room_id}/leave/')
+        delta = self.client.get(self.url, {'version': version}).json()
+        self.assertEqual((delta['added'], delta['removed'], delta['changed']), ([], [], []))
+
+        # Unknown versions get the full list
+        response = self.client.get(self.url, {'version': 1}).json()
+        self.assertEqual(len(response['participants']), 1)
+
+    def test_pollers_share_one_encoding(self):
+        guest = self.client_class()
+        self.enter(guest, 'guest')
+        guest.post('/join-room/', {'room_id': self.room_id})
+        self.client.post(f'/api/room/{self.room_id}/chat/send/', {'message': 'hi'})
+
+        with mock.patch('video_app.snapshots.dumps', wraps=snapshots_dumps) as dumps, \
+                mock.patch.object(InMemoryRoomState, 'messages_since', wraps=get_backend().messages_since) as since:
+            for client in (self.client, guest, self.client):
+                self.assertEqual(len(client.get(self.url).json()['participants']), 2)
+                messages = client.get(f'/api/room/{self.room_id}/chat/messages/?since=0').json()['messages']
+                self.assertEqual([m['message'] for m in messages][-1], 'hi')
+        self.assertEqual(dumps.call_count, 2)
+        self.assertEqual(since.call_count, 1)
+
+
+class RoomPageCacheTests(RoomTestMixin, TransactionTestCase):
+    def test_fragments_are_reused_until_the_room_changes(self):
+        self.enter(self.client, 'host')
+        room_id = self.create_room(self.client)
+        self.client.post(f'/api/room/{room_id}/chat/send/', {'message': 'hello'})
+        self.client.get(f'/room/{room_id}/')
+
+        with mock.patch.object(InMemoryRoomState, 'latest_messages') as latest_messages:
+            html = self.client.get(f'/room/{room_id}/').content.decode()
+        latest_messages.assert_not_called()
+        self.assertIn('hello', html)
+
+        guest = self.client_class()
+        self.enter(guest, 'guest')
+        guest.post('/join-room/', {'room_id': room_id})
+        self.client.post(f'/api/room/{room_id}/chat/send/', {'message': 'welcome'})
+        html = self.client.get(f'/room/{room_id}/').content.decode()
+        self.assertIn('guest', html)
+        self.assertIn('welcome', html)
+
+    def test_hosts_and_guests_get_their_own_participant_list(self):
+        self.enter(self.client, 'host')
+        room_id = self.create_room(self.client)
+        guest = self.client_class()
+        self.enter(guest, 'guest')
+        guest.post('/join-room/', {'room_id': room_id})
+
+        self.assertIn('showRemoveModal', self.client.get(f'/room/{room_id}/').content.decode())
+        self.assertNotIn('showRemoveModal', guest.get(f'/room/{room_id}/').content.decode())
+
+
+class StaticAssetTests(RoomTestMixin, TransactionTestCase):
+    def test_room_page_links_external_assets(self):
+        self.enter(self.client, 'host')
+        room_id = self.create_room(self.client)
+        html = self.client.get(f'/room/{room_id}/').content.decode()
+
+        self.assertIn('/static/css/room.css', html)
+        self.assertIn('/static/js/room.js', html)
+        self.assertNotIn('<style>', html)
+
+    def test_middleware_streams_static_files_asynchronously(self):
+        from django.test import RequestFactory
+        from .middleware import AssetMiddleware
+
+        async def view(request):
+            return HttpResponse('view')
+
+        async def body(response):
+            return b''.join([chunk async for chunk in response.streaming_content])
+
+        with override_settings(WHITENOISE_AUTOREFRESH=True, WHITENOISE_USE_FINDERS=True):
+            middleware = AssetMiddleware(view)
+        response = async_to_sync(middleware)(RequestFactory().get('/static/css/room.css'))
+        self.assertTrue(response.is_async)
+        self.assertIn(b'.video-grid', async_to_sync(body)(response))
+
+        response = async_to_sync(middleware)(RequestFactory().get('/'))
+        self.assertEqual(response.content, b'view')
@@ -8,15 +8,29 @@ urlpatterns = [
     path('join-room/', views.join_room, name='join_room'),
     path('room/<str:room_id>/', views.room, name='room'),
     path('room/<str:room_id>/leave/', views.leave_room, name='leave_room'),
+    path('api/room/<str:room_id>/queue/', views.queue_status, name='queue_status'),
     path('api/room/<str:room_id>/participants/', views.get_participants, name='get_participants'),
+    path('api/room/<str:room_id>/audio-levels/', views.audio_levels, name='audio_levels'),
     
     # Chat URLs
     path('api/room/<str:room_id>/chat/send/', views.send_message, name='send_message'),
     path('api/room/<str:room_id>/chat/messages/', views.get_messages, name='get_messages'),
+    path('api/room/<str:room_id>/chat/history/', views.chat_history, name='chat_history'),
+    path('api/room/<str:room_id>/chat/search/', views.search_chat, name='search_chat'),
     
     # Admin control URLs
     path('api/room/<str:room_id>/mute-all/', views.mute_all, name='mute_all'),
     path('api/room/<str:room_id>/remove-all/', views.remove_all, name='remove_all'),
     path('api/room/<str:room_id>/mute/<str:user_id>/', views.mute_participant, name='mute_participant'),
     path('api/room/<str:room_id>/remove/<str:user_id>/', views.remove_participant, name='remove_participant'),
+    path('api/room/<str:room_id>/moderate/', views.moderate, name='moderate'),
+
+    # Monitoring
+    path('api/admin/gauges/', views.gauges, name='gauges'),
+    path('api/admin/rooms/', views.room_directory, name='room_directory'),
+    path('api/admin/profile/', views.profile, name='profile'),
+    path('metrics', views.metrics, name='metrics'),
+
+    # PeerJS signaling (the WebSocket side lives in routing.py)
+    path('peerjs/<str:key>/id', views.peerjs_id, name='peerjs_id'),
 ]
\ No newline at end of file
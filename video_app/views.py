@@ -1,16 +1,47 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
+from django.utils.cache import patch_cache_control
+import asyncio
+import json
 import uuid
-import random
-import string
-from datetime import datetime
 
-# Simple in-memory storage
-rooms = {}
-participants = {}
-chat_messages = {}
-user_streams = {}  # Track user media streams
+from . import archive
+from .admission import (
+    acquire, chat_room_limiter, chat_user_limiter, load_shedder, moderation_room_limiter,
+    moderation_user_limiter, retry_after, room_capacity, waiting_room,
+)
+from .backends import get_backend
+from .backends.base import MODERATION_ACTIONS
+from .checkpoint import checkpoint_enabled, checkpointer
+from .directory import directory
+from .events import broadcast
+from .fanout import fanout
+from .lifecycle import allocate_room, room_gauges
+from .locks import room_locks
+from .metrics import metrics_enabled, registry
+from .presence import heartbeat
+from .profiling import profiler
+from .session import get_meeting_user, set_meeting_user
+from .sharding import shard_name, sharding_enabled
+from .snapshots import snapshots
+from .speakers import parse_levels, report_levels
+from .signals import message_added, participant_changed, participant_removed, room_changed
+
+# Room state lives in the configured backend (settings.ROOM_STATE_BACKEND)
+message_waiters = {}  # Long-poll requests waiting for a room's next message
+
+# Upper bound for ?wait= on the chat long-poll
+LONG_POLL_MAX_WAIT = 30
+
+# Upper bound for ?limit= on chat history and search
+ARCHIVE_MAX_PAGE = 200
+
+# Upper bound for ?limit= on the admin room directory
+ROOM_DIRECTORY_MAX_LIMIT = 500
 
 def landing_page(request):
     if request.method == 'POST':
@@ -19,9 +50,7 @@ def landing_page(request):
         
         if name and email:
             # Store user info in session
-            request.session['user_name'] = name
-            request.session['user_email'] = email
-            request.session['user_id'] = str(uuid.uuid4())
+            set_meeting_user(request, str(uuid.uuid4()), name, email)
             
             messages.success(request, f'Welcome, {name}!')
             return redirect('/home/')
@@ -32,339 +61,712 @@ def landing_page(request):
 
 def home(request):
     # Check if user has session data
-    if not request.session.get('user_name'):
+    user = get_meeting_user(request)
+    if user is None:
         messages.warning(request, 'Please enter your details first')
         return redirect('/')
     
     context = {
-        'user_name': request.session['user_name'],
-        'user_email': request.session['user_email'],
+        'user_name': user.name,
+        'user_email': user.email,
     }
     return render(request, 'home.html', context)
 
 def create_room(request):
-    if not request.session.get('user_name'):
+    user = get_meeting_user(request)
+    if user is None:
         return redirect('/')
     
     if request.method == 'POST':
         room_name = request.POST.get('room_name', 'New Meeting')
-        user_id = request.session.get('user_id')
-        user_name = request.session.get('user_name')
-        
-        # Generate a simple room ID (6 characters)
-        room_id = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-        
-        # Store room information
-        rooms[room_id] = {
-            'name': room_name,
-            'created_by': user_name,
-            'created_by_id': user_id,
-            'created_at': 'now',
-            'is_active': True
-        }
-        
-        # Add creator as participant
-        participants[room_id] = [{
-            'user_id': user_id,
-            'name': user_name,
-            'is_admin': True,
-            'video_enabled': True,
-            'audio_enabled': True
-        }]
-        
-        # Initialize chat for this room
-        chat_messages[room_id] = []
+        user_id = user.user_id
+        user_name = user.name
         
-        # Initialize user streams for this room
-        user_streams[room_id] = {}
+        # Store room information under a fresh 6-character ID, with the
+        # creator as admin participant
+        backend = get_backend()
+        room_id, room_info = allocate_room(backend, room_name, user_id, user_name)
+        room_changed.send(sender=None, room_id=room_id, changes=room_info)
+        for participant in backend.list_participants(room_id):
+            participant_changed.send(sender=None, room_id=room_id, participant=participant)
+        heartbeat(room_id, user_id)
         
         messages.success(request, f'Room created successfully! Room ID: {room_id}')
         return redirect(f'/room/{room_id}/')
     
     return render(request, 'create_room.html')
 
-def join_room(request):
-    if not request.session.get('user_name'):
+async def join_room(request):
+    user = get_meeting_user(request)
+    if user is None:
         return redirect('/')
     
     if request.method == 'POST':
         room_id = request.POST.get('room_id', '').strip().upper()
-        user_id = request.session.get('user_id')
-        user_name = request.session.get('user_name')
         
         if not room_id:
             messages.error(request, 'Please enter a room ID')
             return render(request, 'join_room.html')
         
-        if room_id in rooms and rooms[room_id]['is_active']:
-            # Add user to participants
-            if room_id not in participants:
-                participants[room_id] = []
-            
-            # Check if user already in room
-            user_exists = any(p['user_id'] == user_id for p in participants[room_id])
-            
-            if not user_exists:
-                participants[room_id].append({
-                    'user_id': user_id,
-                    'name': user_name,
-                    'is_admin': False,
-                    'video_enabled': True,
-                    'audio_enabled': True
-                })
-            
-            # Initialize chat if not exists
-            if room_id not in chat_messages:
-                chat_messages[room_id] = []
-            
-            # Initialize user streams if not exists
-            if room_id not in user_streams:
-                user_streams[room_id] = {}
-            
-            messages.success(request, f'Joined room successfully!')
+        admitted = await _in_room(room_id, _join, room_id, user.user_id, user.name)
+        if admitted is None:
+            messages.error(request, 'Room not found or inactive')
+        elif admitted is True:
+            heartbeat(room_id, user.user_id)
+            messages.success(request, 'Joined room successfully!')
             return redirect(f'/room/{room_id}/')
+        elif admitted is False:
+            messages.error(request, 'The meeting is full')
         else:
-            messages.error(request, 'Room not found or inactive')
+            # Queued; the page polls queue_status until a seat is free
+            return render(request, 'join_room.html', {'waiting_room_id': room_id, 'position': admitted})
     
     return render(request, 'join_room.html')
 
+def _join(room_id, user_id, user_name):
+    # True once seated, else the place in the room's waiting queue, False
+    # when that is full too, None for no such (active) room
+    backend = get_backend()
+    room_info = backend.get_room(room_id)
+    if not room_info or not room_info['is_active']:
+        return None
+
+    # The host always gets back in; anyone else queues behind those
+    # already waiting
+    capacity = None if user_id == room_info['created_by_id'] else room_capacity()
+    participant = None
+    if capacity is None or not waiting_room.waiting(room_id) or backend.is_participant(room_id, user_id):
+        # Add user to participants unless already in room
+        participant, created = backend.join(room_id, user_id, user_name, capacity)
+    if participant is None:
+        return waiting_room.enqueue(room_id, user_id, user_name) or False
+    if created:
+        participant_changed.send(sender=None, room_id=room_id, participant=participant)
+        broadcast(room_id, 'participant.joined', participant=participant)
+    return True
+
+def _admit_waiting(room_id):
+    # Seats freed by a departure go to the longest waiting; returns how
+    # many were seated
+    backend = get_backend()
+    capacity = room_capacity()
+    admitted = 0
+    while True:
+        entry = waiting_room.pop(room_id)
+        if entry is None:
+            return admitted
+        user_id, user_name = entry
+        participant, created = backend.join(room_id, user_id, user_name, capacity)
+        if participant is None:
+            waiting_room.push_front(room_id, user_id, user_name)
+            return admitted
+        if created:
+            participant_changed.send(sender=None, room_id=room_id, participant=participant)
+            broadcast(room_id, 'participant.joined', participant=participant)
+        # Their page is still polling the queue; give them a presence
+        # timeout to come in
+        heartbeat(room_id, user_id)
+        admitted += 1
+
+async def queue_status(request, room_id):
+    """The user's place in the room's waiting queue.
+
+    ``admitted`` once they have been given a seat; ``position`` is null
+    when they are neither seated nor queued (e.g. they stopped polling).
+    Polling keeps the place.
+    """
+    user = get_meeting_user(request)
+    if user is None:
+        return JsonResponse({'success': False}, status=403)
+    backend = get_backend()
+    if await _backend_call(backend, backend.is_participant)(room_id, user.user_id):
+        return JsonResponse({'success': True, 'admitted': True, 'position': None})
+    position = waiting_room.position(room_id, user.user_id)
+    return JsonResponse({'success': True, 'admitted': False, 'position': position})
+
 def room(request, room_id):
-    if not request.session.get('user_name'):
+    user = get_meeting_user(request)
+    if user is None:
         return redirect('/')
     
-    if room_id not in rooms:
+    backend = get_backend()
+    room_info = backend.get_room(room_id)
+    if room_info is None:
         messages.error(request, 'Room not found')
         return redirect('/home/')
     
-    user_id = request.session.get('user_id')
+    user_id = user.user_id
     
     # Check if user is in participants
-    user_in_room = any(
-        p['user_id'] == user_id 
-        for p in participants.get(room_id, [])
-    )
-    
-    if not user_in_room:
+    if not backend.is_participant(room_id, user_id):
         messages.error(request, 'You are not a participant of this room')
         return redirect('/join-room/')
     
+    heartbeat(room_id, user_id)
+
     # Check if user is admin (room creator)
-    is_admin = rooms[room_id]['created_by_id'] == user_id
-    
-    # Get all participants for this room
-    room_participants = participants.get(room_id, [])
-    
-    # Get chat messages for this room
-    room_chat_messages = chat_messages.get(room_id, [])
+    is_admin = room_info['created_by_id'] == user_id
     
     context = {
         'room_id': room_id,
-        'room_name': rooms[room_id]['name'],
-        'room_creator_id': rooms[room_id]['created_by_id'],
-        'user_name': request.session.get('user_name'),
+        'room_name': room_info['name'],
+        'room_creator_id': room_info['created_by_id'],
+        'user_name': user.name,
         'user_id': user_id,
         'is_admin': is_admin,
-        'participants': room_participants,
-        'chat_messages': room_chat_messages[-50:],  # Last 50 messages
+        # Fragment cache keys; read before the state they stand for, so a
+        # concurrent change can only leave newer HTML under an older key
+        'room_version': backend.room_version(room_id),
+        'chat_seq': backend.last_seq(room_id),
+        'fragment_ttl': getattr(settings, 'ROOM_FRAGMENT_TTL', 600),
+        'participants': backend.list_participants(room_id) or [],
+        # Last 50 messages, only fetched when the chat fragment is not cached
+        'chat_messages': lambda: backend.latest_messages(room_id, 50),
     }
     
     return render(request, 'room.html', context)
 
-def leave_room(request, room_id):
-    user_id = request.session.get('user_id')
-    if user_id and room_id in participants:
-        # Remove user from participants
-        participants[room_id] = [
-            p for p in participants[room_id] 
-            if p['user_id'] != user_id
-        ]
-        
-        # Remove user from streams
-        if room_id in user_streams and user_id in user_streams[room_id]:
-            del user_streams[room_id][user_id]
-        
-        # Add leave message to chat
-        if room_id in chat_messages:
-            leaving_user = next((p for p in participants.get(room_id, []) if p['user_id'] == user_id), None)
-            if leaving_user:
-                system_message = {
-                    'id': str(uuid.uuid4()),
-                    'user_id': 'system',
-                    'user_name': 'System',
-                    'message': f'{leaving_user["name"]} has left the meeting',
-                    'timestamp': datetime.now().strftime('%H:%M:%S'),
-                    'is_system': True
-                }
-                chat_messages[room_id].append(system_message)
-        
-        # If no participants left, deactivate room
-        if not participants[room_id]:
-            rooms[room_id]['is_active'] = False
+async def leave_room(request, room_id):
+    user = get_meeting_user(request)
+    if user is not None:
+        await _in_room(room_id, _depart, room_id, user.user_id)
     
     messages.success(request, 'You have left the meeting')
     return redirect('/home/')
 
-def get_participants(request, room_id):
-    if room_id in participants:
-        return JsonResponse({
-            'participants': participants[room_id],
-            'success': True
-        })
+def _depart(room_id, user_id):
+    backend = get_backend()
+    # Remove user from participants and streams
+    leaving_user, remaining = backend.leave(room_id, user_id)
+
+    # Add leave message to chat
+    if leaving_user:
+        participant_removed.send(sender=None, room_id=room_id, user_id=user_id)
+        _add_system_message(room_id, f'{leaving_user["name"]} has left the meeting')
+        broadcast(room_id, 'participant.left', user_id=user_id)
+
+        # If no participants left, deactivate room
+        if not _admit_waiting(room_id) and not remaining:
+            backend.deactivate_room(room_id)
+            room_changed.send(sender=None, room_id=room_id, changes={'is_active': False})
+    return leaving_user
+
+
+def on_participants_expired(sender, room_id, user_ids, **kwargs):
+    # Participants whose browser stopped sending heartbeats leave like
+    # everyone else, so the others stop calling them. This runs on the
+    # presence thread, outside the room's asyncio lock; each backend call
+    # is still atomic.
+    for user_id in user_ids:
+        _depart(room_id, user_id)
+
+
+async def _in_room(room_id, function, *args):
+    """Run ``function(*args)``, a change to room_id, under the room's lock.
+
+    Changes to one room run one at a time in arrival order; other rooms
+    are not held up. In-process state is changed on the event loop,
+    anything else in a thread of its own.
+    """
+    backend = get_backend()
+    async with room_locks(room_id):
+        if backend.in_process:
+            return function(*args)
+        # The lock orders the room's changes, so rooms need not queue for
+        # sync_to_async's one shared thread
+        return await sync_to_async(function, thread_sensitive=False)(*args)
+
+
+async def get_participants(request, room_id):
+    """The room's participants and its version.
+
+    With ``?version=<v>`` (the version of the client's last response) the
+    answer is a delta instead: ``added`` and ``changed`` participants and
+    ``removed`` user_ids. Clients too far behind get the full list again.
+    """
+    user = get_meeting_user(request)
+    if user is not None:
+        heartbeat(room_id, user.user_id)
+    version = request.GET.get('version')
+    backend = get_backend()
+    body = await _backend_call(backend, snapshots.participants)(
+        backend, room_id, _parse_number(version) if version else None,
+    )
+    if body is not None:
+        return HttpResponse(body, content_type='application/json')
     return JsonResponse({'participants': [], 'success': False})
 
+async def audio_levels(request, room_id):
+    """Take the caller's audio levels; answers what they receive of everyone else.
+
+    POST ``levels``, comma-separated RFC 6464 levels (0 loudest, 127
+    silence), and optionally ``pin``, a user_id to always receive at full
+    quality ('' to unpin). The answer has ``subscriptions``, each other
+    participant's ``video`` tier and ``audio``. Socket clients send a
+    ``{"levels": [...], "pin": ...}`` message instead and get the room's
+    speaker order, from which budgets follow, as ``speakers.updated`` events.
+    """
+    user = get_meeting_user(request)
+    if request.method != 'POST' or user is None:
+        return JsonResponse({'success': False})
+    levels = parse_levels(request.POST.get('levels', '').split(','))
+    if levels is None:
+        return JsonResponse({'success': False, 'error': 'Invalid levels'}, status=400)
+
+    heartbeat(room_id, user.user_id)
+    backend = get_backend()
+    subscriptions = await _backend_call(backend, report_levels)(room_id, user.user_id, levels, request.POST.get('pin'))
+    if subscriptions is None:
+        return JsonResponse({'success': False})
+    return JsonResponse({'success': True, 'subscriptions': subscriptions})
+
 # Chat functionality
-def send_message(request, room_id):
-    if request.method == 'POST':
-        user_id = request.session.get('user_id')
-        user_name = request.session.get('user_name')
+def _append_message(room_id, user_id, user_name, text, is_system=False):
+    # Every message gets the next per-room sequence number, which clients
+    # use as a cursor for incremental fetches
+    message = get_backend().add_message(room_id, user_id, user_name, text, is_system)
+    if message is not None:
+        message_added.send(sender=None, room_id=room_id, message=message)
+        _notify_message_waiters(room_id)
+        broadcast(room_id, 'chat.message', message=message)
+    return message
+
+
+def _add_system_message(room_id, text):
+    return _append_message(room_id, 'system', 'System', text, is_system=True)
+
+
+def on_room_deleted(sender, room_id, **kwargs):
+    # Let long-polls on a reaped room return instead of holding on to it
+    _notify_message_waiters(room_id)
+
+
+def _notify_message_waiters(room_id):
+    # Writers may run in a worker thread, so wake each waiter on its own loop
+    for loop, event in message_waiters.pop(room_id, ()):
+        loop.call_soon_threadsafe(event.set)
+
+
+async def _wait_for_message(backend, room_id, since, timeout):
+    has_chat = _backend_call(backend, backend.has_chat)
+    last_seq = _backend_call(backend, backend.last_seq)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        event = asyncio.Event()
+        waiter = (loop, event)
+        message_waiters.setdefault(room_id, set()).add(waiter)
+        try:
+            # Re-check after registering so a message sent in between is not
+            # missed; a deleted room will get no more
+            if not await has_chat(room_id) or await last_seq(room_id) > since:
+                return
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            # Writers on other workers cannot wake us, so shared backends
+            # re-check the sequence number every so often
+            if backend.notify_poll_interval:
+                remaining = min(remaining, backend.notify_poll_interval)
+            await asyncio.wait_for(event.wait(), remaining)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            waiters = message_waiters.get(room_id)
+            if waiters:
+                waiters.discard(waiter)
+
+
+def _backend_call(backend, method):
+    # In-process state is safe to use on the event loop; anything doing
+    # network I/O is pushed to a thread
+    if backend.in_process:
+        async def call(*args):
+            return method(*args)
+        return call
+    return sync_to_async(method)
+
+
+def _throttled(checks):
+    # A 429 telling the client when to retry, or None if it may go ahead
+    wait = acquire(checks)
+    if not wait:
+        return None
+    response = JsonResponse({'success': False, 'error': 'Too many requests'}, status=429)
+    response['Retry-After'] = retry_after(wait)
+    return response
+
+
+def _moderation_throttled(request, room_id):
+    user = get_meeting_user(request)
+    client = user.user_id if user is not None else request.META.get('REMOTE_ADDR')
+    return _throttled([(moderation_user_limiter, client), (moderation_room_limiter, room_id)])
+
+
+def _parse_number(value, default=0):
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return default
+
+
+async def send_message(request, room_id):
+    user = get_meeting_user(request)
+    if request.method == 'POST' and user is not None:
         message_text = request.POST.get('message', '').strip()
         
-        if message_text and room_id in chat_messages:
-            # Create message object
-            message = {
-                'id': str(uuid.uuid4()),
-                'user_id': user_id,
-                'user_name': user_name,
-                'message': message_text,
-                'timestamp': datetime.now().strftime('%H:%M:%S'),
-                'is_system': False
-            }
-            
-            # Add message to chat
-            chat_messages[room_id].append(message)
-            
-            # Keep only last 100 messages to prevent memory issues
-            if len(chat_messages[room_id]) > 100:
-                chat_messages[room_id] = chat_messages[room_id][-100:]
+        if message_text:
+            throttled = _throttled([(chat_user_limiter, user.user_id), (chat_room_limiter, room_id)])
+            if throttled is not None:
+                return throttled
+            # Add message to chat; the store evicts the oldest past its capacity
+            heartbeat(room_id, user.user_id)
+            message = await _in_room(room_id, _append_message, room_id, user.user_id, user.name, message_text)
             
-            return JsonResponse({'success': True, 'message': message})
+            if message is not None:
+                return JsonResponse({'success': True, 'message': message})
     
     return JsonResponse({'success': False})
 
-def get_messages(request, room_id):
-    if room_id in chat_messages:
-        return JsonResponse({'messages': chat_messages[room_id], 'success': True})
-    return JsonResponse({'messages': [], 'success': False})
+async def get_messages(request, room_id):
+    """Return the room's chat messages newer than ``?since=<seq>``.
+
+    ``?wait=<seconds>`` turns the request into a long-poll that is held open
+    until a new message arrives or the timeout passes. Responses carry the
+    last sequence number as an ETag, so an unchanged room answers 304.
+    """
+    backend = get_backend()
+    if not await _backend_call(backend, backend.has_chat)(room_id):
+        return JsonResponse({'messages': [], 'success': False})
+
+    # Polling clients heartbeat through the poll itself
+    user = get_meeting_user(request)
+    if user is not None:
+        heartbeat(room_id, user.user_id)
+
+    since = _parse_number(request.GET.get('since'))
+    wait = min(_parse_number(request.GET.get('wait')), LONG_POLL_MAX_WAIT)
+
+    if wait:
+        await _wait_for_message(backend, room_id, since, wait)
+        if not await _backend_call(backend, backend.has_chat)(room_id):
+            return JsonResponse({'messages': [], 'success': False})
+
+    last_seq = await _backend_call(backend, backend.last_seq)(room_id)
+    etag = f'"{last_seq}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        # Pollers of a room mostly ask for the same ``since``, so the body
+        # is encoded once per new message
+        body = snapshots.messages(room_id, since, last_seq)
+        if body is None:
+            room_messages, last_seq = await _backend_call(backend, backend.messages_since)(room_id, since)
+            body = snapshots.store_messages(room_id, since, last_seq, room_messages)
+            etag = f'"{last_seq}"'
+        response = HttpResponse(body, content_type='application/json')
+
+    response['ETag'] = etag
+    patch_cache_control(response, no_cache=True)
+    return response
+
+def _archive_epoch(request, room_id):
+    """The meeting whose archive the request may read, or None if it may read none.
+
+    Participants read the meeting they are in, not earlier ones held
+    under the same room ID. Staff may pick one with ``?epoch=``, and
+    otherwise get the current or else the last one.
+    """
+    if request.user.is_active and request.user.is_staff:
+        if request.GET.get('epoch'):
+            return _parse_number(request.GET['epoch'])
+        epoch = archive.room_epoch(room_id)
+        return epoch if epoch is not None else archive.latest_epoch(room_id)
+    user = get_meeting_user(request)
+    if user is None or not get_backend().is_participant(room_id, user.user_id):
+        return None
+    return archive.room_epoch(room_id)
+
+
+def chat_history(request, room_id):
+    """Archived chat messages older than ``?before=<seq>``, oldest first.
+
+    For scrolling back past what get_messages still holds. ``before`` in
+    the response is the cursor for the page before this one (null at the
+    beginning). Participants and staff only.
+    """
+    epoch = _archive_epoch(request, room_id)
+    if epoch is None:
+        return JsonResponse({'messages': [], 'success': False}, status=403)
+
+    before = request.GET.get('before')
+    limit = min(_parse_number(request.GET.get('limit'), 50) or 50, ARCHIVE_MAX_PAGE)
+    room_messages, cursor = archive.history(room_id, epoch, _parse_number(before) if before else None, limit)
+    return JsonResponse({'messages': room_messages, 'before': cursor, 'success': True})
+
+
+def search_chat(request, room_id):
+    """Archived chat messages matching every word of ``?q=``, newest first.
+
+    Pass the ``before`` of a response back to get the next page.
+    Participants and staff only.
+    """
+    epoch = _archive_epoch(request, room_id)
+    if epoch is None:
+        return JsonResponse({'messages': [], 'success': False}, status=403)
+
+    before = request.GET.get('before')
+    limit = min(_parse_number(request.GET.get('limit'), 20) or 20, ARCHIVE_MAX_PAGE)
+    room_messages, cursor = archive.search(
+        room_id, epoch, request.GET.get('q', ''), _parse_number(before) if before else None, limit,
+    )
+    return JsonResponse({'messages': room_messages, 'before': cursor, 'success': True})
 
 # Admin control functions
-def mute_participant(request, room_id, user_id):
-    if room_id in participants:
-        for participant in participants[room_id]:
-            if participant['user_id'] == user_id:
-                participant['audio_enabled'] = not participant['audio_enabled']
-                
-                # Add system message
-                if room_id in chat_messages:
-                    action = "muted" if not participant['audio_enabled'] else "unmuted"
-                    system_message = {
-                        'id': str(uuid.uuid4()),
-                        'user_id': 'system',
-                        'user_name': 'System',
-                        'message': f'{participant["name"]} has been {action}',
-                        'timestamp': datetime.now().strftime('%H:%M:%S'),
-                        'is_system': True
-                    }
-                    chat_messages[room_id].append(system_message)
-                break
+async def mute_participant(request, room_id, user_id):
+    throttled = _moderation_throttled(request, room_id)
+    if throttled is not None:
+        return throttled
+    await _in_room(room_id, _toggle_audio, room_id, user_id)
     return JsonResponse({'success': True})
 
-def mute_all(request, room_id):
-    if room_id in participants:
-        admin_user_id = rooms[room_id]['created_by_id']
-        muted_users = []
-        
-        for participant in participants[room_id]:
-            # Don't mute the admin
-            if participant['user_id'] != admin_user_id:
-                if participant['audio_enabled']:  # Only mute if not already muted
-                    participant['audio_enabled'] = False
-                    muted_users.append(participant['name'])
+def _toggle_audio(room_id, user_id):
+    participant = get_backend().toggle_audio(room_id, user_id)
+    if participant is not None:
+        participant_changed.send(sender=None, room_id=room_id, participant=participant)
         
         # Add system message
-        if room_id in chat_messages and muted_users:
-            system_message = {
-                'id': str(uuid.uuid4()),
-                'user_id': 'system',
-                'user_name': 'System',
-                'message': f'All participants have been muted',
-                'timestamp': datetime.now().strftime('%H:%M:%S'),
-                'is_system': True
-            }
-            chat_messages[room_id].append(system_message)
-            
+        action = "muted" if not participant['audio_enabled'] else "unmuted"
+        _add_system_message(room_id, f'{participant["name"]} has been {action}')
+        broadcast(room_id, 'participant.updated', participant=participant)
+
+async def mute_all(request, room_id):
+    throttled = _moderation_throttled(request, room_id)
+    if throttled is not None:
+        return throttled
+    muted_users = await _in_room(room_id, _mute_all, room_id)
     return JsonResponse({'success': True, 'muted_count': len(muted_users)})
 
-def remove_participant(request, room_id, user_id):
-    if room_id in participants:
-        # Find user to remove
-        user_to_remove = next((p for p in participants[room_id] if p['user_id'] == user_id), None)
-        
-        if user_to_remove:
-            # Remove user from participants
-            participants[room_id] = [
-                p for p in participants[room_id] 
-                if p['user_id'] != user_id
-            ]
-            
-            # Remove user from streams
-            if room_id in user_streams and user_id in user_streams[room_id]:
-                del user_streams[room_id][user_id]
-            
-            # Add system message
-            if room_id in chat_messages:
-                system_message = {
-                    'id': str(uuid.uuid4()),
-                    'user_id': 'system',
-                    'user_name': 'System',
-                    'message': f'{user_to_remove["name"]} has been removed from the meeting',
-                    'timestamp': datetime.now().strftime('%H:%M:%S'),
-                    'is_system': True
-                }
-                chat_messages[room_id].append(system_message)
+def _mute_all(room_id):
+    # Mute everyone except the admin
+    muted_users = get_backend().mute_all(room_id)
+    
+    for participant in muted_users:
+        participant_changed.send(sender=None, room_id=room_id, participant=participant)
     
+    # Add system message
+    if muted_users:
+        room_info = get_backend().get_room(room_id)
+        _add_system_message(room_id, 'All participants have been muted')
+        broadcast(room_id, 'participants.muted', exclude_user_id=room_info['created_by_id'] if room_info else None)
+    return muted_users
+
+async def remove_participant(request, room_id, user_id):
+    throttled = _moderation_throttled(request, room_id)
+    if throttled is not None:
+        return throttled
+    user_to_remove = await _in_room(room_id, _remove_participant, room_id, user_id)
     return JsonResponse({'success': True, 'removed_user': user_to_remove['name'] if user_to_remove else None})
 
-def remove_all(request, room_id):
-    # Remove all participants except the admin
-    if room_id in participants:
-        admin_user_id = rooms[room_id]['created_by_id']
-        removed_users = [p for p in participants[room_id] if p['user_id'] != admin_user_id]
-        
-        # Clear all streams except admin
-        if room_id in user_streams:
-            user_streams[room_id] = {admin_user_id: user_streams[room_id].get(admin_user_id)}
-        
-        # Remove all participants except admin
-        participants[room_id] = [p for p in participants[room_id] if p['user_id'] == admin_user_id]
+def _remove_participant(room_id, user_id):
+    # Remove user from participants and streams
+    user_to_remove, _ = get_backend().leave(room_id, user_id)
+    
+    if user_to_remove:
+        participant_removed.send(sender=None, room_id=room_id, user_id=user_id)
         
         # Add system message
-        if room_id in chat_messages and removed_users:
-            system_message = {
-                'id': str(uuid.uuid4()),
-                'user_id': 'system',
-                'user_name': 'System',
-                'message': 'All participants have been removed from the meeting',
-                'timestamp': datetime.now().strftime('%H:%M:%S'),
-                'is_system': True
-            }
-            chat_messages[room_id].append(system_message)
-    
+        _add_system_message(room_id, f'{user_to_remove["name"]} has been removed from the meeting')
+        broadcast(room_id, 'participant.removed', user_id=user_id)
+        _admit_waiting(room_id)
+    return user_to_remove
+
+async def remove_all(request, room_id):
+    throttled = _moderation_throttled(request, room_id)
+    if throttled is not None:
+        return throttled
+    removed_users = await _in_room(room_id, _remove_all, room_id)
     return JsonResponse({'success': True, 'removed_count': len(removed_users)})
 
+def _remove_all(room_id):
+    # Remove all participants except the admin
+    removed_users = get_backend().remove_all(room_id)
+    for participant in removed_users:
+        participant_removed.send(sender=None, room_id=room_id, user_id=participant['user_id'])
+    
+    # Add system message
+    if removed_users:
+        _add_system_message(room_id, 'All participants have been removed from the meeting')
+        broadcast(room_id, 'participants.removed', user_ids=[p['user_id'] for p in removed_users])
+        _admit_waiting(room_id)
+    return removed_users
+
+def _moderation_summary(actions, changed, removed):
+    def who(participants):
+        if len(participants) == 1:
+            return participants[0]['name'], 'has'
+        return f'{len(participants)} participants', 'have'
+
+    parts = []
+    if changed:
+        done = []
+        if 'mute' in actions:
+            done.append('been muted')
+        elif 'unmute' in actions:
+            done.append('been unmuted')
+        if 'disable_video' in actions:
+            done.append('had their video turned off')
+        subject, verb = who(changed)
+        parts.append(f'{subject} {verb} {" and ".join(done)}')
+    if removed:
+        subject, verb = who(removed)
+        parts.append(f'{subject} {verb} been removed from the meeting')
+    return '; '.join(parts)
+
+
+async def moderate(request, room_id):
+    """Apply moderation actions to a batch of participants at once.
+
+    Takes a JSON body ``{"user_ids": [...], "actions": [...]}`` with actions
+    from MODERATION_ACTIONS. The whole batch is applied in one pass and
+    announced with one system message and one ``participants.moderated``
+    event, however many participants it touched. Only the host may call it.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'POST required'}, status=405)
+
+    user = get_meeting_user(request)
+    backend = get_backend()
+    room_info = await _backend_call(backend, backend.get_room)(room_id)
+    if user is None or room_info is None or room_info['created_by_id'] != user.user_id:
+        return JsonResponse({'success': False, 'error': 'Only the host can moderate this room'}, status=403)
+    throttled = _moderation_throttled(request, room_id)
+    if throttled is not None:
+        return throttled
+
+    try:
+        body = json.loads(request.body)
+        user_ids, actions = body['user_ids'], body['actions']
+    except (ValueError, KeyError, TypeError):
+        user_ids = actions = None
+    if not isinstance(user_ids, list) or not all(isinstance(user_id, str) for user_id in user_ids):
+        return JsonResponse({'success': False, 'error': 'user_ids must be a list of user IDs'}, status=400)
+    if not isinstance(actions, list) or not actions or not all(action in MODERATION_ACTIONS for action in actions):
+        return JsonResponse({'success': False, 'error': f'actions must be among {", ".join(MODERATION_ACTIONS)}'}, status=400)
+    user_ids, actions = list(dict.fromkeys(user_ids)), set(actions)
+
+    changed, removed_ids = await _in_room(room_id, _moderate, room_id, user_ids, actions)
+    return JsonResponse({
+        'success': True,
+        'participants': changed,
+        'removed_user_ids': removed_ids,
+    })
+
+def _moderate(room_id, user_ids, actions):
+    changed, removed = get_backend().moderate(room_id, user_ids, actions)
+    for participant in changed:
+        participant_changed.send(sender=None, room_id=room_id, participant=participant)
+    for participant in removed:
+        participant_removed.send(sender=None, room_id=room_id, user_id=participant['user_id'])
+
+    removed_ids = [p['user_id'] for p in removed]
+    if changed or removed:
+        _add_system_message(room_id, _moderation_summary(actions, changed, removed))
+        broadcast(room_id, 'participants.moderated', participants=changed, removed_user_ids=removed_ids)
+    if removed:
+        _admit_waiting(room_id)
+    return changed, removed_ids
+
 # Stream management
-def update_user_stream(request, room_id):
-    if request.method == 'POST':
-        user_id = request.session.get('user_id')
+async def update_user_stream(request, room_id):
+    user = get_meeting_user(request)
+    if request.method == 'POST' and user is not None:
         video_enabled = request.POST.get('video_enabled', 'true') == 'true'
         audio_enabled = request.POST.get('audio_enabled', 'true') == 'true'
         
-        if room_id in participants:
-            for participant in participants[room_id]:
-                if participant['user_id'] == user_id:
-                    participant['video_enabled'] = video_enabled
-                    participant['audio_enabled'] = audio_enabled
-                    break
+        heartbeat(room_id, user.user_id)
+        await _in_room(room_id, _set_stream, room_id, user.user_id, video_enabled, audio_enabled)
         
         return JsonResponse({'success': True})
     
-    return JsonResponse({'success': False})
\ No newline at end of file
+    return JsonResponse({'success': False})
+
+def _set_stream(room_id, user_id, video_enabled, audio_enabled):
+    participant = get_backend().set_stream(room_id, user_id, video_enabled, audio_enabled)
+    if participant is not None:
+        participant_changed.send(sender=None, room_id=room_id, participant=participant)
+        broadcast(room_id, 'participant.updated', participant=participant)
+
+# Monitoring
+@staff_member_required
+def gauges(request):
+    gauges = room_gauges()
+    gauges['fanout'] = fanout.stats()
+    gauges['admission'] = {**load_shedder.stats(), 'waiting': len(waiting_room)}
+    if checkpoint_enabled():
+        gauges['checkpoint'] = checkpointer.stats
+    if sharding_enabled():
+        gauges['shard'] = shard_name()
+    return JsonResponse(gauges)
+
+@staff_member_required
+def room_directory(request):
+    """List the active rooms, a page at a time.
+
+    ``order`` is 'activity' (default) or 'participants'; ``q`` lists the
+    rooms whose name or ID starts with it instead, in name order. Pass
+    the ``next`` of a response as ``cursor`` for the following page.
+    """
+    limit = min(_parse_number(request.GET.get('limit'), 50) or 50, ROOM_DIRECTORY_MAX_LIMIT)
+    cursor = request.GET.get('cursor')
+    query = request.GET.get('q', '').strip()
+    try:
+        if query:
+            rooms, cursor = directory.search(query, limit, cursor)
+        else:
+            rooms, cursor = directory.page(request.GET.get('order', 'activity'), limit, cursor)
+    except ValueError as error:
+        return JsonResponse({'success': False, 'error': str(error)}, status=400)
+    return JsonResponse({'success': True, 'rooms': rooms, 'next': cursor, 'active_rooms': len(directory)})
+
+@staff_member_required
+def profile(request):
+    """Download the sampled requests' stacks, or change what is sampled.
+
+    GET returns collapsed stacks (feed them to flamegraph.pl or speedscope).
+    POST takes ``sample_rate`` (profile 1 in N requests, 0 for none), any
+    number of ``route`` and ``room`` values to always profile, and ``clear``
+    to drop the samples collected so far.
+    """
+    if request.method == 'POST':
+        profiler.configure(
+            sample_rate=_parse_number(request.POST.get('sample_rate')),
+            routes=request.POST.getlist('route'),
+            rooms=request.POST.getlist('room'),
+        )
+        if request.POST.get('clear'):
+            profiler.sampler.clear()
+        config = profiler.config
+        return JsonResponse({
+            'success': True,
+            'sample_rate': config['sample_rate'],
+            'routes': sorted(config['routes']),
+            'rooms': sorted(config['rooms']),
+            'samples': profiler.sampler.samples,
+        })
+
+    response = HttpResponse(profiler.sampler.collapsed(), content_type='text/plain; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename="profile.folded"'
+    return response
+
+def metrics(request):
+    # Prometheus scrape endpoint
+    if not metrics_enabled():
+        raise Http404
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# PeerJS signaling
+def peerjs_id(request, key):
+    # PeerJS asks for an ID when constructed without one; room pages always
+    # pass the user's ID, but answer like the reference server anyway
+    return HttpResponse(str(uuid.uuid4()), content_type='text/html')